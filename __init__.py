@@ -34,14 +34,21 @@ TODO
     :maxdepth: 1
 
     api
+    asgi_api
     context
     debug
     errors
+    filters
+    fragment_cache
     handler
+    json_codec
+    operations
     pagination
+    query_spec
     request
     resource
     response
+    sqlalchemy_async_dal
     sqlalchemy_dal
     utilities
 """
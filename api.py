@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017 Petuum, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+jsonapi_framework.api
+=====================
+The parts of the API adapters (:mod:`jsonapi_framework.flask_api`,
+:mod:`jsonapi_framework.asgi_api`) which do not depend on the web framework:
+routing a request to its handler method and turning exceptions into error
+responses.
+
+The routes are compiled once, when the adapter is constructed, into a table
+mapping (url component, request type, relationship, HTTP method) to the
+bound handler method; a request is dispatched with a single dict lookup.
+"""
+import functools
+import logging
+
+import sqlalchemy.exc
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header, parse_options_header
+
+import jsonapi_framework.errors as errors
+import jsonapi_framework.sqlalchemy_dal as dal
+from jsonapi_framework.debug import DEBUG
+from jsonapi_framework.operations import OperationsHandler
+from jsonapi_framework.request import RequestType
+
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.DEBUG if DEBUG else logging.INFO)
+
+JSONAPI_MIMETYPE = "application/vnd.api+json"
+
+# The HTTP methods each kind of request may use
+ALLOWED_METHODS = {
+    RequestType.RESOURCE: ("GET", "DELETE", "PATCH"),
+    RequestType.COLLECTION: ("GET", "POST"),
+    RequestType.RELATED: ("GET",),
+    RequestType.RELATIONSHIP: ("GET", "POST", "DELETE", "PATCH"),
+    RequestType.OPERATIONS: ("POST",)
+}
+
+# The request types with a relationship in their URL
+RELATIONSHIP_REQUEST_TYPES = (RequestType.RELATED, RequestType.RELATIONSHIP)
+
+
+def is_json_mimetype(mimetype):
+    """
+    Tells whether *mimetype* (without parameters) is JSON, like
+    application/json or application/vnd.api+json.
+    """
+    mimetype = mimetype.strip().lower()
+    return mimetype == "application/json" or (
+        mimetype.startswith("application/") and mimetype.endswith("+json"))
+
+
+@functools.lru_cache(maxsize=256)
+def accepted_mimetype(accept_header):
+    """
+    Negotiates the type of the response to a request with the raw Accept
+    header *accept_header*.  The result is cached by the header string, as
+    clients send the same few headers over and over.
+
+    NOTE: Right now we don't respect the accept header order i.e. if it
+    indicates that both a JSON API and text/plain response are acceptable in
+    the Accept header, we send the JSON API response.  If we end up
+    supporting more MIME types we probably want to do something more
+    intelligent here.  But since text/plain support is just a hack right
+    now...
+
+    The JSON API media type may carry the "ext" and "profile" parameters
+    (https://jsonapi.org/format/#media-type-parameter-rules), any other
+    parameter makes it unacceptable.
+
+    :param str accept_header: The Accept header, "" if there is none
+
+    :returns str: JSONAPI_MIMETYPE, "text/plain", or None if neither is
+                  acceptable
+    """
+    accept_mimetypes = parse_accept_header(accept_header, MIMEAccept)
+    if JSONAPI_MIMETYPE in accept_mimetypes or not accept_mimetypes:
+        return JSONAPI_MIMETYPE
+    for value, quality in accept_mimetypes:
+        # Only the "ext" and "profile" parameters of the JSON API media
+        # type are allowed, e.g. the atomic extension of the operations
+        mimetype, params = parse_options_header(value)
+        if quality and mimetype.lower() == JSONAPI_MIMETYPE and \
+                set(params) <= {"ext", "profile"}:
+            return JSONAPI_MIMETYPE
+    if "text/plain" in accept_mimetypes:
+        return "text/plain"
+    return None
+
+
+class BaseAPI(object):
+    """
+    Base class of the API adapters.
+    """
+
+    # The isolation level GET requests run in, see sqlalchemy_dal.checkout.
+    # The default runs them without a transaction, so they send no BEGIN,
+    # COMMIT or ROLLBACK.  None runs them in a transaction like the other
+    # requests.  The GET requests of handlers whose read_in_transaction
+    # returns True always run in a transaction, see read_only_routes.
+    read_isolation_level = "AUTOCOMMIT"
+
+    def __init__(self, handler_map, session_callable, api_prefix="",
+                 proxy_prefix="", hostname="", operations_path="/operations",
+                 operations_handler=OperationsHandler):
+        """
+        :param dict handler_map: Map of resource types to request type maps.
+            The routes are compiled from it here, so later changes to it are
+            not seen.
+        :param callable session_callable: Object called when we want a session
+        :param str api_prefix:
+            The prefix before the JSON API paths.
+        :param str proxy_prefix:
+            An extra prefix that goes before the api_prefix, in case you are
+            behind a reverse proxy that strips URL segments
+        :param str hostname:
+            Hostname for the api.  Leave blank for relative links (default)
+        :param str operations_path:
+            The path after the api_prefix of the endpoint for atomic
+            operations (see operations.OperationsHandler), or None for no
+            such endpoint
+        :param OperationsHandler class operations_handler:
+            The handler of the atomic operations, it is subclassed to set
+            its handler_map
+        """
+        self.handler_map = handler_map
+        self.operations_handler = type(
+            operations_handler.__name__, (operations_handler,),
+            {"handler_map": handler_map})
+        self.session_callable = session_callable
+        self.api_prefix = api_prefix
+        self.proxy_prefix = proxy_prefix
+        self.hostname = hostname
+        self.operations_path = operations_path
+        self.compile_routes()
+
+    @property
+    def link_prefix(self):
+        """
+        What to prepend to JSON API paths when making links
+        """
+        return self.hostname + self.proxy_prefix + self.api_prefix
+
+    def handlers(self):
+        """
+        Yields the handlers of *handler_map* and the operations handler.
+
+        :returns: (url component, request type, relationship, handler)
+                  tuples, the url component of the operations handler is
+                  None
+        """
+        for url_component, resource_map in self.handler_map.items():
+            for request_type, handler in resource_map.items():
+                if request_type in RELATIONSHIP_REQUEST_TYPES:
+                    for relationship, relationship_handler in \
+                            handler.items():
+                        yield (url_component, request_type, relationship,
+                               relationship_handler)
+                else:
+                    yield url_component, request_type, None, handler
+        if self.operations_path is not None:
+            yield None, RequestType.OPERATIONS, None, self.operations_handler
+
+    def compile_routes(self):
+        """
+        Compiles the routing table:
+
+        * *routes* maps (url component, request type, relationship, HTTP
+          method) to the bound handler method answering a JSON API request
+        * *plain_text_routes* maps (url component, request type,
+          relationship) to the *get_plain_text* method of the handler,
+          answering the requests that accept text/plain (with any method)
+        * *targets* holds all the (url component, request type,
+          relationship) with a handler
+        * *read_only_routes* holds the handler methods of GET requests
+          which may run in the read_isolation_level: those of handlers
+          without a read_in_transaction class method returning True (e.g.
+          handlers streaming from server-side cursors, which PostgreSQL
+          only keeps open in a transaction)
+        """
+        self.routes = {}
+        self.plain_text_routes = {}
+        self.targets = set()
+        self.read_only_routes = set()
+        for url_component, request_type, relationship, handler in \
+                self.handlers():
+            target = (url_component, request_type, relationship)
+            self.targets.add(target)
+            for method in ALLOWED_METHODS[request_type]:
+                handler_method = getattr(handler, method.lower(), None)
+                if handler_method is not None:
+                    self.routes[target + (method,)] = handler_method
+                    read_in_transaction = getattr(
+                        handler, "read_in_transaction", None)
+                    if method == "GET" and not (
+                            read_in_transaction and read_in_transaction()):
+                        self.read_only_routes.add(handler_method)
+            get_plain_text = getattr(handler, "get_plain_text", None)
+            if get_plain_text is not None:
+                self.plain_text_routes[target] = get_plain_text
+
+    def route(self, path):
+        """
+        Matches *path*, below the api_prefix, against the JSON API URLs.
+
+        :returns tuple: The url component, request type, id and relationship
+        :raises NotFound: If no URL matches
+        """
+        if self.operations_path is not None and path == self.operations_path:
+            return None, RequestType.OPERATIONS, None, None
+        segments = path.split("/")
+        if segments[0] or not all(segments[1:]):
+            raise errors.NotFound()
+        segments = segments[1:]
+        if len(segments) == 1:
+            return segments[0], RequestType.COLLECTION, None, None
+        if len(segments) == 2:
+            return segments[0], RequestType.RESOURCE, segments[1], None
+        if len(segments) == 3:
+            return (segments[0], RequestType.RELATED, segments[1],
+                    segments[2])
+        if len(segments) == 4 and segments[2] == "relationships":
+            return (segments[0], RequestType.RELATIONSHIP, segments[1],
+                    segments[3])
+        raise errors.NotFound()
+
+    def dispatch(self, japi_resource_url_component, request_type,
+                 relationship, method, accept_header):
+        """
+        Looks up the handler method answering a request in the routing
+        table.
+
+        :param str japi_resource_url_component: None for the operations
+        :param RequestType request_type:
+        :param str relationship: None but for RELATED and RELATIONSHIP
+                                 requests
+        :param str method: The HTTP method of the request
+        :param str accept_header: The raw Accept header, "" if there is none
+
+        :returns callable: Called with the Request to get the Response, it
+                           may be a coroutine function
+        :raises NotFound: If there is no such resource
+        :raises MethodNotAllowed: If the handler has no such method
+        :raises NotAcceptable: If the handler cannot answer in an acceptable
+                               type
+        """
+        target = (japi_resource_url_component, request_type, relationship)
+        if target not in self.targets:
+            raise errors.NotFound()
+        mimetype = accepted_mimetype(accept_header)
+        if mimetype == JSONAPI_MIMETYPE:
+            try:
+                return self.routes[target + (method,)]
+            except KeyError:
+                raise errors.MethodNotAllowed()
+        if mimetype == "text/plain" and target in self.plain_text_routes:
+            return self.plain_text_routes[target]
+        raise errors.NotAcceptable()
+
+    def is_read_only(self, respond):
+        """
+        :param callable respond: The handler method from dispatch
+
+        :returns bool: Whether the requests *respond* answers run in the
+                       read_isolation_level, so they need no rollback on
+                       errors
+        """
+        return self.read_isolation_level is not None and \
+            respond in self.read_only_routes
+
+    def session_factory(self, respond):
+        """
+        :param callable respond: The handler method from dispatch
+
+        :returns callable: Creates the session of a request (see
+                           Request.session), with a connection checked out
+                           in the isolation level for *respond*
+        """
+        isolation_level = self.read_isolation_level \
+            if self.is_read_only(respond) else None
+
+        def create_session():
+            return dal.checkout(self.session_callable(), isolation_level)
+
+        return create_session
+
+    def error_to_response(self, err):
+        """
+        Turns an exception raised while handling a request into an error
+        response.  The caller rolls the session back, unless the request is
+        read only (see is_read_only).
+
+        :param Exception err: The exception
+
+        :returns Response: The error response
+        """
+        if isinstance(err, (errors.Error, errors.ErrorList)):
+            return errors.error_to_response(err)
+        if isinstance(err, sqlalchemy.exc.IntegrityError):
+            LOG.error("handle_request caught a database exception error",
+                      exc_info=err)
+            return errors.error_to_response(
+                errors.BadRequest(detail="Database integrity exception. Check "
+                                         "that your request does not break "
+                                         "database invariants."))
+        if isinstance(err, (sqlalchemy.exc.ArgumentError,
+                            sqlalchemy.exc.ProgrammingError)):
+            LOG.error("handle_request caught a database exception error",
+                      exc_info=err)
+            return errors.error_to_response(
+                errors.BadRequest(
+                    detail="The table doesn't have the column(s)."))
+        if isinstance(err, sqlalchemy.exc.DataError):
+            LOG.error("handle_request caught a database exception error",
+                      exc_info=err)
+            return errors.error_to_response(
+                errors.BadRequest(
+                    detail="Wrong value."))
+        LOG.error("handle_request caught an exception", exc_info=err)
+        if DEBUG:
+            return errors.stacktrace_to_response(err)
+        return errors.error_to_response(errors.InternalServerError())
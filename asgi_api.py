@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017 Petuum, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+jsonapi_framework.asgi_api
+==========================
+This is an API adapter between ASGI servers (uvicorn, hypercorn, ...) and
+this JSON API framework.  It routes the requests like
+:class:`jsonapi_framework.flask_api.FlaskAPI`::
+
+    app = ASGIAPI(handler_map, sessionmaker(bind=engine), api_prefix="/api")
+
+All the requests are served concurrently on the event loop of the server.
+Handler methods which are coroutine functions (``async def get(cls,
+request)``) are awaited there.  The other handler methods block, so they
+run in a bounded thread pool, together with everything else touching their
+session, including the serialization of streamed bodies.
+"""
+import asyncio
+import collections.abc
+import concurrent.futures
+import inspect
+import itertools
+import logging
+import threading
+import urllib.parse
+
+from werkzeug.datastructures import Headers, MultiDict
+from werkzeug.http import parse_options_header
+
+import jsonapi_framework.errors as errors
+import jsonapi_framework.sqlalchemy_async_dal as async_dal
+import jsonapi_framework.sqlalchemy_dal as dal
+import jsonapi_framework.utilities as utilities
+from jsonapi_framework.api import (JSONAPI_MIMETYPE,
+                                   BaseAPI,
+                                   is_json_mimetype)
+from jsonapi_framework.debug import DEBUG
+from jsonapi_framework.operations import OperationsHandler
+from jsonapi_framework.request import Request
+
+
+LOG = logging.getLogger(__name__)
+LOG.setLevel(logging.DEBUG if DEBUG else logging.INFO)
+
+
+async def _maybe_await(value):
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
+class _Channel(object):
+    """
+    Hands the response of a synchronous handler method and the chunks of its
+    streamed body from its thread in the pool to the event loop, one item at
+    a time.  Exceptions raised in the thread are put as items as well.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=1)
+        self.closed = threading.Event()
+
+    def put(self, item):
+        """
+        Blocks the calling thread until the event loop took the previous
+        item.
+
+        :returns bool: False if the channel was closed, and *item* dropped
+        """
+        if self.closed.is_set():
+            return False
+        asyncio.run_coroutine_threadsafe(self.queue.put(item),
+                                         self.loop).result()
+        return True
+
+    async def get(self):
+        item = await self.queue.get()
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    async def chunks(self):
+        """
+        Yields the chunks put after the response, up to None.
+        """
+        while True:
+            chunk = await self.get()
+            if chunk is None:
+                return
+            yield chunk
+
+    def close(self):
+        """
+        Stops the thread from putting items, releasing it if it is blocked
+        in put.
+        """
+        self.closed.set()
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+
+class ASGIAPI(BaseAPI):
+    """
+    An ASGI application serving the handlers of *handler_map*.
+    """
+
+    def __init__(self, handler_map, session_callable, api_prefix="",
+                 proxy_prefix="", hostname="", operations_path="/operations",
+                 operations_handler=OperationsHandler, max_workers=None,
+                 async_session_callable=None):
+        """
+        :param dict handler_map: Map of resource types to request type maps:
+        :param callable session_callable:
+            Called for the session of a synchronous handler method.  It
+            must return a new session every time (e.g. a sessionmaker, not
+            a scoped_session), as the threads of the pool serve many
+            requests at once.  The session is closed after the response.
+        :param str api_prefix:
+            The prefix before the JSON API paths.
+        :param str proxy_prefix:
+            An extra prefix that goes before the api_prefix, in case you are
+            behind a reverse proxy that strips URL segments
+        :param str hostname:
+            Hostname for the api.  Leave blank for relative links (default)
+        :param str operations_path:
+            The path after the api_prefix of the endpoint for atomic
+            operations, or None for no such endpoint
+        :param OperationsHandler class operations_handler:
+            The handler of the atomic operations
+        :param int max_workers:
+            The number of threads running synchronous handler methods, see
+            concurrent.futures.ThreadPoolExecutor for the default.  A thread
+            serves its request until the (streamed) body is sent.
+        :param callable async_session_callable:
+            Called for the session of a coroutine handler method, e.g. an
+            async_sessionmaker.  Defaults to *session_callable*.
+        """
+        super().__init__(handler_map, session_callable, api_prefix,
+                         proxy_prefix, hostname, operations_path,
+                         operations_handler)
+        self.async_session_callable = async_session_callable or \
+            session_callable
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="jsonapi")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            raise ValueError(
+                "Unsupported ASGI scope type {}".format(scope["type"]))
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body.extend(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        await self.handle_request(scope, bytes(body), send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def handle_request(self, scope, body, send):
+        """
+        Handles the request of the HTTP *scope* with the *body*, with the
+        same error mapping as FlaskAPI.handle_request.
+        """
+        method = scope["method"]
+        headers = Headers([(name.decode("latin-1"), value.decode("latin-1"))
+                           for name, value in scope.get("headers", [])])
+        query_string = scope.get("query_string", b"").decode("utf-8",
+                                                             "replace")
+        LOG.info("Received %s request at %s", method, scope["path"])
+        try:
+            path = scope["path"]
+            if not path.startswith(self.api_prefix):
+                raise errors.NotFound()
+            url_component, request_type, id, relationship = self.route(
+                path[len(self.api_prefix):])
+            respond = self.dispatch(url_component, request_type,
+                                    relationship, method,
+                                    headers.get("Accept", ""))
+            r_json = None
+            mimetype = parse_options_header(headers.get("Content-Type"))[0]
+            if body and is_json_mimetype(mimetype):
+                try:
+                    r_json = utilities.load_json(body)
+                except Exception:
+                    raise errors.BadRequest(detail="JSON body parse error")
+        except Exception as err:
+            # No session was created yet
+            await self.send_response(send, self.error_to_response(err))
+            return
+
+        def make_request(session_callable):
+            return Request(
+                request_type,
+                MultiDict(urllib.parse.parse_qsl(query_string,
+                                                 keep_blank_values=True)),
+                method,
+                self.link_prefix,
+                None,
+                headers,
+                r_json,
+                id=id,
+                relationship=relationship,
+                query_string=query_string,
+                session_callable=session_callable)
+
+        if inspect.iscoroutinefunction(respond):
+            await self.handle_async(respond, make_request, send)
+        else:
+            await self.handle_sync(respond, make_request, send)
+
+    async def handle_async(self, respond, make_request, send):
+        """
+        Awaits the coroutine handler method *respond* on the event loop.
+        The session is created when the handler first uses it, and its
+        checkouts are recorded in dal.POOL_CHECKOUTS.
+        """
+        request = make_request(lambda: async_dal.record_checkouts(
+            self.async_session_callable()))
+        try:
+            try:
+                response = await respond(request)
+            except Exception as err:
+                if request.has_session:
+                    await _maybe_await(request.session.rollback())
+                response = self.error_to_response(err)
+            try:
+                await self.send_response(send, response)
+            except Exception:
+                # A streamed body failed, see stream_body
+                if request.has_session:
+                    await _maybe_await(request.session.rollback())
+                raise
+        finally:
+            if request.has_session:
+                await _maybe_await(request.session.close())
+
+    def run_sync(self, respond, make_request, channel):
+        """
+        Runs the synchronous handler method *respond* in a thread of the
+        pool, and puts the response into *channel*, followed by the chunks
+        of a streamed body.  The session is created when the handler first
+        uses it (see BaseAPI.session_factory), and is only ever used by
+        this thread: it is rolled back and closed here as well, because
+        connections must not move between threads (SQLite refuses that).
+        """
+        request = None
+        try:
+            request = make_request(self.session_factory(respond))
+            try:
+                response = respond(request)
+            except Exception as err:
+                if request.has_session and not self.is_read_only(respond):
+                    dal.rollback(request.session)
+                response = self.error_to_response(err)
+            if not response.is_streamed or response.is_async_streamed:
+                channel.put(response)
+                return
+            items = itertools.chain([response],
+                                    utilities.iter_json(response.body),
+                                    [None])
+            for item in items:
+                if not channel.put(item):
+                    # Sending the body failed, see stream_body
+                    if request.has_session:
+                        dal.rollback(request.session)
+                    return
+        except Exception as err:
+            if request is not None and request.has_session:
+                dal.rollback(request.session)
+            channel.put(err)
+        finally:
+            if request is not None and request.has_session:
+                request.session.close()
+
+    async def handle_sync(self, respond, make_request, send):
+        """
+        Runs the synchronous handler method *respond* in the thread pool.
+        One task of the pool serves the whole request, see run_sync.
+        """
+        loop = asyncio.get_running_loop()
+        channel = _Channel(loop)
+        done = loop.run_in_executor(self.executor, self.run_sync, respond,
+                                    make_request, channel)
+        try:
+            await self.send_response(send, await channel.get(), channel)
+        finally:
+            channel.close()
+            await done
+
+    async def send_response(self, send, response, channel=None):
+        """
+        Sends *response*.  The chunks of a streamed body of a synchronous
+        handler are serialized in its thread and read from *channel*, as
+        they read from its session.
+        """
+        headers = dict(response.headers)
+        body = response.body
+        headers.setdefault("Content-Type", JSONAPI_MIMETYPE)
+        if body is None:
+            body = b""
+        elif isinstance(body, str):
+            body = body.encode("utf-8")
+        elif not isinstance(body, bytes) and not response.is_streamed:
+            body = utilities.dump_json_bytes(body)
+        raw_headers = [(name.lower().encode("latin-1"),
+                        str(value).encode("latin-1"))
+                       for name, value in headers.items()]
+        if isinstance(body, bytes):
+            raw_headers.append((b"content-length",
+                                str(len(body)).encode("latin-1")))
+        await send({"type": "http.response.start",
+                    "status": response.status,
+                    "headers": raw_headers})
+        if isinstance(body, bytes):
+            await send({"type": "http.response.body", "body": body})
+            return
+        if response.is_async_streamed:
+            chunks = utilities.aiter_json(body)
+        elif channel is not None:
+            chunks = channel.chunks()
+        else:
+            chunks = utilities.iter_json(body)
+        await self.stream_body(send, chunks)
+
+    async def pull_chunks(self, chunks):
+        """
+        Yields the *chunks* of a streamed body, which may be synchronous or
+        asynchronous iterators.
+        """
+        if isinstance(chunks, collections.abc.AsyncIterator):
+            async for chunk in chunks:
+                yield chunk
+        else:
+            for chunk in chunks:
+                yield chunk
+
+    async def stream_body(self, send, chunks):
+        """
+        Sends the *chunks* of a streamed body.
+
+        The status line has already been sent by the time the body fails, so
+        errors are only logged before the connection is cut short.  The
+        session is rolled back by handle_async or run_sync.
+        """
+        try:
+            async for chunk in self.pull_chunks(chunks):
+                await send({"type": "http.response.body", "body": chunk,
+                            "more_body": True})
+        except Exception:
+            LOG.error("Error while streaming the response body", exc_info=True)
+            raise
+        await send({"type": "http.response.body", "body": b""})
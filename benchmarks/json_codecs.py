@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017 Petuum, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+jsonapi_framework.benchmarks.json_codecs
+========================================
+Compares the installed JSON codecs (see jsonapi_framework.json_codec) on a
+collection document produced by the serializers.
+
+Run with ``python -m jsonapi_framework.benchmarks.json_codecs``.
+"""
+import argparse
+import timeit
+
+from jsonapi_framework.benchmarks.serialization import Model, User
+from jsonapi_framework.json_codec import available_json_codecs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--pretty", action="store_true",
+                        help="Indent and sort keys, like DEBUG mode does")
+    options = parser.parse_args()
+
+    document = {
+        "data": [User(Model(i)).serialize("/api")
+                 for i in range(options.rows)],
+        "links": {"self": "/api/users"},
+        "meta": {"total-pages": 1}
+    }
+    data = available_json_codecs()[-1].dumps(document, None, False)
+    print("{} resources, {:,} bytes".format(options.rows, len(data)))
+    print("    {:<10} {:>12} {:>12}".format("codec", "dumps", "loads"))
+    for codec in available_json_codecs():
+        dumps = min(timeit.repeat(
+            lambda: codec.dumps(document, None, options.pretty),
+            number=1, repeat=options.repeat))
+        loads = min(timeit.repeat(lambda: codec.loads(data),
+                                  number=1, repeat=options.repeat))
+        print("    {:<10} {:>10.2f}ms {:>10.2f}ms".format(
+            codec.name, dumps * 1000, loads * 1000))
+
+
+if __name__ == "__main__":
+    main()
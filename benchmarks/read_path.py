@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017 Petuum, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+jsonapi_framework.benchmarks.read_path
+======================================
+Compares loading and serializing a collection through ORM models against
+serializing straight from rows of the mapped columns (the
+``CollectionHandler.read_rows`` path), on an in-memory SQLite database.
+
+Run with ``python -m jsonapi_framework.benchmarks.read_path``.
+"""
+import argparse
+import timeit
+
+from sqlalchemy import (create_engine, Boolean, Column, Float, Integer,
+                        String)
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+import jsonapi_framework.sqlalchemy_dal as dal
+from jsonapi_framework.resource import (Resource, Attribute,
+                                        ToOneRelationship, Id)
+
+Base = declarative_base()
+
+
+class UserModel(Base):
+    __tablename__ = "user"
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    email = Column(String)
+    age = Column(Integer)
+    score = Column(Float)
+    active = Column(Boolean)
+    team_id = Column(Integer)
+
+
+class Team(Resource):
+    model_class = UserModel
+    japi_resource_type = "team"
+    japi_resource_url_component = "teams"
+    id = Id()
+
+
+class User(Resource):
+    model_class = UserModel
+    japi_resource_type = "user"
+    japi_resource_url_component = "users"
+    id = Id()
+    name = Attribute()
+    email = Attribute()
+    age = Attribute()
+    score = Attribute()
+    active = Attribute()
+    team = ToOneRelationship("team_id", Team)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    options = parser.parse_args()
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all([
+        UserModel(id=i, name="name {}".format(i),
+                  email="user{}@example.com".format(i), age=i % 90,
+                  score=i * 0.5, active=bool(i % 2), team_id=i % 50)
+        for i in range(options.rows)])
+    session.commit()
+
+    for fields in (None, ["name", "team"]):
+        columns = User.row_columns(fields)
+
+        # Like a request, every run starts with an empty identity map
+        def orm():
+            session.expunge_all()
+            return [r.serialize("/api", fields) for r in dal.query_collection(
+                session, User, fields and ["name", "team_id"])]
+
+        def rows():
+            session.expunge_all()
+            return [r.serialize("/api", fields) for r in dal.query_collection(
+                session, User, columns=columns)]
+
+        assert orm() == rows()
+        print("fields={}".format(fields))
+        for name, func in (("orm", orm), ("rows", rows)):
+            best = min(timeit.repeat(func, number=1, repeat=options.repeat))
+            print("    {:<12} {:>12,.0f} rows/s".format(
+                name, options.rows / best))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017 Petuum, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+jsonapi_framework.benchmarks.routing
+====================================
+Measures the per-request overhead of routing a request to its handler
+method, from the URL and the Accept header:
+
+* legacy - a Werkzeug rule per request type, nested handler_map lookups,
+  parsing the Accept header and the if/elif chain of handler.handle (how
+  FlaskAPI used to route)
+* compiled - one Werkzeug rule, BaseAPI.route and the compiled routing table
+  of BaseAPI.dispatch, with the Accept header negotiation cached
+
+Run with ``python -m jsonapi_framework.benchmarks.routing``.
+"""
+import argparse
+import timeit
+
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+from werkzeug.routing import Map, Rule
+
+from jsonapi_framework.api import ALLOWED_METHODS, JSONAPI_MIMETYPE, BaseAPI
+from jsonapi_framework.handler import handle
+from jsonapi_framework.request import RequestType
+from jsonapi_framework.response import Response
+
+RESPONSE = Response(None, 204)
+
+# (HTTP method, path, Accept header)
+REQUESTS = [
+    ("GET", "/api/people", "application/vnd.api+json"),
+    ("GET", "/api/people/1", "*/*"),
+    ("PATCH", "/api/people/1", "application/vnd.api+json"),
+    ("GET", "/api/people/1/company", ""),
+    ("POST", "/api/people/1/relationships/company",
+     "application/vnd.api+json, text/plain;q=0.5"),
+]
+
+
+class Handler(object):
+    @classmethod
+    def get(cls, request):
+        return RESPONSE
+
+    @classmethod
+    def post(cls, request):
+        return RESPONSE
+
+    @classmethod
+    def patch(cls, request):
+        return RESPONSE
+
+    @classmethod
+    def delete(cls, request):
+        return RESPONSE
+
+
+class Request(object):
+    def __init__(self, method):
+        self.method = method
+
+
+def make_handler_map(resources):
+    handler_map = {}
+    for i in range(resources):
+        handler_map["people" if i == 0 else "resource{}".format(i)] = {
+            RequestType.RESOURCE: Handler,
+            RequestType.COLLECTION: Handler,
+            RequestType.RELATED: {"company": Handler, "owner": Handler},
+            RequestType.RELATIONSHIP: {"company": Handler, "owner": Handler}}
+    return handler_map
+
+
+def legacy_router(handler_map):
+    url_map = Map([
+        Rule("/api/<japi_resource_url_component>/<id>",
+             endpoint=RequestType.RESOURCE,
+             methods=ALLOWED_METHODS[RequestType.RESOURCE]),
+        Rule("/api/<japi_resource_url_component>",
+             endpoint=RequestType.COLLECTION,
+             methods=ALLOWED_METHODS[RequestType.COLLECTION]),
+        Rule("/api/<japi_resource_url_component>/<id>/<relationship>",
+             endpoint=RequestType.RELATED,
+             methods=ALLOWED_METHODS[RequestType.RELATED]),
+        Rule("/api/<japi_resource_url_component>/<id>/relationships/"
+             "<relationship>",
+             endpoint=RequestType.RELATIONSHIP,
+             methods=ALLOWED_METHODS[RequestType.RELATIONSHIP])]).bind(
+        "localhost")
+
+    def route(method, path, accept):
+        request_type, arguments = url_map.match(path, method)
+        resource_map = handler_map[arguments["japi_resource_url_component"]]
+        if request_type in (RequestType.RELATED, RequestType.RELATIONSHIP):
+            handler = resource_map[request_type][arguments["relationship"]]
+        else:
+            handler = resource_map[request_type]
+        accept_mimetypes = parse_accept_header(accept, MIMEAccept)
+        if JSONAPI_MIMETYPE in accept_mimetypes or not accept_mimetypes:
+            request = Request(method.lower())
+            return handle(handler, request)
+        if "text/plain" in accept_mimetypes:
+            return handler.get_plain_text(Request(method.lower()))
+
+    return route
+
+
+def compiled_router(handler_map):
+    api = BaseAPI(handler_map, None, api_prefix="/api")
+    url_map = Map([Rule(
+        "/api/<path:path>", endpoint="path",
+        methods=sorted(set().union(*ALLOWED_METHODS.values())))]).bind(
+        "localhost")
+
+    def route(method, path, accept):
+        _, arguments = url_map.match(path, method)
+        url_component, request_type, _, relationship = api.route(
+            "/" + arguments["path"])
+        return api.dispatch(url_component, request_type, relationship,
+                            method, accept)(Request(method.lower()))
+
+    return route
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--resources", type=int, default=50)
+    parser.add_argument("--number", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    options = parser.parse_args()
+
+    handler_map = make_handler_map(options.resources)
+    for name, router in (("legacy", legacy_router(handler_map)),
+                         ("compiled", compiled_router(handler_map))):
+        def run():
+            for method, path, accept in REQUESTS:
+                router(method, path, accept)
+
+        best = min(timeit.repeat(run, number=options.number,
+                                 repeat=options.repeat))
+        print("{:<10} {:>8.2f} us/request".format(
+            name, best / options.number / len(REQUESTS) * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017 Petuum, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+jsonapi_framework.benchmarks.serialization
+==========================================
+Compares the serializers compiled by ResourceMeta against the interpreted
+field loop Resource.serialize used before.
+
+Run with ``python -m jsonapi_framework.benchmarks.serialization``.
+"""
+import argparse
+import timeit
+
+from jsonapi_framework.resource import (Resource, Attribute,
+                                        ToOneRelationship, Id)
+from jsonapi_framework.utilities import link_for_resource
+
+
+class Model(object):
+    def __init__(self, i):
+        self.id = i
+        self.name = "name {}".format(i)
+        self.email = "user{}@example.com".format(i)
+        self.age = i % 90
+        self.score = i * 0.5
+        self.active = bool(i % 2)
+        self.team_id = i % 50
+        self.manager_id = None if i % 3 else i - 1
+
+
+class Team(Resource):
+    model_class = Model
+    japi_resource_type = "team"
+    japi_resource_url_component = "teams"
+    id = Id()
+
+
+class User(Resource):
+    model_class = Model
+    japi_resource_type = "user"
+    japi_resource_url_component = "users"
+    id = Id()
+    name = Attribute()
+    email = Attribute()
+    age = Attribute()
+    score = Attribute()
+    active = Attribute()
+    team = ToOneRelationship("team_id", Team)
+    manager = ToOneRelationship("manager_id", Team, nullable=True)
+
+
+def interpreted_serialize(resource, link_prefix, fields=None):
+    """
+    The field loop Resource.serialize ran before serializers were compiled.
+    """
+    ret = {}
+    id = type(resource).id.serialize(resource.model)
+    ret["id"] = id
+    ret["type"] = resource.japi_resource_type
+    ret["links"] = {
+        "self": link_for_resource(
+            link_prefix, resource.japi_resource_url_component, resource.id)
+    }
+    attributes_dict = {}
+    for attribute_name, value in resource._attrs_by_japi_name.items():
+        if fields is None or attribute_name in fields:
+            attributes_dict[attribute_name] = value.serialize(resource.model)
+    if attributes_dict:
+        ret["attributes"] = attributes_dict
+    relationships_dict = {}
+    for relationship_name, value in resource._rels_by_japi_name.items():
+        if fields is None or relationship_name in fields:
+            relationships_dict[relationship_name] = value.serialize(
+                resource.model, id, link_prefix)
+    if relationships_dict:
+        ret["relationships"] = relationships_dict
+    return ret
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    options = parser.parse_args()
+
+    resources = [User(Model(i)) for i in range(options.rows)]
+    for fields in (None, ["name", "team"]):
+        assert all(interpreted_serialize(r, "/api", fields) ==
+                   r.serialize("/api", fields) for r in resources)
+
+        def interpreted():
+            for r in resources:
+                interpreted_serialize(r, "/api", fields)
+
+        def compiled():
+            for r in resources:
+                r.serialize("/api", fields)
+
+        print("fields={}".format(fields))
+        for name, func in (("interpreted", interpreted),
+                           ("compiled", compiled)):
+            best = min(timeit.repeat(func, number=1, repeat=options.repeat))
+            print("    {:<12} {:>12,.0f} rows/s".format(
+                name, options.rows / best))
+
+
+if __name__ == "__main__":
+    main()
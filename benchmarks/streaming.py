@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017 Petuum, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+jsonapi_framework.benchmarks.streaming
+======================================
+Measures the peak Python memory (with :mod:`tracemalloc`) of reading and
+serializing a whole table like a streamed collection response, once with
+the result buffered and once fetched in chunks
+(``dal.query_collection(..., chunk_size=...)``), on a SQLite database.
+
+Run with ``python -m jsonapi_framework.benchmarks.streaming``.  The default
+of a million rows needs a few GB of memory for the buffered run, which can
+be left out with ``--chunk-sizes 1000``.
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from sqlalchemy import create_engine, Column, Float, Integer, String
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+import jsonapi_framework.sqlalchemy_dal as dal
+from jsonapi_framework.resource import Resource, Attribute, Id
+from jsonapi_framework.utilities import iter_json
+
+Base = declarative_base()
+
+
+class RecordModel(Base):
+    __tablename__ = "record"
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    score = Column(Float)
+
+
+class Record(Resource):
+    model_class = RecordModel
+    japi_resource_type = "record"
+    japi_resource_url_component = "records"
+    id = Id()
+    name = Attribute()
+    score = Attribute()
+
+
+def fill(engine, rows, batch_size=50000):
+    table = RecordModel.__table__
+    with engine.begin() as connection:
+        for start in range(0, rows, batch_size):
+            connection.execute(table.insert(), [
+                {"id": i, "name": "record {}".format(i), "score": i * 0.5}
+                for i in range(start, min(start + batch_size, rows))])
+
+
+def send(session, chunk_size):
+    """
+    Serializes the table into a discarded response body.
+
+    :returns int: The size of the body
+    """
+    resources = dal.query_collection(session, Record, order_by=["id"],
+                                     chunk_size=chunk_size)
+    doc = {"data": (r.serialize("/api") for r in resources), "links": {}}
+    return sum(len(chunk) for chunk in iter_json(doc))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--chunk-sizes", type=int, nargs="+",
+                        default=[0, 1000],
+                        help="0 reads the result buffered")
+    options = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    engine = create_engine(
+        "sqlite:///" + os.path.join(directory, "streaming.db"))
+    Base.metadata.create_all(engine)
+    fill(engine, options.rows)
+    session = sessionmaker(bind=engine)()
+
+    print("rows={:,}".format(options.rows))
+    for chunk_size in options.chunk_sizes:
+        session.expunge_all()
+        tracemalloc.start()
+        start = time.perf_counter()
+        size = send(session, chunk_size or None)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        session.rollback()
+        print("    {:<16} peak {:>10,.1f} MiB  {:>8.1f} s  {:,} bytes".format(
+            "chunk_size={}".format(chunk_size or None), peak / 2 ** 20,
+            elapsed, size))
+    session.close()
+    engine.dispose()
+    os.remove(os.path.join(directory, "streaming.db"))
+    os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017 Petuum, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+jsonapi_framework.filters
+=========================
+Compiles the ``filter[FIELD]`` and ``filter[FIELD][OP]`` parameters of a
+request into SQLAlchemy column expressions.
+
+The values of a ``filter[FIELD]`` parameter are ORed: the values without a
+'%' compare with ``=``, or with ``IN (...)`` if there are several, and the
+values with a '%' are ``LIKE`` patterns.
+
+``filter[FIELD][OP]`` applies one of the :data:`OPERATORS` to the values,
+which are converted to the Python type of the column first:
+
+*   *eq*, *ne*
+    ``=`` and ``<>``, or ``IN (...)`` and ``NOT IN (...)`` for several
+    values
+*   *in*
+    ``IN (...)``
+*   *lt*, *lte*, *gt*, *gte*
+    ``<``, ``<=``, ``>`` and ``>=`` a single value
+*   *null*
+    ``IS NULL`` for 'true' and ``IS NOT NULL`` for 'false'
+*   *like*
+    The ORed ``LIKE`` patterns
+
+The column is compared as it is, so the predicates can use an index on it.
+The parameters are ANDed.
+
+The expressions only depend on the *shape* of a :class:`Filter` (the
+columns, operators, how many values compare with ``=`` and which patterns
+are prefix patterns), not on the values, which are bound parameters.  So
+they are compiled once per shape and reused, see :func:`compile_filter`.
+"""
+import datetime
+import decimal
+import functools
+import operator
+import sys
+
+from sqlalchemy import and_, bindparam, or_, String
+from sqlalchemy.orm.attributes import QueryableAttribute
+
+from jsonapi_framework.errors import BadRequest, UnsupportedFilter
+
+#: The databases on which a prefix pattern (``abc%``) is also compared with
+#: a range (``>= 'abc' AND < 'abd'``), which can use a btree index, if the
+#: column is a string declared with one of the PREFIX_RANGE_COLLATIONS.
+#: LIKE is case-insensitive on SQLite and on MySQL's default collations,
+#: where the range would leave out matches.
+PREFIX_RANGE_DIALECTS = frozenset(["postgresql"])
+
+#: The collations ordering strings bytewise, the only ones under which the
+#: range matches exactly the strings starting with the prefix.  Locale
+#: collations such as en_US.UTF-8 ignore the punctuation upper_bound may
+#: produce ('abc9%' gets the empty range 'abc9' to 'abc:').  So the
+#: rewrite is opt-in per column, e.g. ``Column(String(collation="C"))``,
+#: and needs a btree index on the column in that collation to pay off.
+PREFIX_RANGE_COLLATIONS = frozenset(["C", "POSIX"])
+
+#: The operators of ``filter[FIELD][OP]``
+OPERATORS = frozenset(["eq", "ne", "in", "lt", "lte", "gt", "gte", "null",
+                       "like"])
+
+_SINGLE_VALUE_OPERATORS = frozenset(["lt", "lte", "gt", "gte", "null"])
+
+_COMPARISONS = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "lt": operator.lt,
+    "lte": operator.le,
+    "gt": operator.gt,
+    "gte": operator.ge
+}
+
+_LIKE_SPECIAL_CHARACTERS = frozenset("%_\\")
+
+
+def _filter_column(resource_class, name):
+    """
+    Gets the name of the model attribute filtered by ``filter[name]``.
+
+    :raises UnsupportedFilter: If it is not a column of the model
+    """
+    relationship = resource_class._rels_by_japi_name.get(name)
+    if relationship is not None:
+        column = relationship.mapped_fk_name
+    else:
+        attribute = resource_class._attrs_by_japi_name.get(name)
+        column = getattr(attribute, "mapped_attribute_name", None) or name
+    if column is None or not isinstance(
+            getattr(resource_class.model_class, column, None),
+            QueryableAttribute):
+        raise UnsupportedFilter(
+            resource_class.japi_resource_type, name, "filter",
+            detail="The field '{}.{}' can not be filtered by.".format(
+                resource_class.japi_resource_type, name))
+    return column
+
+
+def _parse_bool(value):
+    lowered = value.lower()
+    if lowered in ("true", "1"):
+        return True
+    if lowered in ("false", "0"):
+        return False
+    raise ValueError(value)
+
+
+def _parse_datetime(value):
+    if value.endswith(("Z", "z")):
+        value = value[:-1] + "+00:00"
+    return datetime.datetime.fromisoformat(value)
+
+
+# Checked in order, bool is an int and datetime a date
+_CONVERTERS = (
+    (bool, _parse_bool),
+    (datetime.datetime, _parse_datetime),
+    (datetime.date, datetime.date.fromisoformat),
+    (datetime.time, datetime.time.fromisoformat),
+    (int, int),
+    (float, float),
+    (decimal.Decimal, decimal.Decimal)
+)
+
+
+def _converter(column_type):
+    """
+    :returns callable: Converts a query parameter value to the Python type
+                       of *column_type*
+    """
+    try:
+        python_type = column_type.python_type
+    except NotImplementedError:
+        return str
+    for type_, converter in _CONVERTERS:
+        if issubclass(python_type, type_):
+            return converter
+    return str
+
+
+def _operator_values(resource_class, name, column, op, values):
+    """
+    Checks the values of ``filter[name][op]`` and converts them to the type
+    of *column*.
+
+    :raises UnsupportedFilter: If there is no operator *op*
+    :raises BadRequest: If a value is invalid
+    """
+    parameter = "filter[{}][{}]".format(name, op)
+    if op not in OPERATORS:
+        raise UnsupportedFilter(resource_class.japi_resource_type, name, op,
+                                source_parameter=parameter)
+    if op in _SINGLE_VALUE_OPERATORS and len(values) > 1:
+        raise BadRequest(
+            detail="The '{}' filter takes a single value.".format(op),
+            source_parameter=parameter)
+    if op == "null":
+        convert = _parse_bool
+    elif op == "like":
+        convert = str
+    else:
+        convert = _converter(
+            getattr(resource_class.model_class, column).type)
+    try:
+        return tuple(convert(value) for value in values)
+    except (ValueError, ArithmeticError):
+        raise BadRequest(
+            detail="The value '{}' is not valid for {}.".format(
+                ",".join(values), parameter),
+            source_parameter=parameter)
+
+
+class Filter(object):
+    """
+    The ``filter[FIELD]`` and ``filter[FIELD][OP]`` parameters of a
+    request, resolved to the model attributes.  Instances are immutable.
+
+    *   *clauses*
+        A tuple of (model attribute name, operator, tuple of values) for
+        every parameter, in order.  The operator is None for
+        ``filter[FIELD]``, whose values are strings.  Otherwise it is one
+        of the OPERATORS and the values have the type of the column.
+    """
+
+    __slots__ = ("clauses",)
+
+    def __init__(self, clauses):
+        object.__setattr__(self, "clauses", tuple(
+            (column, op, tuple(values)) for column, op, values in clauses))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Filter objects are immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("Filter objects are immutable")
+
+    def __repr__(self):
+        return "Filter({!r})".format(self.clauses)
+
+    def __eq__(self, other):
+        return isinstance(other, Filter) and self.clauses == other.clauses
+
+    def __hash__(self):
+        return hash(self.clauses)
+
+    @classmethod
+    def parse(cls, filters, resource_class):
+        """
+        Resolves the *filters* of a QuerySpec to the model attributes of
+        *resource_class*: the relationships to their foreign key and the
+        attributes to their mapped_attribute_name.  The values of the
+        operators are converted to the types of the columns.
+
+        :param tuple filters: QuerySpec.filters
+        :param resource_class: The resource class
+        :returns Filter: or None if there are no *filters*
+        :raises UnsupportedFilter: If a field is not a column of the model,
+                                   or an operator is unknown
+        :raises BadRequest: If the value of an operator is invalid
+        """
+        clauses = []
+        for name, op, values in filters:
+            column = _filter_column(resource_class, name)
+            if op is not None:
+                values = _operator_values(resource_class, name, column, op,
+                                          values)
+            clauses.append((column, op, values))
+        return cls(clauses) if clauses else None
+
+
+def prefix_of(pattern):
+    """
+    Gets the prefix of a LIKE *pattern* which only has a single, trailing
+    '%', such as 'abc%'.
+
+    :returns str: The prefix, or None if *pattern* is no such pattern
+    """
+    prefix = pattern[:-1]
+    if not prefix or pattern[-1] != "%" or \
+            _LIKE_SPECIAL_CHARACTERS.intersection(prefix):
+        return None
+    return prefix
+
+
+def upper_bound(prefix):
+    """
+    Gets the least string greater than all the strings starting with
+    *prefix*, by incrementing its last character that can be incremented.
+
+    :returns str: The bound, or None if there is none
+    """
+    for i in reversed(range(len(prefix))):
+        code = ord(prefix[i]) + 1
+        if 0xd800 <= code <= 0xdfff:
+            # Surrogates can not be encoded
+            code = 0xe000
+        if code <= sys.maxunicode:
+            return prefix[:i] + chr(code)
+    return None
+
+
+def _pattern_shape(params, key, patterns, prefix_ranges):
+    """
+    Adds the values of the bind parameters of the LIKE *patterns* to
+    *params*.
+
+    :returns tuple: Whether each pattern is compared with a range
+    """
+    shape = []
+    for j, pattern in enumerate(patterns):
+        like_key = "{}_like_{}".format(key, j)
+        params[like_key] = pattern
+        prefix = prefix_of(pattern) if prefix_ranges else None
+        upper = upper_bound(prefix) if prefix else None
+        if upper is not None:
+            params[like_key + "_lower"] = prefix
+            params[like_key + "_upper"] = upper
+        shape.append(upper is not None)
+    return tuple(shape)
+
+
+def _shape(model_class, filter, prefix_ranges):
+    """
+    :returns tuple: The shape of *filter* and the values of its bind
+                    parameters
+    """
+    shape = []
+    params = {}
+    for i, (column, op, values) in enumerate(filter.clauses):
+        key = "filter_{}".format(i)
+        column_type = getattr(model_class, column).type
+        prefix_ranges_of_column = prefix_ranges and isinstance(
+            column_type, String) and \
+            column_type.collation in PREFIX_RANGE_COLLATIONS
+        if op is None:
+            equal = [value for value in values if "%" not in value]
+            if len(equal) > 1:
+                params[key + "_in"] = equal
+            elif equal:
+                params[key + "_eq"] = equal[0]
+            patterns = _pattern_shape(
+                params, key, [value for value in values if "%" in value],
+                prefix_ranges_of_column)
+            detail = (min(len(equal), 2), patterns)
+        elif op == "null":
+            detail = values[0]
+        elif op == "like":
+            detail = _pattern_shape(params, key, values,
+                                    prefix_ranges_of_column)
+        elif op == "in" or len(values) > 1:
+            params[key] = list(values)
+            detail = "many"
+        else:
+            params[key] = values[0]
+            detail = "one"
+        shape.append((column, op, detail))
+    return tuple(shape), params
+
+
+def _like(column, key, patterns):
+    alternatives = []
+    for j, prefix_range in enumerate(patterns):
+        like_key = "{}_like_{}".format(key, j)
+        like = column.like(bindparam(like_key))
+        if prefix_range:
+            like = and_(column >= bindparam(like_key + "_lower"),
+                        column < bindparam(like_key + "_upper"), like)
+        alternatives.append(like)
+    return alternatives
+
+
+def _or(alternatives):
+    return or_(*alternatives) if len(alternatives) > 1 else alternatives[0]
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile(model_class, shape):
+    clauses = []
+    for i, (column_name, op, detail) in enumerate(shape):
+        column = getattr(model_class, column_name)
+        key = "filter_{}".format(i)
+        if op is None:
+            equal, patterns = detail
+            alternatives = []
+            if equal == 1:
+                alternatives.append(column == bindparam(key + "_eq"))
+            elif equal:
+                alternatives.append(column.in_(
+                    bindparam(key + "_in", expanding=True)))
+            clauses.append(_or(alternatives + _like(column, key, patterns)))
+        elif op == "null":
+            clauses.append(column.is_(None) if detail
+                           else column.isnot(None))
+        elif op == "like":
+            clauses.append(_or(_like(column, key, detail)))
+        elif detail == "many":
+            in_ = column.in_(bindparam(key, expanding=True))
+            clauses.append(~in_ if op == "ne" else in_)
+        else:
+            clauses.append(_COMPARISONS[op](column, bindparam(key)))
+    return and_(*clauses) if len(clauses) > 1 else clauses[0]
+
+
+def compile_filter(resource_class, filter, dialect_name=None):
+    """
+    Compiles *filter* into a SQLAlchemy expression on the model of
+    *resource_class*.  The expression is cached by the shape of *filter*
+    and has the values as bind parameters.
+
+    :param resource_class: The resource class
+    :param Filter filter: The filter
+    :param str dialect_name: The name of the database dialect, prefix
+                             patterns are only rewritten into ranges for
+                             PREFIX_RANGE_DIALECTS and columns with
+                             PREFIX_RANGE_COLLATIONS
+    :returns tuple: The expression, the values of its bind parameters, and
+                    the shape, which can be used in cache keys
+    """
+    shape, params = _shape(resource_class.model_class, filter,
+                           dialect_name in PREFIX_RANGE_DIALECTS)
+    return _compile(resource_class.model_class, shape), params, shape
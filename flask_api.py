@@ -47,22 +47,22 @@ import logging
 
 from flask import request as flask_request
 from flask import make_response as flask_make_response
-import sqlalchemy.exc
-import sqlalchemy_filters
+from flask import Response as FlaskResponse
 
 import jsonapi_framework.utilities as utilities
 import jsonapi_framework.errors as errors
 import jsonapi_framework.sqlalchemy_dal as dal
-from jsonapi_framework.request import Request, RequestType
+from jsonapi_framework.api import ALLOWED_METHODS, BaseAPI
+from jsonapi_framework.request import Request
 from jsonapi_framework.debug import DEBUG
-from jsonapi_framework.handler import handle
+from jsonapi_framework.operations import OperationsHandler
 
 
 LOG = logging.getLogger(__name__)
 LOG.setLevel(logging.DEBUG if DEBUG else logging.INFO)
 
 
-class FlaskAPI(object):
+class FlaskAPI(BaseAPI):
     """
     This class:
         * Constructs request objects
@@ -73,7 +73,8 @@ class FlaskAPI(object):
     """
 
     def __init__(self, handler_map, flask, session_callable, api_prefix="",
-                 proxy_prefix="", hostname=""):
+                 proxy_prefix="", hostname="", operations_path="/operations",
+                 operations_handler=OperationsHandler):
         """
         :param dict handler_map: Map of resource types to request type maps:
         :param Flask flask: Flask object
@@ -86,53 +87,29 @@ class FlaskAPI(object):
         :param str hostname:
             Hostname for the api.  Leave blank for relative links (default)
             TODO: Support automatic detection from request
+        :param str operations_path:
+            The path after the api_prefix of the endpoint for atomic
+            operations (see operations.OperationsHandler), or None for no
+            such endpoint
+        :param OperationsHandler class operations_handler:
+            The handler of the atomic operations, it is subclassed to set
+            its handler_map
         """
-        self.handler_map = handler_map
-        self.session_callable = session_callable
-        self.api_prefix = api_prefix
-        self.proxy_prefix = proxy_prefix
-        self.hostname = hostname
+        super().__init__(handler_map, session_callable, api_prefix,
+                         proxy_prefix, hostname, operations_path,
+                         operations_handler)
 
-        # Passing self.foo_request works because passing a bound method
-        # actually closes over self, as if the function was partially applied
-        # to self at the time that it's referenced
-        # In less theoretical terms, the method remembers which instance it's
-        # bound to.
-        # This might be useful: (ignore unbound methods, as the answer mentions
-        # there is no distinction between unbound methods and plain functions
-        # in Python 3)
-        # https://stackoverflow.com/questions/11949808/what-is-the-difference-between-a-function-an-unbound-method-and-a-bound-method
-
-        # Rule for resource request
-
-        flask.add_url_rule(
-            api_prefix + "/<string:japi_resource_url_component>/<string:id>",
-            view_func=self.resource_request,
-            methods=['GET', 'DELETE', 'PATCH'])
-        # Rule for collection request
-        flask.add_url_rule(
-            api_prefix + "/<string:japi_resource_url_component>",
-            view_func=self.collection_request, methods=['GET', 'POST'])
-        # Rule for related resource request
+        # A single rule takes all the JSON API paths, which are then matched
+        # by BaseAPI.route and dispatched through the compiled routing table
         flask.add_url_rule(
-            api_prefix +
-            "/<string:japi_resource_url_component>/"
-            "<string:id>/<string:relationship>",
-            view_func=self.related_request, methods=['GET'])
-        # Rule for relationship request
-        flask.add_url_rule(
-            api_prefix + "/<string:japi_resource_url_component>/<string:id>"
-            "/relationships/<string:relationship>",
-            view_func=self.relationship_request,
-            methods=['GET', 'POST', 'DELETE', 'PATCH'])
+            api_prefix + "/<path:path>", view_func=self.path_request,
+            methods=sorted(set().union(*ALLOWED_METHODS.values())))
 
     def handle_request(self, japi_resource_url_component, request_type,
                        id=None, relationship=None):
         """
-        The routing logic is arranged in this unnatural manner (a bunch of
-        functions that act as proxies for handle_request) because we want to
-        take advantage of Flask's provided parsing logic (which is really
-        provided by Werkzeug...)
+        Handles a request that path_request routed, with the handler method
+        from the routing table (see BaseAPI.dispatch).
         """
         LOG.info(" " * 80)
         LOG.info("=" * 80)
@@ -141,118 +118,102 @@ class FlaskAPI(object):
                  flask_request.url, japi_resource_url_component, request_type)
         LOG.debug("Flask headers: {}".format(flask_request.headers).strip())
         LOG.debug("Flask data (fallback): %.1000s", flask_request.data)
-        session = self.session_callable()
+        request = None
+        response = None
         try:
+            respond = self.dispatch(
+                japi_resource_url_component, request_type, relationship,
+                flask_request.method, flask_request.headers.get("Accept", ""))
             try:
-                r_json = flask_request.get_json()
+                r_json = self.parse_json_body()
             except Exception:
                 raise errors.BadRequest(detail="JSON body parse error")
             request = Request(
                 request_type,
                 flask_request.args,
                 flask_request.method,
-                self.hostname + self.proxy_prefix + self.api_prefix,
-                session,
+                self.link_prefix,
+                None,
                 flask_request.headers,
                 r_json,
                 id=id,
-                relationship=relationship)
-            try:
-                resource_map = self.handler_map[japi_resource_url_component]
-                if (request_type == RequestType.RELATIONSHIP or
-                        request_type == RequestType.RELATED):
-                    rel_handler_map = resource_map[request_type]
-                    handler = rel_handler_map[relationship]
-                else:
-                    handler = resource_map[request_type]
-            except KeyError:
-                raise errors.NotFound()
-
-            # If user expects something odd, handle the request accordingly
-            # NOTE: Right now we don't respect the accept header order i.e. if
-            # it indicates that both a JSON API and text/plain response
-            # are acceptable in the Accept header, we send the JSON API
-            # response.
-            # If we end up supporting more MIME types we probably want to do
-            # something more intelligent here.  But since text/plain support
-            # is just a hack right now...
-            if ("application/vnd.api+json" in flask_request.accept_mimetypes
-                    or not flask_request.accept_mimetypes):
-                response = handle(handler, request)
-            elif "text/plain" in flask_request.accept_mimetypes:
-                try:
-                    response = handler.get_plain_text(request)
-                except AttributeError:
-                    raise errors.NotAcceptable()
-            else:
-                raise errors.NotAcceptable()
-        except (errors.Error, errors.ErrorList) as err:
-            dal.rollback(session)
-            response = errors.error_to_response(err)
-        except sqlalchemy.exc.IntegrityError as err:
-            dal.rollback(session)
-            LOG.error("handle_request caught a database exception error",
-                      exc_info=True)
-            response = errors.error_to_response(
-                errors.BadRequest(detail="Database integrity exception. Check "
-                                         "that your request does not break "
-                                         "database invariants."))
-        except (sqlalchemy.exc.ArgumentError,
-                sqlalchemy.exc.ProgrammingError,
-                sqlalchemy_filters.exceptions.FieldNotFound) as err:
-            dal.rollback(session)
-            LOG.error("handle_request caught a database exception error",
-                      exc_info=True)
-            response = errors.error_to_response(
-                errors.BadRequest(
-                    detail="The table doesn't have the column(s)."))
-        except sqlalchemy.exc.DataError as err:
-            dal.rollback(session)
-            LOG.error("handle_request caught a database exception error",
-                      exc_info=True)
-            response = errors.error_to_response(
-                errors.BadRequest(
-                    detail="Wrong value."))
+                relationship=relationship,
+                query_string=flask_request.query_string.decode(
+                    "utf-8", "replace"),
+                session_callable=self.session_factory(respond))
+            response = respond(request)
         except Exception as err:
-            dal.rollback(session)
-            LOG.error("handle_request caught an exception", exc_info=True)
-            if DEBUG:
-                response = errors.stacktrace_to_response(err)
-            else:
-                response = errors.error_to_response(
-                    errors.InternalServerError())
+            if request is not None and request.has_session and \
+                    not self.is_read_only(respond):
+                dal.rollback(request.session)
+            response = self.error_to_response(err)
         finally:
-            session.remove()
-        return self.response_to_flask_response(response)
-
-    def response_to_flask_response(self, response):
+            # The session is only created once the handler uses it.  A
+            # streamed body is still reading from it, so it is only cleaned
+            # up when the response is closed (see below)
+            session = request.session \
+                if request is not None and request.has_session else None
+            if session is not None and (response is None or
+                                        not response.is_streamed):
+                session.remove()
+        flask_response = self.response_to_flask_response(response, session)
+        if session is not None and response.is_streamed:
+            flask_response.call_on_close(session.remove)
+        return flask_response
+
+    def response_to_flask_response(self, response, session=None):
         if "Content-Type" not in response.headers:
             response.headers["Content-Type"] = "application/vnd.api+json"
             if response.body is None:
                 body = ""
+            elif response.is_streamed:
+                return FlaskResponse(self.stream_body(response, session),
+                                     response.status, response.headers)
             else:
-                body = utilities.dump_json(response.body)
+                body = utilities.dump_json_bytes(response.body)
+        elif isinstance(response.body, (dict, list)):
+            # A JSON API document with a media type parameter, e.g. the
+            # results of the atomic operations
+            body = utilities.dump_json_bytes(response.body)
         else:
             body = response.body
         return flask_make_response((body, response.status,
                                     response.headers))
 
-    def resource_request(self, japi_resource_url_component=None, id=None):
-        return self.handle_request(japi_resource_url_component,
-                                   RequestType.RESOURCE, id=id)
+    def parse_json_body(self):
+        """
+        Decodes the request body with utilities.load_json.  Like
+        flask_request.get_json, bodies without a JSON mimetype are ignored.
 
-    def collection_request(self, japi_resource_url_component=None):
-        return self.handle_request(japi_resource_url_component,
-                                   RequestType.COLLECTION)
+        :returns: The decoded body, or None
+        """
+        if not flask_request.is_json:
+            return None
+        return utilities.load_json(flask_request.get_data(cache=True))
 
-    def related_request(self, japi_resource_url_component=None, id=None,
-                        relationship=None):
-        return self.handle_request(japi_resource_url_component,
-                                   RequestType.RELATED, id=id,
-                                   relationship=relationship)
+    def stream_body(self, response, session):
+        """
+        Returns a generator which serializes the body of a streamed response
+        chunk by chunk; Flask sends it with chunked transfer encoding.
 
-    def relationship_request(self, japi_resource_url_component=None, id=None,
-                             relationship=None):
-        return self.handle_request(japi_resource_url_component,
-                                   RequestType.RELATIONSHIP,
+        The status line has already been sent by the time the body fails, so
+        errors are only logged (and the session rolled back) before the
+        connection is cut short.
+        """
+        try:
+            yield from utilities.iter_json(response.body)
+        except Exception:
+            LOG.error("Error while streaming the response body", exc_info=True)
+            if session is not None:
+                dal.rollback(session)
+            raise
+
+    def path_request(self, path):
+        try:
+            japi_resource_url_component, request_type, id, relationship = \
+                self.route("/" + path)
+        except errors.NotFound as err:
+            return self.response_to_flask_response(
+                errors.error_to_response(err))
+        return self.handle_request(japi_resource_url_component, request_type,
                                    id=id, relationship=relationship)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017 Petuum, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+jsonapi_framework.fragment_cache
+================================
+An in-process cache of serialized resource objects.
+
+Handlers with ``cache_fragments = True`` look up the serialized form of
+every resource they return in :data:`FRAGMENT_CACHE` before serializing it.
+The PATCH and DELETE handlers invalidate the fragments of the resources
+they change, so the cache never serves a resource changed through the API.
+Changes made around the API (or relationships pointing at a resource that
+was deleted) only show up when the fragment expires after its TTL.
+
+The cached dicts are shared by all the responses they are put into and must
+not be modified.
+"""
+import collections
+import threading
+import time
+
+FragmentCacheInfo = collections.namedtuple(
+    "FragmentCacheInfo", ["hits", "misses", "evictions", "maxsize",
+                          "currsize"])
+
+
+class FragmentCache(object):
+    """
+    A least recently used cache of serialized resource objects whose
+    entries also expire after *ttl* seconds.
+
+    The entries are keyed by (resource type, id, sparse fieldset, link
+    prefix).  An index by (resource type, id) finds all the entries of a
+    resource for :meth:`invalidate`.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300):
+        """
+        :param int maxsize: The number of fragments to keep
+        :param float ttl: How long a fragment is used, in seconds
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (expiry time, fragment)
+        self._fragments = collections.OrderedDict()
+        # (type, id) -> set of keys
+        self._keys_by_resource = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(japi_resource_type, id, fields, link_prefix):
+        """
+        :param str japi_resource_type: The type of the resource
+        :param str id: The serialized id of the resource
+        :param str list fields: The sparse fieldset, or None
+        :param str link_prefix: The link prefix of the serialized links
+
+        :returns tuple: The key of the fragment
+        """
+        return (japi_resource_type, id,
+                None if fields is None else frozenset(fields), link_prefix)
+
+    def get(self, key):
+        """
+        :returns dict: The fragment, or None if it is not cached or expired
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._fragments.get(key)
+            if entry is not None:
+                if now < entry[0]:
+                    self._fragments.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, fragment):
+        """
+        Caches *fragment* under *key*, evicting the least recently used
+        fragment if the cache is full.
+        """
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            self._fragments[key] = (expires, fragment)
+            self._fragments.move_to_end(key)
+            self._keys_by_resource.setdefault(key[:2], set()).add(key)
+            while len(self._fragments) > self.maxsize:
+                self._remove(next(iter(self._fragments)))
+                self.evictions += 1
+
+    def serialize(self, resource, link_prefix, fields=None):
+        """
+        Returns the cached fragment of *resource*, serializing and caching
+        it first if necessary.  The arguments are those of
+        Resource.serialize.
+        """
+        resource_class = type(resource)
+        key = self.key(resource_class.japi_resource_type,
+                       resource_class.id.serialize(resource.model),
+                       fields, link_prefix)
+        fragment = self.get(key)
+        if fragment is None:
+            fragment = resource.serialize(link_prefix=link_prefix,
+                                          fields=fields)
+            self.put(key, fragment)
+        return fragment
+
+    def invalidate(self, japi_resource_type, id):
+        """
+        Removes every fragment of the resource *id* of *japi_resource_type*.
+
+        :param str id: The serialized id of the resource
+        """
+        with self._lock:
+            for key in self._keys_by_resource.pop(
+                    (japi_resource_type, id), ()):
+                del self._fragments[key]
+
+    def info(self):
+        """
+        :returns FragmentCacheInfo: The counters and the size of the cache
+        """
+        with self._lock:
+            return FragmentCacheInfo(self.hits, self.misses, self.evictions,
+                                     self.maxsize, len(self._fragments))
+
+    def clear(self):
+        """
+        Empties the cache and resets the counters.
+        """
+        with self._lock:
+            self._fragments.clear()
+            self._keys_by_resource.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def _remove(self, key):
+        del self._fragments[key]
+        keys = self._keys_by_resource[key[:2]]
+        keys.discard(key)
+        if not keys:
+            del self._keys_by_resource[key[:2]]
+
+
+FRAGMENT_CACHE = FragmentCache()
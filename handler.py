@@ -46,6 +46,7 @@ Contains Handler classes, which currently
 import logging
 
 import jsonapi_framework.errors as errors
+import jsonapi_framework.fragment_cache as fragment_cache
 import jsonapi_framework.sqlalchemy_dal as dal
 import jsonapi_framework.japi_format_validators as japi_format_vals
 from jsonapi_framework.context import Context
@@ -53,10 +54,16 @@ from jsonapi_framework.response import Response
 from jsonapi_framework.utilities import (link_for_resource,
                                          link_for_collection,
                                          link_for_related,
+                                         make_etag,
+                                         etag_matches,
+                                         http_date,
+                                         parse_http_date,
                                          get_sparse_fields,
+                                         get_include_paths,
                                          get_order_by_fields,
                                          get_filter)
-from jsonapi_framework.pagination import NumberSize
+from jsonapi_framework.pagination import ALL, MAX_LIMIT, Keyset, NumberSize
+from jsonapi_framework.resource import Id, Resource
 
 LOG = logging.getLogger(__name__)
 LOG.setLevel(logging.INFO)
@@ -83,7 +90,224 @@ def handle(cls, request):
     raise errors.MethodNotAllowed()
 
 
+def serialize_resource(resource, link_prefix, fields, cache_fragments):
+    """
+    Serializes *resource* like Resource.serialize, through the
+    fragment_cache.FRAGMENT_CACHE if *cache_fragments* is True.
+    """
+    if cache_fragments:
+        return fragment_cache.FRAGMENT_CACHE.serialize(resource, link_prefix,
+                                                       fields)
+    return resource.serialize(link_prefix=link_prefix, fields=fields)
+
+
+def fragment_id(resource_class, resource):
+    """
+    :returns str: The id of *resource* to invalidate its cached fragments
+                  with.  Must be taken before committing, which expires the
+                  model.
+    """
+    return resource_class.id.serialize(resource.model)
+
+
+def is_versioned(resource_class):
+    """
+    :returns bool: Whether *resource_class* declares a version or updated_at
+                   column, which GET requests derive ETag and Last-Modified
+                   headers from.
+    """
+    return (resource_class.version_column is not None or
+            resource_class.updated_at_column is not None)
+
+
+def is_conditional(request):
+    """
+    :returns bool: Whether *request* has If-None-Match or If-Modified-Since
+                   headers
+    """
+    return ("If-None-Match" in request.headers or
+            "If-Modified-Since" in request.headers)
+
+
+def validator_headers(request, resource_class, version, updated_at, *extra):
+    """
+    Makes the ETag and Last-Modified headers of a GET response.
+
+    The ETag also covers the link prefix and the query arguments, so sparse
+    fieldsets, sorts, pages etc. of the same data get different tags.
+
+    :param version: The version of the data, or None
+    :param datetime updated_at: The last modification of the data, or None
+    :param extra: More values the data depends on
+
+    :returns dict: The headers
+    """
+    headers = {"ETag": make_etag(
+        resource_class.japi_resource_type, version, updated_at, extra,
+        request.link_prefix, sorted(request.query_args.items(multi=True)))}
+    if updated_at is not None:
+        headers["Last-Modified"] = http_date(updated_at)
+    return headers
+
+
+def version_fields(fields, resource_class):
+    """
+    Adds the version and updated_at columns of *resource_class* to the
+    sparse fieldset *fields* of a query, so that the validators can be
+    made from the loaded resources.
+
+    :param list fields: The mapped names to load, None for all
+
+    :returns list: The mapped names, None for all
+    """
+    if fields is None:
+        return None
+    return fields + [name for name in (resource_class.version_column,
+                                       resource_class.updated_at_column)
+                     if name is not None and name not in fields]
+
+
+def not_modified(request, headers, updated_at):
+    """
+    Evaluates the If-None-Match and If-Modified-Since headers of *request*
+    against the *headers* made by validator_headers.
+
+    :returns bool: Whether the response is 304 Not Modified
+    """
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        # If-Modified-Since is ignored if there is an If-None-Match
+        return etag_matches(if_none_match, headers["ETag"])
+    if_modified_since = request.headers.get("If-Modified-Since")
+    if if_modified_since is None or updated_at is None:
+        return False
+    since = parse_http_date(if_modified_since)
+    # Last-Modified only has a precision of seconds
+    return since is not None and parse_http_date(
+        headers["Last-Modified"]) <= since
+
+
+def error_at_index(error, index):
+    """
+    Moves the source pointer of *error*, raised for the primary data
+    of a single resource, below the resource at *index* of an array of
+    primary data.
+
+    :param Error error:
+    :param int index:
+
+    :returns Error: *error*
+    """
+    pointer = error.source_pointer
+    prefix = "/data/{}".format(index)
+    if pointer and pointer != "None" and pointer.startswith("/data"):
+        error.source_pointer = prefix + pointer[len("/data"):]
+    else:
+        error.source_pointer = prefix
+    return error
+
+
+def batch_ids(spec):
+    """
+    Tells whether a collection GET is a batch fetch of specific resources,
+    ``GET /<type>?filter[id]=1,2,3``: it has no other filter and no sort or
+    page parameters.  ``filter[id][eq]`` and ``filter[id][in]`` work too.
+
+    :param QuerySpec spec: The query parameters of the request
+
+    :returns tuple: The ids as strings, or None if it is no batch fetch
+    """
+    if len(spec.filters) != 1 or spec.sort or spec.page:
+        return None
+    name, op, ids = spec.filters[0]
+    if name != "id" or op not in (None, "eq", "in") or \
+            any("%" in id for id in ids):
+        return None
+    return ids
+
+
+def include_fields(fields_for_query, resource_class, include_tree):
+    """
+    Adds the foreign keys needed to follow the relationships in
+    *include_tree* to the sparse fields *fields_for_query* of a query for
+    *resource_class*.
+
+    :returns list: The sparse fields, or None if all fields are queried
+    """
+    if fields_for_query is None:
+        return None
+    fields_for_query = list(fields_for_query)
+    for name in include_tree:
+        fk_name = resource_class._rels_by_japi_name[name].mapped_fk_name
+        # Relationships with a custom fget have no foreign key to add
+        if fk_name is not None and fk_name not in fields_for_query:
+            fields_for_query.append(fk_name)
+    return fields_for_query
+
+
+def get_included(request, resource_class, resources, include_tree):
+    """
+    Loads the related resources of *resources* named by *include_tree* (see
+    utilities.get_include_paths), with one query per relationship over all
+    of *resources* at each level.
+
+    :param Request request: The request being handled
+    :param Resource class resource_class: The class of *resources*
+    :param list resources: The primary data
+    :param dict include_tree: The relationships to include
+
+    :returns list: The serialized resources for the top-level "included"
+                   member, each only once and without the primary data
+    """
+    included = {}
+    for resource in resources:
+        included[(resource_class.japi_resource_type,
+                  resource_class.id.serialize(resource.model))] = None
+    _load_included(request, resource_class, resources, include_tree,
+                   included)
+    return [doc for doc in included.values() if doc is not None]
+
+
+def _load_included(request, resource_class, resources, include_tree,
+                   included):
+    for name, subtree in include_tree.items():
+        relationship = resource_class._rels_by_japi_name[name]
+        related_class = relationship.related_resource_class
+        ids = {getattr(resource, relationship.python_name)
+               for resource in resources}
+        ids.discard(None)
+        if not ids:
+            continue
+        fields_to_return, fields_for_query = get_sparse_fields(
+            request.query_spec, related_class,
+            related_class.japi_resource_type)
+        related_resources = dal.query_resources_by_ids(
+            request.session, related_class, ids,
+            include_fields(fields_for_query, related_class, subtree))
+        for related in related_resources:
+            key = (related_class.japi_resource_type,
+                   related_class.id.serialize(related.model))
+            if key not in included:
+                included[key] = related.serialize(
+                    link_prefix=request.link_prefix, fields=fields_to_return)
+        _load_included(request, related_class, related_resources, subtree,
+                       included)
+
+
 class ResourceHandler(object):
+    # If True, GET requests serialize the resource through the
+    # fragment_cache.FRAGMENT_CACHE
+    cache_fragments = False
+
+    # If True, PATCH and DELETE requests are written with a single UPDATE
+    # ... RETURNING or DELETE statement instead of loading the resource into
+    # the session first (see dal.update_resource and dal.delete_resource).
+    # Only handlers and resources which do not customize the skipped steps
+    # take this path, see can_patch_core and can_delete_core; PATCH also
+    # needs the patched and returned fields to map to plain columns.  ORM
+    # events and cascades are bypassed.
+    core_writes = False
+
     @classmethod
     def link(cls, link_prefix, id):
         """
@@ -139,24 +363,56 @@ class ResourceHandler(object):
 
         :returns Response: Returns a response to the caller
         """
-        args = request.query_args.items(multi=True)
+        spec = request.query_spec
+        include_tree = get_include_paths(spec, cls.resource_class)
+        # With included resources the "fields[...]" parameters have to be
+        # told apart by type
         sparse_fields_to_return, sparse_fields_for_query = get_sparse_fields(
-            args, cls.resource_class)
+            spec, cls.resource_class,
+            cls.resource_class.japi_resource_type if include_tree else None)
+        id = cls.resource_class.id.deserialize(request.id)
+        sparse_fields_for_query = include_fields(
+            sparse_fields_for_query, cls.resource_class, include_tree)
+
+        # Included resources can change while the primary data does not, so
+        # compound documents get no validators
+        versioned = is_versioned(cls.resource_class) and not include_tree
+        if versioned and is_conditional(request):
+            # Answer before loading the whole resource
+            version = dal.query_resource_version(
+                request.session, cls.resource_class, id)
+            if version is None:
+                raise errors.NotFound()
+            headers = validator_headers(request, cls.resource_class,
+                                        *version)
+            if not_modified(request, headers, version[1]):
+                return Response(None, 304, headers)
+        if versioned:
+            sparse_fields_for_query = version_fields(
+                sparse_fields_for_query, cls.resource_class)
+
         resource = dal.query_resource(
-            request.session, cls.resource_class,
-            cls.resource_class.id.deserialize(request.id),
-            sparse_fields_for_query)
+            request.session, cls.resource_class, id, sparse_fields_for_query)
         if resource is None:
             raise errors.NotFound()
 
+        headers = None
+        if versioned:
+            headers = validator_headers(request, cls.resource_class, *[
+                None if name is None else getattr(resource.model, name)
+                for name in (cls.resource_class.version_column,
+                             cls.resource_class.updated_at_column)])
         links = {"self": cls.link(request.link_prefix, request.id)}
         resp_doc = {
-            "data": resource.serialize(
-                link_prefix=request.link_prefix,
-                fields=sparse_fields_to_return),
+            "data": serialize_resource(resource, request.link_prefix,
+                                       sparse_fields_to_return,
+                                       cls.cache_fragments),
             "links": links
         }
-        return Response(resp_doc)
+        if include_tree:
+            resp_doc["included"] = get_included(
+                request, cls.resource_class, [resource], include_tree)
+        return Response(resp_doc, headers=headers)
 
     @classmethod
     def patch(cls, request):
@@ -176,6 +432,10 @@ class ResourceHandler(object):
         japi_format_vals.assert_resource_object(patch_json,
                                                 source_pointer="/data/")
         patch_dict = cls.resource_class.create_patch_dict(patch_json)
+        if cls.can_patch_core():
+            resp = cls.patch_core(request, patch_dict)
+            if resp is not None:
+                return resp
         resource = dal.query_resource(
             request.session, cls.resource_class,
             cls.resource_class.id.deserialize(request.id))
@@ -186,9 +446,8 @@ class ResourceHandler(object):
         resource.apply_patch_dict(patch_dict)
         resource.validate(Context.UPDATE)
 
-        args = request.query_args.items(multi=True)
         sparse_fields_to_return, _ = get_sparse_fields(
-            args, cls.resource_class)
+            request.query_spec, cls.resource_class)
         links = {"self": cls.link(request.link_prefix, request.id)}
         resp_doc = {
             "data": resource.serialize(link_prefix=request.link_prefix,
@@ -197,10 +456,80 @@ class ResourceHandler(object):
         }
 
         resp = Response(resp_doc)
+        id = fragment_id(cls.resource_class, resource)
         dal.commit(request.session)
+        fragment_cache.FRAGMENT_CACHE.invalidate(
+            cls.resource_class.japi_resource_type, id)
         cls.after_patch(resp, cls.resource_class.id.deserialize(request.id))
         return resp
 
+    @classmethod
+    def can_patch_core(cls):
+        """
+        :returns bool: Whether PATCH requests may be written with
+                       dal.update_resource: core_writes is set, the id is
+                       serialized as is (see can_delete_core), and neither
+                       before_patch, Resource.apply_patch_dict,
+                       Resource.validate nor an UPDATE validator of a field
+                       needs the model
+        """
+        resource_class = cls.resource_class
+        return (cls.core_writes and
+                type(resource_class.id).serialize is Id.serialize and
+                cls.before_patch.__func__ is
+                ResourceHandler.before_patch.__func__ and
+                resource_class.apply_patch_dict is
+                Resource.apply_patch_dict and
+                resource_class.validate is Resource.validate and
+                not resource_class.has_validators(Context.UPDATE))
+
+    @classmethod
+    def can_delete_core(cls):
+        """
+        :returns bool: Whether DELETE requests may be written with
+                       dal.delete_resource: core_writes is set and the id
+                       is serialized as is, so the fragments of the
+                       resource can be invalidated without loading it
+        """
+        return (cls.core_writes and
+                type(cls.resource_class.id).serialize is Id.serialize)
+
+    @classmethod
+    def patch_core(cls, request, patch_dict):
+        """
+        Applies *patch_dict* with dal.update_resource, see can_patch_core.
+
+        :param Request request: The request being handled
+        :param dict patch_dict: The patch dict to apply
+
+        :returns Response: Returns a response to the caller, or None if the
+                           patch needs the model
+        """
+        resource_class = cls.resource_class
+        values = resource_class.update_values(patch_dict)
+        sparse_fields_to_return, _ = get_sparse_fields(
+            request.query_spec, resource_class)
+        columns = resource_class.row_columns(sparse_fields_to_return)
+        if values is None or columns is None:
+            return None
+
+        id = resource_class.id.deserialize(request.id)
+        resource = dal.update_resource(request.session, resource_class, id,
+                                       values, columns)
+        if resource is None:
+            raise errors.NotFound()
+        resp = Response({
+            "data": resource.serialize(link_prefix=request.link_prefix,
+                                       fields=sparse_fields_to_return),
+            "links": {"self": cls.link(request.link_prefix, request.id)},
+        })
+        cached_id = fragment_id(resource_class, resource)
+        dal.commit(request.session)
+        fragment_cache.FRAGMENT_CACHE.invalidate(
+            resource_class.japi_resource_type, cached_id)
+        cls.after_patch(resp, id)
+        return resp
+
     @classmethod
     def delete(cls, request):
         """
@@ -210,20 +539,133 @@ class ResourceHandler(object):
 
         :returns Response: Returns a response to the caller
         """
+        if cls.can_delete_core():
+            id = cls.resource_class.id.deserialize(request.id)
+            if not dal.delete_resource(request.session, cls.resource_class,
+                                       id):
+                raise errors.NotFound()
+            dal.commit(request.session)
+            fragment_cache.FRAGMENT_CACHE.invalidate(
+                cls.resource_class.japi_resource_type, str(id))
+            resp = Response(None, 204)
+            cls.after_delete(resp, id)
+            return resp
+
         resource = dal.query_resource(
             request.session, cls.resource_class,
             cls.resource_class.id.deserialize(request.id))
         if resource is None:
-            return errors.error_to_response(errors.NotFound())
+            raise errors.NotFound()
 
+        id = fragment_id(cls.resource_class, resource)
         dal.delete(request.session, resource.model)
         dal.commit(request.session)
+        fragment_cache.FRAGMENT_CACHE.invalidate(
+            cls.resource_class.japi_resource_type, id)
         resp = Response(None, 204)
         cls.after_delete(resp, cls.resource_class.id.deserialize(request.id))
         return resp
 
 
 class CollectionHandler(object):
+    # If True, the "data" of GET responses is a generator which the API
+    # adapter serializes resource by resource while sending the body, so
+    # memory use does not grow with the size of the collection.  Note that
+    # errors raised while streaming can no longer become error responses.
+    streaming = False
+
+    # Reads of more than stream_chunk_size rows (unpaginated requests for
+    # small collections, large pages) and all reads of streaming handlers
+    # are fetched from a server-side cursor in chunks of this size, see
+    # dal.query_collection and query_chunk_size.  None turns this off.
+    # Only streaming handlers also serialize chunk by chunk; the others
+    # build the whole document before answering, so that errors still
+    # become error responses.
+    stream_chunk_size = 1000
+
+    # The pagination of GET requests.  Set this to Keyset for cursor based
+    # pagination.  The page sizes are set by the resource class, see
+    # Resource.default_page_size.
+    pagination_class = NumberSize
+
+    # How the total behind NumberSize's "total-pages" is counted, see
+    # dal.CountMode.  For huge tables an estimate is much cheaper than a
+    # COUNT(*); count_cache_ttl is used by CountMode.CACHED.  WINDOW fetches
+    # the page and the total in a single query where the database allows.
+    count_mode = dal.CountMode.EXACT
+    count_cache_ttl = 60
+
+    # GET requests of versioned resources (see Resource.version_column) are
+    # answered with ETag and Last-Modified headers, and conditional ones
+    # with 304 Not Modified, from an aggregate over all the matching
+    # resources.  Conditional requests always run it; unconditional ones
+    # only where it replaces the exact count of NumberSize pagination with
+    # CountMode.EXACT, unless send_validators is True.
+    send_validators = False
+
+    # If True, GET requests select just the mapped columns the serializer
+    # reads and serialize straight from the result rows, skipping the ORM's
+    # model instantiation.  Fieldsets containing a field with a custom fget
+    # or serialization still load models.
+    read_rows = False
+
+    # If True, GET requests serialize the resources through the
+    # fragment_cache.FRAGMENT_CACHE
+    cache_fragments = False
+
+    # If True, POST requests may create many resources at once by sending
+    # an array as primary data.  All of them are created in one transaction,
+    # bulk_post_chunk_size rows per flush, or none if any of them is invalid.
+    bulk_post = False
+    bulk_post_chunk_size = 1000
+
+    # The most ids a batch fetch (GET /<type>?filter[id]=1,2,3, see
+    # get_batch) may ask for
+    max_batch_ids = 500
+
+    @classmethod
+    def read_in_transaction(cls):
+        """
+        Tells the API adapter to run GET requests in a transaction even if
+        it runs reads without one (see BaseAPI.read_isolation_level):
+
+        * Results fetched in chunks (see stream_chunk_size) are read from a
+          server-side cursor, which PostgreSQL only keeps open in a
+          transaction.
+        * The validators of versioned resources are aggregated by a query
+          of their own before the page is read.  In a transaction with
+          snapshot isolation (REPEATABLE READ, the default of MySQL) both
+          see the same data.  Otherwise the page may only be newer than its
+          ETag, which at worst costs the client a needless refetch.
+
+        :returns bool:
+        """
+        resource_class = cls.resource_class
+        max_limit = resource_class.max_page_size or MAX_LIMIT
+        if issubclass(cls.pagination_class, Keyset):
+            # Keyset.limit reads one row more than the page
+            max_limit += 1
+        # The largest limit a GET request reads with, None for all
+        limits = [max_limit]
+        if resource_class.small_collection:
+            limits.append(None)
+        streams = any(cls.query_chunk_size(limit) is not None
+                      for limit in limits)
+        return streams or is_versioned(resource_class)
+
+    @classmethod
+    def query_chunk_size(cls, limit):
+        """
+        :param int limit: The most rows a GET request reads, None for all
+
+        :returns int: The chunk_size to pass dal.query_collection, see
+                      stream_chunk_size
+        """
+        if cls.stream_chunk_size and (cls.streaming or limit is None or
+                                      limit > cls.stream_chunk_size):
+            return cls.stream_chunk_size
+        return None
+
     @classmethod
     def link(cls, link_prefix):
         """
@@ -267,47 +709,236 @@ class CollectionHandler(object):
 
         :returns Response: Returns a response to the caller
         """
-        args = request.query_args.items(multi=True)
+        spec = request.query_spec
+        ids = batch_ids(spec)
+        if ids is not None:
+            return cls.get_batch(request, ids)
+        include_tree = get_include_paths(spec, cls.resource_class)
         sparse_fields_to_return, sparse_fields_for_query = get_sparse_fields(
-            args, cls.resource_class)
-        # args needs to get again because of generator problem.
-        args = request.query_args.items(multi=True)
-        filters = get_filter(args, cls.resource_class)
-        args = request.query_args
-        order_by = get_order_by_fields(args, cls.resource_class)
-        total_number_resources = dal.query_total_number_resources(
-            request.session, cls.resource_class)
+            spec, cls.resource_class,
+            cls.resource_class.japi_resource_type if include_tree else None)
+        sparse_fields_for_query = include_fields(
+            sparse_fields_for_query, cls.resource_class, include_tree)
+        filters = get_filter(spec, cls.resource_class)
+        order_by = get_order_by_fields(spec, cls.resource_class)
+
+        # Requests without "page[...]" parameters get the first page, only
+        # small collections may be fetched in full
+        paginated = not (spec.page.get("size") == ALL and
+                         cls.resource_class.small_collection)
+
+        headers = None
+        total = None
+        # The aggregate behind the validators counts the matching
+        # resources, see send_validators
+        counts_exactly = (paginated and
+                          cls.count_mode == dal.CountMode.EXACT and
+                          not issubclass(cls.pagination_class, Keyset))
+        if is_versioned(cls.resource_class) and not include_tree and (
+                cls.send_validators or counts_exactly or
+                is_conditional(request)):
+            # Answer before loading any rows
+            version, updated_at, max_id, total = \
+                dal.query_collection_version(request.session,
+                                             cls.resource_class, filters)
+            headers = validator_headers(request, cls.resource_class, version,
+                                        updated_at, max_id, total)
+            if not_modified(request, headers, updated_at):
+                return Response(None, 304, headers)
+
+        columns = None
+        if cls.read_rows:
+            columns = include_fields(
+                cls.resource_class.row_columns(sparse_fields_to_return),
+                cls.resource_class, include_tree)
 
         links = {"self": cls.link(request.link_prefix)}
         limit = None
         offset = None
         meta = {}
-        if "page[size]" in args:
-            pagination = NumberSize.from_request(
+        if paginated and issubclass(cls.pagination_class, Keyset):
+            pagination = cls.pagination_class.from_request(
                 request,
                 cls.resource_class.japi_resource_url_component,
-                total_number_resources
+                order_by,
+                cls.resource_class.id.mapped_pk_name,
+                default_size=cls.resource_class.default_page_size,
+                max_size=cls.resource_class.max_page_size
             )
-            offset = pagination.offset
-            limit = pagination.limit
+            dal.check_keyset_order(cls.resource_class, pagination.order_by)
+            # The cursors are made of the values of the sort columns
+            if sparse_fields_for_query:
+                sparse_fields_for_query = sparse_fields_for_query + [
+                    name for name in pagination.key_names
+                    if name not in sparse_fields_for_query]
+            if columns is not None:
+                columns = columns + [name for name in pagination.key_names
+                                     if name not in columns]
+            resources = pagination.paginate(dal.query_collection(
+                request.session, cls.resource_class,
+                sparse_fields_for_query, pagination.order_by, filters,
+                limit=pagination.limit, after=pagination.after,
+                before=pagination.before, columns=columns,
+                chunk_size=cls.query_chunk_size(pagination.limit)))
             links = pagination.json_links()
-            meta = pagination.json_meta()
-
-        resources = dal.query_collection(
-            request.session, cls.resource_class,
-            sparse_fields_for_query, order_by, filters,
-            limit=limit, offset=offset)
-
+        else:
+            pagination = None
+            if paginated:
+                # The total is filled in below, only page based pagination
+                # needs it
+                pagination = cls.pagination_class.from_request(
+                    request,
+                    cls.resource_class.japi_resource_url_component,
+                    None,
+                    default_size=cls.resource_class.default_page_size,
+                    estimated=cls.count_mode not in (dal.CountMode.EXACT,
+                                                     dal.CountMode.WINDOW),
+                    max_size=cls.resource_class.max_page_size
+                )
+                offset = pagination.offset
+                limit = pagination.limit
+            chunk_size = cls.query_chunk_size(limit)
+
+            if pagination is not None and total is not None:
+                # Already counted exactly for the ETag
+                pagination.total_resources = total
+                pagination.estimated = False
+                resources = dal.query_collection(
+                    request.session, cls.resource_class,
+                    sparse_fields_for_query, order_by, filters,
+                    limit=limit, offset=offset, columns=columns,
+                    chunk_size=chunk_size)
+            elif (pagination is not None and
+                    cls.count_mode == dal.CountMode.WINDOW):
+                resources, pagination.total_resources = \
+                    dal.query_collection_with_total(
+                        request.session, cls.resource_class,
+                        sparse_fields_for_query, order_by, filters,
+                        limit=limit, offset=offset, columns=columns)
+            else:
+                if pagination is not None:
+                    pagination.total_resources = \
+                        dal.query_total_number_resources(
+                            request.session, cls.resource_class, filters,
+                            mode=cls.count_mode, ttl=cls.count_cache_ttl)
+                resources = dal.query_collection(
+                    request.session, cls.resource_class,
+                    sparse_fields_for_query, order_by, filters,
+                    limit=limit, offset=offset, columns=columns,
+                    chunk_size=chunk_size)
+            if pagination is not None:
+                links = pagination.json_links()
+                meta = pagination.json_meta()
+
+        included = None
+        if include_tree:
+            # The included resources are loaded for the whole page at once,
+            # so the page cannot be streamed
+            resources = list(resources)
+            included = get_included(request, cls.resource_class, resources,
+                                    include_tree)
+        data = (serialize_resource(r, request.link_prefix,
+                                   sparse_fields_to_return,
+                                   cls.cache_fragments)
+                for r in resources)
+        # Only streaming handlers may fail after the status line is sent,
+        # see stream_chunk_size
         resp_doc = {
-            "data":
-            [r.serialize(
-                link_prefix=request.link_prefix, fields=sparse_fields_to_return
-                ) for r in resources],
+            "data": data if cls.streaming and not include_tree else list(data),
             "links": links,
         }
+        if included is not None:
+            resp_doc["included"] = included
         if meta:
             resp_doc["meta"] = meta
-        return Response(resp_doc)
+        return Response(resp_doc, headers=headers)
+
+    @classmethod
+    def get_batch(cls, request, ids):
+        """
+        Handle a GET request for the resources with the given *ids*, see
+        batch_ids.  They are loaded with a single ``IN`` query and returned
+        in the order of *ids*.  The ids without a resource are listed in
+        the "missing" member of "meta".  Validators and streaming work like
+        in get, but the validators are made from the loaded resources.
+
+        :param Request request: The request being handled
+        :param tuple ids: The requested ids, as strings
+
+        :returns Response: Returns a response to the caller
+        """
+        if cls.resource_class.id.mapped_pk_name is None:
+            # An Id with a custom fget has no column to query
+            raise errors.BadRequest(
+                detail="Resources of type {} cannot be fetched by id in a "
+                       "batch.".format(cls.resource_class.japi_resource_type),
+                source_parameter="filter[id]")
+        if len(ids) > cls.max_batch_ids:
+            raise errors.BadRequest(
+                detail="At most {} resources can be fetched by id at "
+                       "once.".format(cls.max_batch_ids),
+                source_parameter="filter[id]")
+        # Maps the deserialized ids to their first spelling in the request
+        keys = {}
+        for id in ids:
+            try:
+                keys.setdefault(cls.resource_class.id.deserialize(id), id)
+            except errors.BadRequest as err:
+                err.source_parameter = "filter[id]"
+                raise
+
+        spec = request.query_spec
+        include_tree = get_include_paths(spec, cls.resource_class)
+        sparse_fields_to_return, sparse_fields_for_query = get_sparse_fields(
+            spec, cls.resource_class,
+            cls.resource_class.japi_resource_type if include_tree else None)
+        sparse_fields_for_query = include_fields(
+            sparse_fields_for_query, cls.resource_class, include_tree)
+        # Like in get, compound documents get no validators
+        versioned = is_versioned(cls.resource_class) and not include_tree
+        if versioned:
+            sparse_fields_for_query = version_fields(
+                sparse_fields_for_query, cls.resource_class)
+        pk_name = cls.resource_class.id.mapped_pk_name
+        found = {getattr(resource.model, pk_name): resource
+                 for resource in dal.query_resources_by_ids(
+                     request.session, cls.resource_class, list(keys),
+                     sparse_fields_for_query)}
+        resources = [found[key] for key in keys if key in found]
+
+        headers = None
+        if versioned:
+            # Made from the loaded resources, which costs no extra query.
+            # Every found resource adds its id and versions, so updating,
+            # deleting or adding any of them changes the ETag.
+            names = (cls.resource_class.version_column,
+                     cls.resource_class.updated_at_column)
+            rows = [(key,) + tuple(None if name is None else
+                                   getattr(found[key].model, name)
+                                   for name in names)
+                    for key in keys if key in found]
+            updated_at = max((row[2] for row in rows if row[2] is not None),
+                             default=None)
+            headers = validator_headers(request, cls.resource_class, None,
+                                        updated_at, rows)
+            if not_modified(request, headers, updated_at):
+                return Response(None, 304, headers)
+
+        data = (serialize_resource(r, request.link_prefix,
+                                   sparse_fields_to_return,
+                                   cls.cache_fragments)
+                for r in resources)
+        resp_doc = {
+            "data": data if cls.streaming and not include_tree else list(data),
+            "links": {"self": cls.link(request.link_prefix)},
+        }
+        if include_tree:
+            resp_doc["included"] = get_included(
+                request, cls.resource_class, resources, include_tree)
+        missing = [id for key, id in keys.items() if key not in found]
+        if missing:
+            resp_doc["meta"] = {"missing": missing}
+        return Response(resp_doc, headers=headers)
 
     @classmethod
     def post(cls, request):
@@ -324,6 +955,8 @@ class CollectionHandler(object):
             resource_dict = request.body["data"]
         except KeyError:
             raise errors.BadRequest(detail="Missing primary data object")
+        if cls.bulk_post and isinstance(resource_dict, list):
+            return cls.post_bulk(request, resource_dict)
         japi_format_vals.assert_resource_object(
             resource_dict, id_required=False, source_pointer="/data/")
         new_resource = cls.resource_class.deserialize(resource_dict)
@@ -335,8 +968,8 @@ class CollectionHandler(object):
             request.link_prefix,
             cls.resource_class.japi_resource_url_component, new_resource.id)
         links = {"self": link}
-        args = request.query_args.items(multi=True)
-        sparse_fields, _ = get_sparse_fields(args, cls.resource_class)
+        sparse_fields, _ = get_sparse_fields(request.query_spec,
+                                             cls.resource_class)
         resp_doc = {
             "data": new_resource.serialize(link_prefix=request.link_prefix,
                                            fields=sparse_fields),
@@ -347,6 +980,58 @@ class CollectionHandler(object):
         cls.after_post(resp, new_resource.id)
         return resp
 
+    @classmethod
+    def post_bulk(cls, request, resource_dicts):
+        """
+        Handle a POST request creating all the resources in *resource_dicts*.
+        Every resource object is checked before anything is inserted, and
+        the errors of all of them are raised together.  before_post is
+        called for every new resource and after_post for every id.
+
+        :param Request request: The request being handled
+        :param list resource_dicts: The resource objects to create
+
+        :raises ErrorList: If any resource object is invalid, with source
+                           pointers below "/data/<index>"
+
+        :returns Response: Returns a response to the caller
+        """
+        error_list = errors.ErrorList()
+        new_resources = []
+        for index, resource_dict in enumerate(resource_dicts):
+            try:
+                japi_format_vals.assert_resource_object(
+                    resource_dict, id_required=False, source_pointer="/data/")
+                new_resource = cls.resource_class.deserialize(resource_dict)
+                cls.before_post(new_resource)
+                new_resource.validate(Context.CREATE)
+            except (errors.Error, errors.ErrorList) as err:
+                for error in (err.errors if isinstance(err, errors.ErrorList)
+                              else [err]):
+                    error_list.append(error_at_index(error, index))
+            else:
+                new_resources.append(new_resource)
+        if error_list:
+            raise error_list
+        dal.add_all(request.session,
+                    [resource.model for resource in new_resources],
+                    cls.bulk_post_chunk_size)
+        sparse_fields, _ = get_sparse_fields(request.query_spec,
+                                             cls.resource_class)
+        resp_doc = {
+            "data": [resource.serialize(link_prefix=request.link_prefix,
+                                        fields=sparse_fields)
+                     for resource in new_resources],
+            "links": {"self": cls.link(request.link_prefix)},
+        }
+        # Read before the commit expires the models
+        ids = [resource.id for resource in new_resources]
+        dal.commit(request.session)
+        resp = Response(resp_doc, 201)
+        for id in ids:
+            cls.after_post(resp, id)
+        return resp
+
 
 class RelatedHandler(object):
     @classmethod
@@ -372,11 +1057,10 @@ class RelatedHandler(object):
 
         :returns Response: Returns a response to the caller
         """
-        args = request.query_args.items(multi=True)
         related_resource_class = getattr(
             cls.resource_class, request.relationship).related_resource_class
         sparse_fields_to_return, sparse_fields_for_query = get_sparse_fields(
-            args, related_resource_class)
+            request.query_spec, related_resource_class)
         related = dal.query_related(
             request.session, cls.resource_class,
             cls.resource_class.id.deserialize(request.id),
@@ -441,7 +1125,10 @@ class ToOneRelationshipHandler(object):
             cls.resource_class.id.deserialize(request.id))
         rel = cls.resource_class._rels_by_japi_name[request.relationship]
         rel.deserialize_into_obj(resource.model, request.body)
+        id = fragment_id(cls.resource_class, resource)
         dal.commit(request.session)
+        fragment_cache.FRAGMENT_CACHE.invalidate(
+            cls.resource_class.japi_resource_type, id)
         resp = Response(None, 204)
         cls.after_patch(resp, cls.resource_class.id.deserialize(request.id))
         return resp
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017 Petuum, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+jsonapi_framework.json_codec
+============================
+A registry of JSON backends used by utilities.dump_json and
+utilities.load_json.
+
+The fastest installed backend is picked at import time, in the order of
+:data:`JSON_CODEC_FACTORIES` (orjson, rapidjson, ujson, then the standard
+library :mod:`json` module, which is always available).  Use
+:func:`set_json_codec` to pick one explicitly.
+
+Every codec produces UTF-8 encoded ``bytes``, so responses can be sent
+without encoding the body again.
+"""
+import collections
+import json
+
+
+class JSONCodec(object):
+    """
+    Wraps one JSON backend.
+    """
+
+    def __init__(self, name, dumps, loads):
+        """
+        :param str name: Name of the codec
+        :param callable dumps:
+            ``dumps(obj, default, pretty)`` returns *obj* as UTF-8 encoded
+            JSON bytes.  *default* is called for objects the backend cannot
+            serialize natively (or None) and *pretty* asks for indented
+            output with sorted keys.
+        :param callable loads:
+            ``loads(data, object_hook)`` decodes JSON given as ``bytes`` or
+            ``str``.  *object_hook* (or None) is applied to every decoded
+            object, like the argument of the same name of :func:`json.loads`.
+        """
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+
+    def __repr__(self):
+        return "<JSONCodec {}>".format(self.name)
+
+
+def apply_object_hook(obj, object_hook):
+    """
+    Applies *object_hook* bottom up to every dict in the decoded JSON value
+    *obj*, which is what :func:`json.loads` does while decoding.  Used for
+    backends that do not support an object hook themselves.
+    """
+    if isinstance(obj, dict):
+        return object_hook({key: apply_object_hook(value, object_hook)
+                            for key, value in obj.items()})
+    if isinstance(obj, list):
+        return [apply_object_hook(value, object_hook) for value in obj]
+    return obj
+
+
+def _with_object_hook(loads):
+    def loads_with_object_hook(data, object_hook=None):
+        obj = loads(data)
+        if object_hook is not None:
+            obj = apply_object_hook(obj, object_hook)
+        return obj
+    return loads_with_object_hook
+
+
+def _orjson_codec():
+    import orjson
+
+    def dumps(obj, default, pretty):
+        option = orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS if pretty else 0
+        if default is not None:
+            # Give datetimes to *default* like the other backends do
+            option |= orjson.OPT_PASSTHROUGH_DATETIME
+        return orjson.dumps(obj, default=default, option=option)
+
+    return JSONCodec("orjson", dumps, _with_object_hook(orjson.loads))
+
+
+def _rapidjson_codec():
+    import rapidjson
+
+    def dumps(obj, default, pretty):
+        return rapidjson.dumps(obj, default=default,
+                               indent=4 if pretty else None,
+                               sort_keys=pretty).encode("utf-8")
+
+    return JSONCodec("rapidjson", dumps, _with_object_hook(rapidjson.loads))
+
+
+def _ujson_codec():
+    import ujson
+
+    def dumps(obj, default, pretty):
+        return ujson.dumps(obj, default=default, indent=4 if pretty else 0,
+                           sort_keys=pretty,
+                           ensure_ascii=False).encode("utf-8")
+
+    return JSONCodec("ujson", dumps, _with_object_hook(ujson.loads))
+
+
+def _stdlib_codec():
+    def dumps(obj, default, pretty):
+        return json.dumps(obj, default=default, indent=4 if pretty else None,
+                          sort_keys=pretty).encode("utf-8")
+
+    def loads(data, object_hook=None):
+        return json.loads(data, object_hook=object_hook)
+
+    return JSONCodec("json", dumps, loads)
+
+
+# Factories in order of preference.  A factory raises ImportError if its
+# backend is not installed.
+JSON_CODEC_FACTORIES = collections.OrderedDict([
+    ("orjson", _orjson_codec),
+    ("rapidjson", _rapidjson_codec),
+    ("ujson", _ujson_codec),
+    ("json", _stdlib_codec),
+])
+
+
+def register_json_codec(name, factory, preferred=False):
+    """
+    Registers a codec factory.
+
+    :param str name: Name of the codec
+    :param callable factory:
+        Called without arguments, returns a :class:`JSONCodec` or raises
+        ImportError if the backend is not available.
+    :param bool preferred:
+        If True, the codec is tried before all the others when the codec is
+        picked automatically.
+    """
+    JSON_CODEC_FACTORIES[name] = factory
+    if preferred:
+        JSON_CODEC_FACTORIES.move_to_end(name, last=False)
+
+
+def available_json_codecs():
+    """
+    :returns JSONCodec list: Every codec whose backend is installed, in order
+                             of preference.
+    """
+    codecs = []
+    for factory in JSON_CODEC_FACTORIES.values():
+        try:
+            codecs.append(factory())
+        except ImportError:
+            pass
+    return codecs
+
+
+def get_json_codec(name=None):
+    """
+    :param str name: Name of the codec, or None for the preferred codec that
+                     is installed.
+
+    :raises KeyError: If no codec of that name is registered
+    :raises ImportError: If the backend of that codec is not installed
+
+    :returns JSONCodec:
+    """
+    if name is not None:
+        return JSON_CODEC_FACTORIES[name]()
+    for factory in JSON_CODEC_FACTORIES.values():
+        try:
+            return factory()
+        except ImportError:
+            pass
+    raise ImportError("No JSON codec is available")
+
+
+def set_json_codec(name=None):
+    """
+    Selects the codec used by utilities.dump_json and utilities.load_json.
+
+    :param str name: See :func:`get_json_codec`
+    """
+    global JSON_CODEC
+    JSON_CODEC = get_json_codec(name)
+
+
+JSON_CODEC = get_json_codec()
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017 Petuum, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+jsonapi_framework.operations
+============================
+Handles the requests of the JSON API atomic operations extension
+(https://jsonapi.org/ext/atomic/): a POST whose body is an array of
+operations, which are all applied in one transaction or not at all::
+
+    {"atomic:operations": [
+        {"op": "add",
+         "data": {"type": "company", "lid": "c",
+                  "attributes": {"name": "acme"}}},
+        {"op": "add",
+         "data": {"type": "person", "attributes": {"name": "ann"},
+                  "relationships": {
+                      "company": {"data": {"type": "company",
+                                           "lid": "c"}}}}},
+        {"op": "remove", "ref": {"type": "person", "id": "7"}}
+    ]}
+
+Every operation is dispatched to the handler of the equivalent request, so
+hooks and validators run as usual:
+
+*   *add* - POST to the collection, or to the relationship of *ref*
+*   *update* - PATCH of the resource, or of the relationship of *ref*
+*   *remove* - DELETE of the resource, or of the relationship of *ref*
+
+A resource added with a local id (``"lid"``) can be referred to by it in
+the operations that follow.  The response holds the primary data of each
+operation in ``"atomic:results"``.
+"""
+import jsonapi_framework.errors as errors
+import jsonapi_framework.sqlalchemy_dal as dal
+from jsonapi_framework.handler import handle
+from jsonapi_framework.request import Request, RequestType
+from jsonapi_framework.response import Response
+
+# The media type of the responses, with the extension
+ATOMIC_MIMETYPE = \
+    'application/vnd.api+json; ext="https://jsonapi.org/ext/atomic"'
+
+# The HTTP methods of the operations
+_METHODS = {
+    "add": "post",
+    "update": "patch",
+    "remove": "delete"
+}
+
+
+def error_at_operation(error, index):
+    """
+    Moves the source pointer of *error*, raised for the request made by an
+    operation, below the operation at *index*.
+
+    :param Error error:
+    :param int index:
+
+    :returns Error: *error*
+    """
+    pointer = error.source_pointer
+    prefix = "/atomic:operations/{}".format(index)
+    if pointer and pointer != "None" and pointer.startswith("/"):
+        error.source_pointer = prefix + pointer
+    else:
+        error.source_pointer = prefix
+    return error
+
+
+def error_from_response(response):
+    """
+    Turns the error *response* a handler returned (instead of raising an
+    Error) back into the errors of its body.
+
+    :param Response response: A response with a status of 400 or above
+
+    :returns ErrorList: The errors
+    """
+    body = response.body if isinstance(response.body, dict) else {}
+    error_list = errors.ErrorList()
+    for error in body.get("errors") or [{}]:
+        source = error.get("source") or {}
+        error_list.append(errors.Error(
+            http_status=error.get("status", response.status),
+            code=error.get("code"),
+            title=error.get("title"),
+            detail=error.get("detail", ""),
+            source_parameter=source.get("parameter"),
+            source_pointer=source.get("pointer"),
+            meta=error.get("meta")))
+    return error_list
+
+
+def resolve_lid(identifier, lids, pointer):
+    """
+    Replaces the local id of a resource identifier with the id of the
+    resource created for it.
+
+    :param dict identifier: A resource identifier
+    :param dict lids: Maps (type, local id) to the ids of the resources
+                      added so far
+    :param str pointer: The source pointer of *identifier*
+
+    :returns dict: The identifier with an id
+    :raises BadRequest: If the local id is unknown
+    """
+    if not isinstance(identifier, dict) or "lid" not in identifier or \
+            "id" in identifier:
+        return identifier
+    key = (identifier.get("type"), identifier["lid"])
+    if key not in lids:
+        raise errors.BadRequest(
+            detail="Unknown local id '{}'.".format(identifier["lid"]),
+            source_pointer=pointer + "/lid")
+    resolved = {name: value for name, value in identifier.items()
+                if name != "lid"}
+    resolved["id"] = lids[key]
+    return resolved
+
+
+def resolve_relationship_lids(data, lids, pointer):
+    """
+    Replaces the local ids in the relationships of the resource object
+    *data*, see resolve_lid.
+
+    :returns dict: *data*, or a copy if it had local ids
+    """
+    relationships = data.get("relationships")
+    if not isinstance(relationships, dict):
+        return data
+    resolved = {}
+    for name, relationship in relationships.items():
+        linkage = relationship.get("data") \
+            if isinstance(relationship, dict) else None
+        linkage_pointer = "{}/relationships/{}/data".format(pointer, name)
+        if isinstance(linkage, list):
+            linkage = [resolve_lid(identifier, lids,
+                                   "{}/{}".format(linkage_pointer, i))
+                       for i, identifier in enumerate(linkage)]
+        elif linkage is not None:
+            linkage = resolve_lid(linkage, lids, linkage_pointer)
+        else:
+            resolved[name] = relationship
+            continue
+        resolved[name] = dict(relationship, data=linkage)
+    return dict(data, relationships=resolved)
+
+
+class OperationsHandler(object):
+    """
+    The handler of ``POST /operations``.  The API adapter sets *handler_map*
+    to its map of URL components to the handlers of the resources.
+    """
+    handler_map = None
+
+    # The most operations a request may have
+    max_operations = 1000
+
+    @classmethod
+    def handlers_by_type(cls):
+        """
+        :returns dict: Maps the resource types to the request type maps of
+                       *handler_map*
+        """
+        by_type = {}
+        for resource_map in cls.handler_map.values():
+            for handler in resource_map.values():
+                if isinstance(handler, type):
+                    by_type[handler.resource_class.japi_resource_type] = \
+                        resource_map
+                    break
+        return by_type
+
+    @classmethod
+    def post(cls, request):
+        """
+        Handle a POST request with atomic operations
+
+        :param Request request: The request being handled
+
+        :returns Response: Returns a response to the caller
+        """
+        operations = request.body.get("atomic:operations") \
+            if isinstance(request.body, dict) else None
+        if not isinstance(operations, list) or not operations:
+            raise errors.BadRequest(
+                detail="The request must have a non-empty array of "
+                       "atomic:operations.",
+                source_pointer="/atomic:operations")
+        if len(operations) > cls.max_operations:
+            raise errors.BadRequest(
+                detail="A request can have at most {} operations.".format(
+                    cls.max_operations),
+                source_pointer="/atomic:operations")
+
+        handlers = cls.handlers_by_type()
+        lids = {}
+        results = []
+        # A failed operation fails the request, which the API adapter then
+        # rolls back as a whole
+        with dal.atomic(request.session):
+            for index, operation in enumerate(operations):
+                try:
+                    results.append(cls.run_operation(
+                        request, handlers, operation, lids))
+                except errors.Error as err:
+                    raise error_at_operation(err, index)
+                except errors.ErrorList as err:
+                    for error in err.errors:
+                        error_at_operation(error, index)
+                    raise
+        dal.commit(request.session)
+        if not any(results):
+            return Response(None, 204)
+        return Response({"atomic:results": results},
+                        headers={"Content-Type": ATOMIC_MIMETYPE})
+
+    @classmethod
+    def run_operation(cls, request, handlers, operation, lids):
+        """
+        Runs a single *operation* by handling the equivalent request.
+
+        :param Request request: The request with the operations
+        :param dict handlers: The result of handlers_by_type
+        :param dict operation: The operation
+        :param dict lids: Maps (type, local id) to the ids of the resources
+                          added so far; the resource this operation adds is
+                          added to it
+
+        :returns dict: The result of the operation
+        """
+        if not isinstance(operation, dict):
+            raise errors.BadRequest(detail="An operation must be an object.")
+        if "href" in operation:
+            raise errors.BadRequest(
+                detail="Operations must target their resource with 'ref'.",
+                source_pointer="/href")
+        op = operation.get("op")
+        if op not in _METHODS:
+            raise errors.BadRequest(
+                detail="Unknown operation '{}'.".format(op),
+                source_pointer="/op")
+        ref = resolve_lid(operation.get("ref"), lids, "/ref")
+        if ref is not None and not isinstance(ref, dict):
+            raise errors.BadRequest(detail="'ref' must be an object.",
+                                    source_pointer="/ref")
+        data = operation.get("data")
+        lid = None
+        if isinstance(data, dict):
+            if op == "add" and ref is None:
+                lid = data.get("lid")
+                data = {name: value for name, value in data.items()
+                        if name != "lid"}
+            else:
+                data = resolve_lid(data, lids, "/data")
+            data = resolve_relationship_lids(data, lids, "/data")
+        elif isinstance(data, list):
+            data = [resolve_lid(identifier, lids, "/data/{}".format(i))
+                    for i, identifier in enumerate(data)]
+
+        target = ref if ref is not None else data
+        if not isinstance(target, dict):
+            raise errors.BadRequest(
+                detail="The operation has no target resource.",
+                source_pointer="/ref")
+        resource_map = handlers.get(target.get("type"))
+        if resource_map is None:
+            raise errors.BadRequest(
+                detail="Unknown resource type '{}'.".format(
+                    target.get("type")),
+                source_pointer="/ref/type" if ref is not None
+                else "/data/type")
+        id = target.get("id")
+        relationship = ref.get("relationship") if ref is not None else None
+        if relationship is not None:
+            request_type = RequestType.RELATIONSHIP
+            handler = resource_map.get(request_type, {}).get(relationship)
+        elif op == "add":
+            request_type = RequestType.COLLECTION
+            handler = resource_map.get(request_type)
+            id = None
+        else:
+            request_type = RequestType.RESOURCE
+            handler = resource_map.get(request_type)
+        if handler is None:
+            raise errors.NotFound()
+        if request_type != RequestType.COLLECTION and id is None:
+            raise errors.BadRequest(
+                detail="The operation has no target id.",
+                source_pointer="/ref")
+
+        response = handle(handler, Request(
+            request_type, {}, _METHODS[op], request.link_prefix,
+            request.session, {}, {"data": data} if "data" in operation
+            else None, id=None if id is None else str(id),
+            relationship=relationship, query_string=""))
+        if response.status >= 400:
+            # Committing the other operations would break atomicity
+            raise error_from_response(response)
+        body = response.body
+        if lid is not None:
+            lids[(target.get("type"), lid)] = body["data"]["id"]
+        if isinstance(body, dict) and "data" in body:
+            return {"data": body["data"]}
+        return {}
@@ -42,13 +42,53 @@ jsonapi_framework.pagination
 Contains Pagination classes, which currently performs
 JSON API pagination function.
 """
+import base64
+import binascii
+import datetime
+import decimal
 import math
 import urllib.parse
+import uuid
 
+import jsonapi_framework.json_codec as json_codec
+from jsonapi_framework.errors import BadRequest
 from jsonapi_framework.utilities import check_number, link_for_pagination
 
 
+# The page size used when a request has no "page[size]", and the largest
+# page size a request may ask for.  Larger sizes are clamped to MAX_LIMIT.
+# Resources can override both, see Resource.default_page_size.
 DEFAULT_LIMIT = 25
+MAX_LIMIT = 1000
+
+# The "page[size]" asking for the whole collection in one response.  It is
+# only honored for resources with Resource.small_collection set, and means
+# the maximum page size for all others.
+ALL = "all"
+
+
+def page_size(value, default_size=None, max_size=None, allow_all=False):
+    """
+    Parses a "page[size]" parameter.
+
+    :param str value: The parameter, None if it is missing
+    :param int default_size: The size if *value* is missing or empty,
+                             DEFAULT_LIMIT if None
+    :param int max_size: Larger sizes are clamped to it, MAX_LIMIT if None
+    :param bool allow_all: Whether ALL may ask for the whole collection
+
+    :raises BadRequest: If *value* is not a positive integer or ALL
+
+    :returns int: The page size, None for the whole collection
+    """
+    if max_size is None:
+        max_size = MAX_LIMIT
+    if default_size is None:
+        default_size = DEFAULT_LIMIT
+    if value == ALL:
+        return None if allow_all else max_size
+    size = check_number(value, 'page[size]')
+    return min(size or default_size, max_size)
 
 
 class BasePagination(object):
@@ -121,7 +161,7 @@ class NumberSize(BasePagination):
         /Article/?sort=date_added&page[size]=5&page[number]=10
     """
     def __init__(self, link_prefix, japi_resource_url_component,
-                 args, number, size, total_resources):
+                 args, number, size, total_resources, estimated=False):
         """
         :param link_prefix: Link prefix.
         :param japi_resource_url_component: Name of the resources.
@@ -129,7 +169,9 @@ class NumberSize(BasePagination):
         :param number: The number of the current page.
         :param size: The number of resources on a page.
         :param total_resources:
-        The total number of resources in the collection.
+        The total number of resources in the collection.  May be None and
+        set later, before the links and the meta are built.
+        :param estimated: Whether *total_resources* is only an estimate.
         """
         super().__init__(link_prefix,
                          japi_resource_url_component,
@@ -137,23 +179,30 @@ class NumberSize(BasePagination):
                          )
         assert number > 0
         assert size > 0
-        assert total_resources >= 0
+        assert total_resources is None or total_resources >= 0
 
         self.number = number
         self.size = size
         self.total_resources = total_resources
+        self.estimated = estimated
 
     @classmethod
     def from_request(cls, request, japi_resource_url_component,
-                     total_resources, default_size=DEFAULT_LIMIT):
+                     total_resources, default_size=None, estimated=False,
+                     max_size=None):
+        """
+        A missing "page[number]" means the first page, a missing
+        "page[size]" *default_size*.  Sizes above *max_size* are clamped,
+        see :func:`page_size`.
+        """
         number = request.query_args.get('page[number]')
-        number = check_number(number, 'page[number]')
+        number = check_number(number, 'page[number]') or 1
 
-        size = request.query_args.get('page[size]')
-        size = check_number(size, 'page[size]')
-        size = default_size if size == 0 else size
+        size = page_size(request.query_args.get('page[size]'),
+                         default_size, max_size)
         return cls(request.link_prefix, japi_resource_url_component,
-                   request.query_args, number, size, total_resources)
+                   request.query_args, number, size, total_resources,
+                   estimated)
 
     @property
     def last_page(self):
@@ -204,4 +253,216 @@ class NumberSize(BasePagination):
         """
         d = dict()
         d["total-pages"] = self.last_page
+        if self.estimated:
+            d["total-pages-estimated"] = True
+        return d
+
+
+# Types that have no JSON representation, mapped to a tag and the functions
+# converting them to and from a string
+_CURSOR_TYPES = [
+    (datetime.datetime, "dt", datetime.datetime.isoformat,
+     datetime.datetime.fromisoformat),
+    (datetime.date, "d", datetime.date.isoformat,
+     datetime.date.fromisoformat),
+    (decimal.Decimal, "dec", str, decimal.Decimal),
+    (uuid.UUID, "uuid", str, uuid.UUID),
+]
+
+
+def encode_cursor(values):
+    """
+    Encodes a list of column values into an opaque, URL safe cursor.
+
+    :param list values: The values of the keyset columns of a row
+
+    :returns str: The cursor
+    """
+    encoded = []
+    for value in values:
+        for type_, tag, to_str, _ in _CURSOR_TYPES:
+            if isinstance(value, type_):
+                value = {tag: to_str(value)}
+                break
+        encoded.append(value)
+    data = json_codec.JSON_CODEC.dumps(encoded, None, False)
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor, length, parameter):
+    """
+    Decodes a cursor created by :func:`encode_cursor`.
+
+    :param str cursor: The cursor
+    :param int length: The number of values the cursor must contain
+    :param str parameter: The query parameter the cursor came from
+
+    :raises BadRequest: If the cursor is malformed
+
+    :returns list: The column values
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json_codec.JSON_CODEC.loads(data, None)
+        if not isinstance(values, list) or len(values) != length:
+            raise ValueError()
+        decoded = []
+        for value in values:
+            if isinstance(value, dict):
+                (tag, string), = value.items()
+                value = next(from_str(string)
+                             for _, type_tag, _, from_str in _CURSOR_TYPES
+                             if type_tag == tag)
+            decoded.append(value)
+    except (ValueError, TypeError, StopIteration, binascii.Error):
+        raise BadRequest(detail="The '%s' cursor is invalid." % parameter,
+                         source_parameter=parameter)
+    return decoded
+
+
+class Keyset(BasePagination):
+    """
+    Implements a keyset (cursor) pagination based on *after*, *before* and
+    *size* values.
+    eg:
+        /Article/?sort=date_added&page[size]=5&page[after]=WyIyMDE3Il0
+
+    A cursor encodes the values of the sort columns plus the primary key of
+    the row it was taken from.  The next page is then fetched with an
+    indexable ``WHERE (sort columns, primary key) > (cursor values)``
+    instead of an OFFSET, so deep pages cost as much as the first one and no
+    total count is needed.
+
+    The primary key is always added to the sort order to make it total.
+    The sort columns must be NOT NULL, see
+    :func:`jsonapi_framework.sqlalchemy_dal.check_keyset_order`.
+    """
+    def __init__(self, link_prefix, japi_resource_url_component,
+                 args, size, order_by, after=None, before=None):
+        """
+        :param link_prefix: Link prefix.
+        :param japi_resource_url_component: Name of the resources.
+        :param args: The request arguments.
+        :param size: The number of resources on a page.
+        :param order_by: The sort order, including the primary key, in the
+                         format returned by get_order_by_fields.
+        :param after: The decoded *after* cursor, if any.
+        :param before: The decoded *before* cursor, if any.
+        """
+        super().__init__(link_prefix,
+                         japi_resource_url_component,
+                         args
+                         )
+        assert size > 0
+        assert after is None or before is None
+
+        self.size = size
+        self.order_by = order_by
+        self.after = after
+        self.before = before
+        self.first_values = None
+        self.last_values = None
+        self.has_more = False
+
+    @classmethod
+    def from_request(cls, request, japi_resource_url_component, order_by,
+                     pk_name, default_size=None, max_size=None):
+        """
+        A missing "page[size]" means *default_size*.  Sizes above
+        *max_size* are clamped, see :func:`page_size`.
+
+        :raises TypeError: If *pk_name* is None, as the primary key makes
+                           the sort order total
+        """
+        if pk_name is None:
+            raise TypeError(
+                "Keyset pagination needs the Id of the resource to map to a "
+                "primary key column (mapped_pk_name), not a custom fget")
+        size = page_size(request.query_args.get('page[size]'),
+                         default_size, max_size)
+
+        order_by = list(order_by)
+        if pk_name not in order_by and "-" + pk_name not in order_by:
+            order_by.append(pk_name)
+
+        after = request.query_args.get('page[after]')
+        before = request.query_args.get('page[before]')
+        if after and before:
+            raise BadRequest(
+                detail="Only one of 'page[after]' and 'page[before]' may "
+                       "be given.",
+                source_parameter="page[before]")
+        if after:
+            after = decode_cursor(after, len(order_by), 'page[after]')
+        if before:
+            before = decode_cursor(before, len(order_by), 'page[before]')
+        return cls(request.link_prefix, japi_resource_url_component,
+                   request.query_args, size, order_by, after or None,
+                   before or None)
+
+    @property
+    def limit(self):
+        """
+        The limit to query with: one more than the page :attr:`size`, to find
+        out if there is another page after this one.
+        """
+        return self.size + 1
+
+    @property
+    def key_names(self):
+        """
+        The names of the columns the cursors are made of.
+        """
+        return [name.lstrip("-") for name in self.order_by]
+
+    def paginate(self, resources):
+        """
+        Cuts the resources queried with :attr:`limit` down to the page and
+        remembers the cursors of its first and last resource.
+
+        :param resources: The resources, in page order.
+
+        :returns list: The resources on this page.
+        """
+        resources = list(resources)
+        self.has_more = len(resources) > self.size
+        if self.has_more:
+            # When paging backwards the extra resource is the first one
+            if self.before is not None:
+                resources = resources[1:]
+            else:
+                resources = resources[:-1]
+        if resources:
+            self.first_values = [getattr(resources[0].model, name)
+                                 for name in self.key_names]
+            self.last_values = [getattr(resources[-1].model, name)
+                                for name in self.key_names]
+        return resources
+
+    def page_link(self, pagination):
+        for key in ("page[after]", "page[before]"):
+            self._query.pop(key, None)
+        return super().page_link(pagination)
+
+    def json_links(self):
+        d = dict()
+        pagination = {"size": self.size}
+        if self.after is not None:
+            d["self"] = self.page_link(
+                dict(pagination, after=encode_cursor(self.after)))
+        elif self.before is not None:
+            d["self"] = self.page_link(
+                dict(pagination, before=encode_cursor(self.before)))
+        else:
+            d["self"] = self.page_link(pagination)
+        d["first"] = self.page_link(pagination)
+        if self.first_values is not None and (
+                self.after is not None or
+                (self.before is not None and self.has_more)):
+            d["prev"] = self.page_link(
+                dict(pagination, before=encode_cursor(self.first_values)))
+        if self.last_values is not None and (
+                self.before is not None or self.has_more):
+            d["next"] = self.page_link(
+                dict(pagination, after=encode_cursor(self.last_values)))
         return d
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017 Petuum, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+jsonapi_framework.query_spec
+============================
+Parses the JSON API query parameters of a request (``fields[TYPE]``,
+``include``, ``sort``, ``filter[FIELD][OP]`` and ``page[...]``) once into an
+immutable :class:`QuerySpec`.
+
+Query strings are parsed by :func:`parse_query_string`, which caches its
+results, so a query string repeated by polling clients is only parsed the
+first time.  Query strings longer than :data:`MAX_QUERY_STRING_LENGTH` or
+with more than :data:`MAX_PARAMETERS` parameters are rejected.
+"""
+import functools
+import re
+import types
+import urllib.parse
+
+from jsonapi_framework.errors import BadRequest
+
+MAX_QUERY_STRING_LENGTH = 8192
+MAX_PARAMETERS = 256
+
+_BRACKETED_RE = re.compile(
+    r"(fields|filter|page)\[([A-Za-z0-9_]+)\](?:\[([A-Za-z0-9_]+)\])?")
+
+
+def split_str_on_comma(value):
+    """
+    Splits *value* on the commas which are not escaped by a '\\'.  The
+    escaping '\\' are removed and empty items are left out.  This takes
+    linear time in the length of *value*.
+
+    example:
+    Raw string "hello,world\\,hello\\\\,again\\\\\\,world" will be
+    ["hello", "world,hello\\", "again\\,world"].
+
+    :param str value: The string to split
+    :returns list: The items
+    """
+    result = []
+    item = []
+    characters = iter(value)
+    for character in characters:
+        if character == "\\":
+            # A trailing '\' escapes nothing and is kept
+            item.append(next(characters, "\\"))
+        elif character == ",":
+            if item:
+                result.append("".join(item))
+                item = []
+        else:
+            item.append(character)
+    if item:
+        result.append("".join(item))
+    return result
+
+
+class QuerySpec(object):
+    """
+    The JSON API query parameters of a request.  Instances are immutable, so
+    they can be shared by all the requests with the same query string.
+
+    *   *fields*
+        Maps each type of a ``fields[TYPE]`` parameter to the tuple of the
+        field names
+    *   *include*
+        The tuple of the include paths, as strings
+    *   *sort*
+        The tuple of the sort fields, prefixed with '-' for descending order
+    *   *filters*
+        A tuple of (field name, operator, tuple of values) for every
+        ``filter[FIELD]`` and ``filter[FIELD][OP]`` parameter with a value,
+        in order.  The operator is None for ``filter[FIELD]``.
+    *   *page*
+        Maps the names of the ``page[NAME]`` parameters to their values
+    """
+
+    __slots__ = ("fields", "include", "sort", "filters", "page")
+
+    def __init__(self, fields=None, include=(), sort=(), filters=(),
+                 page=None):
+        object.__setattr__(self, "fields",
+                           types.MappingProxyType(dict(fields or {})))
+        object.__setattr__(self, "include", tuple(include))
+        object.__setattr__(self, "sort", tuple(sort))
+        object.__setattr__(self, "filters", tuple(filters))
+        object.__setattr__(self, "page",
+                           types.MappingProxyType(dict(page or {})))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("QuerySpec objects are immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("QuerySpec objects are immutable")
+
+    def __repr__(self):
+        return ("QuerySpec(fields={!r}, include={!r}, sort={!r}, "
+                "filters={!r}, page={!r})").format(
+                    dict(self.fields), self.include, self.sort, self.filters,
+                    dict(self.page))
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        """
+        Parses the (key, value) *pairs* of the query parameters.  For
+        parameters that may only appear once (``include``, ``sort`` and
+        ``page[...]``) the first value is used.
+
+        :raises BadRequest: If there are more than MAX_PARAMETERS pairs
+        """
+        fields = {}
+        include = None
+        sort = None
+        filters = []
+        page = {}
+        for count, (key, value) in enumerate(pairs, 1):
+            if count > MAX_PARAMETERS:
+                raise BadRequest(
+                    detail="There are more than {} query parameters.".format(
+                        MAX_PARAMETERS))
+            if key == "include":
+                if include is None:
+                    include = [path.strip() for path
+                               in split_str_on_comma(value) if path.strip()]
+                continue
+            if key == "sort":
+                if sort is None:
+                    sort = split_str_on_comma(value)
+                continue
+            match = _BRACKETED_RE.fullmatch(key)
+            if match is None:
+                continue
+            family, name, op = match.groups()
+            if op is not None and family != "filter":
+                continue
+            if family == "fields":
+                names = fields.setdefault(name, [])
+                names.extend(field.strip() for field
+                             in split_str_on_comma(value) if field.strip())
+            elif family == "filter":
+                values = split_str_on_comma(value)
+                if values:
+                    filters.append((name, op, tuple(values)))
+            else:
+                page.setdefault(name, value)
+        return cls({name: tuple(names) for name, names in fields.items()},
+                   include or (), sort or (), filters, page)
+
+    @classmethod
+    def from_args(cls, args):
+        """
+        Parses query parameters which were already decoded, e.g. a werkzeug
+        MultiDict.
+        """
+        try:
+            pairs = args.items(multi=True)
+        except TypeError:
+            pairs = args.items()
+        return cls.from_pairs(pairs)
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_query_string(query_string):
+    """
+    Parses the raw (still percent-encoded) *query_string*.  The results are
+    cached, see ``parse_query_string.cache_info()``.
+
+    :raises BadRequest: If the query string exceeds the limits
+
+    :returns QuerySpec:
+    """
+    if len(query_string) > MAX_QUERY_STRING_LENGTH:
+        raise BadRequest(
+            detail="The query string is longer than {} characters.".format(
+                MAX_QUERY_STRING_LENGTH))
+    return QuerySpec.from_pairs(
+        urllib.parse.parse_qsl(query_string, keep_blank_values=True))
@@ -45,6 +45,8 @@ TODO
 # std
 from enum import Enum, auto
 
+from jsonapi_framework.query_spec import QuerySpec, parse_query_string
+
 # TODO: Documentation
 # TODO: Make immutable with properties
 
@@ -54,6 +56,7 @@ class RequestType(Enum):
     COLLECTION = auto()
     RELATED = auto()
     RELATIONSHIP = auto()
+    OPERATIONS = auto()
 
 
 class Request(object):
@@ -63,7 +66,7 @@ class Request(object):
 
     def __init__(self, request_type, query_args, method,
                  link_prefix, session, headers, body, id=None,
-                 relationship=None):
+                 relationship=None, query_string=None, session_callable=None):
         """
         :param RequestType request_type: What kind of request it is
         :param dict query_args: Query string arguments
@@ -71,19 +74,66 @@ class Request(object):
         :param str link_prefix:
             What to prepend to JSON API paths when making links
         :param str session:
-            Session object to pass to the DAL
+            Session object to pass to the DAL, or None to create it with
+            *session_callable* when :attr:`session` is first accessed
         :param dict headers: HTTP headers
         :param dict body: Parsed JSON request body
         :param dict id: The id
         :param str relationship:
+        :param str query_string:
+            The raw query string *query_args* were decoded from.  If given,
+            :attr:`query_spec` is looked up by it in the cache of
+            query_spec.parse_query_string.
+        :param callable session_callable:
+            Creates the session if *session* is None
         """
         self.request_type = request_type
         self.query_args = query_args
         self.method = method.lower()
         self.link_prefix = link_prefix
-        self.session = session
+        self._session = session
+        self._session_callable = session_callable
         # TODO: throw error if header does not match
         self.headers = headers
         self.body = body
         self.id = id
         self.relationship = relationship
+        self.query_string = query_string
+        self._query_spec = None
+
+    @property
+    def session(self):
+        """
+        The session to pass to the DAL.  Created on first access if the
+        adapter passed a session_callable, so requests which never touch it
+        (e.g. errors found while routing) do not check out a connection.
+        """
+        if self._session is None and self._session_callable is not None:
+            self._session = self._session_callable()
+        return self._session
+
+    @session.setter
+    def session(self, session):
+        self._session = session
+
+    @property
+    def has_session(self):
+        """
+        Whether :attr:`session` exists, i.e. has been accessed or passed in
+        """
+        return self._session is not None
+
+    @property
+    def query_spec(self):
+        """
+        The parsed JSON API query parameters, see query_spec.QuerySpec.
+        Parsed on first access.
+
+        :raises BadRequest: If the query parameters exceed the limits
+        """
+        if self._query_spec is None:
+            if self.query_string is not None:
+                self._query_spec = parse_query_string(self.query_string)
+            else:
+                self._query_spec = QuerySpec.from_args(self.query_args)
+        return self._query_spec
@@ -99,11 +99,11 @@ Functions that work with JSON (see utilities.py)
 """
 import copy
 import itertools
+import keyword
 import logging
 
 import jsonapi_framework.errors as errors
-from jsonapi_framework.utilities import (link_for_resource, link_for_related,
-                                         link_for_relationship)
+from jsonapi_framework.utilities import link_for_related, link_for_relationship
 from jsonapi_framework.context import ALWAYS_SET, Context
 from six import with_metaclass
 
@@ -542,6 +542,134 @@ class Id(BaseField):
         self._fset(model, self.deserialize(value))
 
 
+def _model_access(name):
+    """
+    Source code reading the column *name* off a variable called ``model``.
+    """
+    if name.isidentifier() and not keyword.iskeyword(name):
+        return "model." + name
+    return "getattr(model, {!r})".format(name)
+
+
+def _plain_column(field):
+    """
+    The name of the column *field* is read from by the default accessor, or
+    None if the field has a custom fget or overrides its serialization.
+    """
+    field_class = type(field)
+    if isinstance(field, Id):
+        if field_class.serialize is Id.serialize:
+            return field.mapped_pk_name
+    elif isinstance(field, Attribute):
+        if field_class.serialize is Attribute.serialize:
+            return field.mapped_attribute_name
+    elif isinstance(field, ToOneRelationship):
+        if (field_class.serialize is ToOneRelationship.serialize and
+                field_class.relationship_link is
+                Relationship.relationship_link and
+                field_class.related_link is Relationship.related_link):
+            return field.mapped_fk_name
+    return None
+
+
+def compile_serializer(resource_class, fields=None):
+    """
+    Generates a serializer specialized for *resource_class* and the sparse
+    fieldset *fields*.
+
+    The generated function is called as ``serializer(model, link_prefix)``
+    and returns the same dict Resource.serialize documents.  The field list,
+    the resource type and the constant fragments of every link are baked
+    into its source, so serializing a row is a straight line of attribute
+    reads and string concatenations instead of a loop over the field maps.
+
+    Fields using the default getattr based accessors are read directly off
+    the model.  Fields with a custom fget, or whose class overrides the
+    serialization methods, are still called through the field object.
+
+    :param Resource class resource_class: The resource class to compile for
+    :param str set fields: The sparse fieldset, None means every field
+
+    :returns callable: The serializer
+    """
+    namespace = {}
+    lines = ["def serialize(model, link_prefix):"]
+
+    id_field = resource_class.id
+    if _plain_column(id_field):
+        lines.append("    id = str({})".format(
+            _model_access(id_field.mapped_pk_name)))
+        link_id = "id"
+    else:
+        namespace["id_field"] = id_field
+        lines.append("    id = id_field.serialize(model)")
+        lines.append("    link_id = str(id_field._fget(model))")
+        link_id = "link_id"
+
+    lines.append("    ret = {")
+    lines.append("        'id': id,")
+    lines.append("        'type': {!r},".format(
+        resource_class.japi_resource_type))
+    lines.append(
+        "        'links': {{'self': link_prefix + {!r} + {}}},".format(
+            "/{}/".format(resource_class.japi_resource_url_component),
+            link_id))
+    lines.append("    }")
+
+    attributes = [(name, field) for name, field
+                  in resource_class._attrs_by_japi_name.items()
+                  if fields is None or name in fields]
+    if attributes:
+        lines.append("    ret['attributes'] = {")
+        for i, (name, field) in enumerate(attributes):
+            if _plain_column(field):
+                value = _model_access(field.mapped_attribute_name)
+            else:
+                namespace["attr_{}".format(i)] = field
+                value = "attr_{}.serialize(model)".format(i)
+            lines.append("        {!r}: {},".format(name, value))
+        lines.append("    }")
+
+    relationships = [(name, field) for name, field
+                     in resource_class._rels_by_japi_name.items()
+                     if fields is None or name in fields]
+    if relationships:
+        values = []
+        for i, (name, field) in enumerate(relationships):
+            if _plain_column(field):
+                lines.append("    rel_{} = {}".format(
+                    i, _model_access(field.mapped_fk_name)))
+                resource_link = "link_prefix + {!r} + id".format("/{}/".format(
+                    field.bound_resource_class.japi_resource_url_component))
+                values.append(
+                    "{{'links': {{'self': {link} + {rel_self!r}, "
+                    "'related': {link} + {related!r}}}, "
+                    "'data': None if rel_{i} is None else "
+                    "{{'type': {type!r}, 'id': str(rel_{i})}}}}".format(
+                        i=i, link=resource_link,
+                        rel_self="/relationships/" + field.japi_name,
+                        related="/" + field.japi_name,
+                        type=field.related_resource_class.japi_resource_type))
+            else:
+                namespace["rel_field_{}".format(i)] = field
+                values.append(
+                    "rel_field_{}.serialize(model, id, link_prefix)".format(i))
+        lines.append("    ret['relationships'] = {")
+        for (name, _), value in zip(relationships, values):
+            lines.append("        {!r}: {},".format(name, value))
+        lines.append("    }")
+
+    lines.append("    return ret")
+    source = "\n".join(lines) + "\n"
+    LOG.debug("Compiled serializer for %s (fields=%s):\n%s",
+              resource_class.__name__, fields, source)
+    exec(compile(source, "<serializer for {}>".format(
+        resource_class.__name__), "exec"), namespace)
+    serializer = namespace["serialize"]
+    serializer.source = source
+    return serializer
+
+
 class ResourceMeta(type):
     def __init__(cls, name, bases, attrs):  # noqa: N805
         """
@@ -669,14 +797,126 @@ class ResourceMeta(type):
             # component
             isinstance(attrs.get("japi_resource_url_component"), str))
 
+        # Serializers are compiled lazily by compiled_serializer, because a
+        # relationship may still be completed after the class is created
+        # (e.g. one pointing at the class itself).
+        cls._compiled_serializers = {}
+
         return super().__init__(name, bases, attrs)
 
+    def compiled_serializer(cls, fields=None):  # noqa: N805
+        """
+        Returns the serializer generated by compile_serializer for this class
+        and the sparse fieldset *fields*.  Each distinct fieldset is compiled
+        the first time it is seen and cached on the class afterwards.
+
+        :param str list fields: If None, means we aren't using this option.
+
+        :returns callable: ``serializer(model, link_prefix)``
+        """
+        if fields is None:
+            key = None
+        else:
+            # Unknown names never show up in the output, so dropping them
+            # keeps clients from growing the cache with junk fieldsets.
+            key = frozenset(
+                name for name in fields
+                if name in cls._attrs_by_japi_name or
+                name in cls._rels_by_japi_name)
+        try:
+            return cls._compiled_serializers[key]
+        except KeyError:
+            serializer = compile_serializer(cls, key)
+            cls._compiled_serializers[key] = serializer
+            return serializer
+
+    def row_columns(cls, fields=None):  # noqa: N805
+        """
+        The mapped columns the compiled serializer reads for the sparse
+        fieldset *fields*.  A row with attributes of these names (e.g. a
+        SQLAlchemy Row of labeled columns) can back a resource instead of a
+        model, which saves instantiating the model.
+
+        :param str list fields: If None, means we aren't using this option.
+
+        :returns str list: The column names, or None if a field of the
+                           fieldset has a custom fget or serialization and
+                           therefore needs the model.
+        """
+        selected = [cls.id]
+        for fields_by_name in (cls._attrs_by_japi_name,
+                               cls._rels_by_japi_name):
+            selected.extend(field for name, field in fields_by_name.items()
+                            if fields is None or name in fields)
+        columns = []
+        for field in selected:
+            column = _plain_column(field)
+            if column is None:
+                return None
+            if column not in columns:
+                columns.append(column)
+        return columns
+
+    def update_values(cls, patch_dict):  # noqa: N805
+        """
+        The values a patch dictionary writes, by mapped column, so it can be
+        applied without a model (e.g. with a single UPDATE statement).
+
+        :param dict patch_dict: Should be the output of create_patch_dict
+
+        :returns dict: Maps the mapped column names to their new values, or
+                       None if a patched field has a custom fset.
+        """
+        values = {}
+        for fields_by_name, name in (
+                (cls._attrs_by_japi_name, "attributes"),
+                (cls._rels_by_japi_name, "relationships")):
+            for japi_name, value in patch_dict[name].items():
+                field = fields_by_name[japi_name]
+                column = getattr(field, "mapped_attribute_name", None) or \
+                    getattr(field, "mapped_fk_name", None)
+                if not column:
+                    return None
+                values[column] = value
+        return values
+
+    def has_validators(cls, context):  # noqa: N805
+        """
+        :param Context context:
+
+        :returns bool: Whether a field has a validator called by
+                       Resource.validate in *context*
+        """
+        return any(context in validator.contexts
+                   for field in itertools.chain(
+                       cls._attrs_by_japi_name.values(),
+                       cls._rels_by_japi_name.values())
+                   for validator in field._fvalidators)
+
 
 class Resource(with_metaclass(ResourceMeta)):
     """
     Represents a JSON API resource.
     """
 
+    # Mapped names of columns changing whenever the resource changes: an
+    # integer version counter and/or a last modification timestamp.
+    # Declaring either enables ETag (and for updated_at_column,
+    # Last-Modified) headers and conditional GET requests.
+    version_column = None
+    updated_at_column = None
+
+    # The page size of collection GET requests without "page[size]" and the
+    # largest page size a request may ask for.  None means
+    # pagination.DEFAULT_LIMIT and pagination.MAX_LIMIT.
+    default_page_size = None
+    max_page_size = None
+
+    # Set to True for collections small enough to be sent in one response,
+    # e.g. lookup tables.  Only these may be fetched unpaginated, with
+    # "page[size]=all".
+    small_collection = False
+
     def __init__(self, model):
         """
         Creates a Resource.
@@ -697,33 +937,9 @@ class Resource(with_metaclass(ResourceMeta)):
 
         :return dict: Serialized resource in primitive values.
         """
-        ret = {}
-        id = type(self).id.serialize(self.model)
-        ret["id"] = id
-        ret["type"] = self.japi_resource_type
-        ret["links"] = {
-            "self": link_for_resource(
-                link_prefix, self.japi_resource_url_component, self.id)
-        }
-
-        attributes_dict = {}
-        # NOTE: This is accessing *class* attribute!!!
-        for attribute_name, value in self._attrs_by_japi_name.items():
-            if fields is None or attribute_name in fields:
-                attributes_dict[attribute_name] = value.serialize(self.model)
-
-        if attributes_dict:
-            ret["attributes"] = attributes_dict
-
-        relationships_dict = {}
-        for relationship_name, value in self._rels_by_japi_name.items():
-            if fields is None or relationship_name in fields:
-                relationships_dict[relationship_name] = value.serialize(
-                    self.model, id, link_prefix)
-        if relationships_dict:
-            ret["relationships"] = relationships_dict
-
-        return ret
+        # NOTE: This is dispatching through the *class*, see
+        # ResourceMeta.compiled_serializer
+        return type(self).compiled_serializer(fields)(self.model, link_prefix)
 
     @classmethod
     def deserialize(cls, input_dict, *args, **kwargs):
@@ -39,6 +39,7 @@
 jsonapi.response
 ================
 """
+import collections.abc
 
 
 class Response(object):
@@ -50,7 +51,9 @@ class Response(object):
         """
         :param dict body:
             The body of the http response as a dict. This attribute may be set
-            to None to indicate an empty response body.
+            to None to indicate an empty response body.  Top-level values
+            may be iterators, in which case the body is streamed (see
+            :attr:`is_streamed`).
         :param int status:
             The http status code
         :param dict headers:
@@ -59,3 +62,25 @@ class Response(object):
         self.status = status
         self.headers = headers or {}
         self.body = body
+
+    @property
+    def is_streamed(self):
+        """
+        True if the body has iterator values which are meant to be serialized
+        while the response is being sent (see utilities.iter_json and
+        utilities.aiter_json).
+        """
+        return isinstance(self.body, dict) and any(
+            isinstance(value, (collections.abc.Iterator,
+                               collections.abc.AsyncIterator))
+            for value in self.body.values())
+
+    @property
+    def is_async_streamed(self):
+        """
+        True if the body has asynchronous iterator values, which only
+        utilities.aiter_json can serialize.
+        """
+        return isinstance(self.body, dict) and any(
+            isinstance(value, collections.abc.AsyncIterator)
+            for value in self.body.values())
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+#
+# Copyright 2017 Petuum, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+jsonapi_framework.sqlalchemy_async_dal
+======================================
+The asyncio counterpart of :mod:`jsonapi_framework.sqlalchemy_dal`, for
+coroutine handler methods (see :mod:`jsonapi_framework.asgi_api`).  It has
+the same functions with the same parameters, but they are coroutines taking
+a :class:`sqlalchemy.ext.asyncio.AsyncSession`::
+
+    engine = create_async_engine("postgresql+asyncpg://...")
+    async with AsyncSession(engine) as session:
+        person = await async_dal.query_resource(session, Person, 1)
+        people = await async_dal.query_collection(session, Person)
+        async for person in people:
+            ...
+
+query_collection returns an asynchronous iterator of the resources, which
+with *chunk_size* reads from a server-side cursor while it is iterated.
+
+The statements are built by sqlalchemy_dal and shared with it through the
+STATEMENT_CACHE.  The resources are backed by models of the AsyncSession,
+which cannot lazy load: only serialize the columns that were selected.
+"""
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import jsonapi_framework.sqlalchemy_dal as dal
+from jsonapi_framework import errors
+from jsonapi_framework.sqlalchemy_dal import (CountMode,  # noqa: F401
+                                              atomic,
+                                              supports_returning,
+                                              supports_window_functions)
+
+
+def _sync(session):
+    """
+    :returns Session: The Session of the AsyncSession *session*, which
+                      builds the statements without I/O
+    """
+    return session.sync_session
+
+
+async def _resources(resource_class, models):
+    if hasattr(models, "__aiter__"):
+        async for model in models:
+            yield resource_class(model)
+    else:
+        for model in models:
+            yield resource_class(model)
+
+
+async def query_resource(session, resource_class, id, fields=None):
+    statement = dal._resource_statement(_sync(session), resource_class,
+                                        fields)
+    result = await session.execute(statement, {"id": id})
+    model = result.scalars().one_or_none()
+    return resource_class(model) if model else None
+
+
+async def query_resources_by_ids(session, resource_class, ids, fields=None):
+    """
+    Loads the resources with the given *ids* in a single ``IN`` query.
+
+    :returns list: The resources found, in no particular order.  Ids
+                   without a resource are left out.
+    """
+    ids = list(ids)
+    if not ids:
+        return []
+    result = await session.execute(dal._resources_by_ids_query(
+        _sync(session), resource_class, ids, fields).statement)
+    return [resource_class(model) for model in result.scalars()]
+
+
+async def query_collection(session, resource_class, fields=None,
+                           order_by=None, filters=None, limit=None,
+                           offset=None, after=None, before=None,
+                           columns=None, chunk_size=None):
+    """
+    See sqlalchemy_dal.query_collection.
+
+    :param int chunk_size:
+        Stream the result from a server-side cursor, *chunk_size* rows at a
+        time.  The connection stays busy until the iterator is exhausted or
+        closed.
+
+    :returns: An asynchronous iterator of the resources
+    """
+    statement, params = dal._collection_statement(
+        _sync(session), resource_class, fields, order_by, filters, limit,
+        offset, after, before, columns)
+    if chunk_size and before is None:
+        result = await session.stream(
+            statement, params, execution_options={"yield_per": chunk_size})
+        models = result.scalars() if columns is None else result
+    else:
+        result = await session.execute(statement, params)
+        models = result.scalars().all() if columns is None else result.all()
+        if before is not None:
+            # Fetched in reverse order to take the rows closest to the cursor
+            models = reversed(models)
+    return _resources(resource_class, models)
+
+
+async def query_collection_with_total(session, resource_class, fields=None,
+                                      order_by=None, filters=None,
+                                      limit=None, offset=None, columns=None):
+    """
+    See sqlalchemy_dal.query_collection_with_total.
+
+    :returns tuple: The list of resources and the total
+    """
+    connection = await session.connection()
+    if not supports_window_functions(connection.dialect):
+        total = await query_total_number_resources(session, resource_class,
+                                                   filters)
+        resources = await query_collection(
+            session, resource_class, fields, order_by, filters, limit,
+            offset, columns=columns)
+        return [resource async for resource in resources], total
+    statement, params = dal._collection_statement(
+        _sync(session), resource_class, fields, order_by, filters, limit,
+        offset, columns=columns, with_total=True)
+    rows = (await session.execute(statement, params)).all()
+    if rows:
+        if columns is None:
+            resources = [resource_class(row[0]) for row in rows]
+        else:
+            # The serializer ignores the extra _total column
+            resources = [resource_class(row) for row in rows]
+        return resources, rows[0][-1]
+    if not offset:
+        return [], 0
+    # The page is past the end, so there is no row carrying the total
+    return [], await query_total_number_resources(session, resource_class,
+                                                  filters)
+
+
+async def _count(session, resource_class, filters=None):
+    return (await session.execute(dal._count_statement(
+        _sync(session), resource_class, filters))).scalar()
+
+
+async def query_total_number_resources(session, resource_class, filters=None,
+                                       mode=CountMode.EXACT, ttl=60):
+    """
+    Counts the resources matching *filters*, see
+    sqlalchemy_dal.query_total_number_resources.  CountMode.CACHED shares
+    its counts with sqlalchemy_dal.
+    """
+    if mode == CountMode.ESTIMATED:
+        estimate = await query_estimated_number_resources(
+            session, resource_class, filters)
+        if estimate is not None:
+            return estimate
+        mode = CountMode.CACHED
+    if mode == CountMode.CACHED:
+        key = (resource_class, dal._filter_signature(filters))
+        now = time.monotonic()
+        count = dal._COUNT_CACHE.get(key, now)
+        if count is None:
+            count = await _count(session, resource_class, filters)
+            dal._COUNT_CACHE.set(key, count, now + ttl)
+        return count
+    return await _count(session, resource_class, filters)
+
+
+async def query_resource_version(session, resource_class, id):
+    """
+    See sqlalchemy_dal.query_resource_version.
+
+    :returns tuple: (version, updated_at), None for an undeclared column,
+                    or None if there is no resource *id*
+    """
+    result = await session.execute(dal._resource_version_query(
+        _sync(session), resource_class, id).statement)
+    row = result.one_or_none()
+    return None if row is None else dal._version_row(resource_class, row)
+
+
+async def query_collection_version(session, resource_class, filters=None):
+    """
+    See sqlalchemy_dal.query_collection_version.
+
+    :returns tuple: (sum of the versions, maximum updated_at, maximum id,
+                    count), None for an undeclared column
+    """
+    result = await session.execute(dal._collection_version_query(
+        _sync(session), resource_class, filters).statement)
+    row = result.one()
+    return dal._version_row(resource_class, row[:-2]) + tuple(row[-2:])
+
+
+async def query_estimated_number_resources(session, resource_class,
+                                           filters=None):
+    """
+    Asks the query planner how many resources match *filters*.
+
+    :returns int: The estimate, or None if the database is not supported
+    """
+    connection = await session.connection()
+    if connection.dialect.name != "postgresql":
+        return None
+    compiled = dal._explain_statement(_sync(session), resource_class,
+                                      filters, connection.dialect)
+    result = await connection.exec_driver_sql(
+        "EXPLAIN (FORMAT JSON) " + compiled.string, compiled.params)
+    return dal._plan_rows(result.scalar())
+
+
+async def update_resource(session, resource_class, id, values, columns):
+    """
+    See sqlalchemy_dal.update_resource.
+
+    :returns Resource: The updated resource, backed by a row of *columns*,
+                       or None if there is no resource *id*
+    """
+    select_row, statement = dal._update_statements(resource_class, id,
+                                                   values, columns)
+    if statement is None:
+        row = (await session.execute(select_row)).one_or_none()
+    elif supports_returning(_sync(session).get_bind().dialect):
+        row = (await session.execute(statement.returning(
+            *select_row.selected_columns))).one_or_none()
+    elif (await session.execute(statement)).rowcount:
+        row = (await session.execute(select_row)).one()
+    else:
+        row = None
+    return None if row is None else resource_class(row)
+
+
+async def delete_resource(session, resource_class, id):
+    """
+    See sqlalchemy_dal.delete_resource.
+
+    :returns bool: Whether there was a resource *id*
+    """
+    result = await session.execute(dal._delete_statement(resource_class, id))
+    return result.rowcount > 0
+
+
+async def query_related(session, resource_class, id, relationship_name,
+                        fields=None):
+    """
+    See sqlalchemy_dal.query_related.
+
+    :raises NotFound: If there is no resource *id*
+
+    :returns Resource: The related resource, or None if the relationship is
+                       empty
+    """
+    relationship = getattr(resource_class, relationship_name)
+    if relationship.mapped_fk_name is None:
+        return await _query_related_by_fget(session, resource_class, id,
+                                            relationship_name, fields)
+    result = await session.execute(dal._related_query(
+        _sync(session), resource_class, id, relationship_name,
+        fields).statement)
+    return dal._related_resource(resource_class, relationship_name,
+                                 result.one_or_none())
+
+
+async def _query_related_by_fget(session, resource_class, id,
+                                 relationship_name, fields=None):
+    this_resource = await query_resource(session, resource_class, id)
+    if this_resource is None:
+        raise errors.NotFound()
+    related_model_fk = getattr(this_resource, relationship_name)
+    if related_model_fk is None:
+        return None
+    related_resource_class = getattr(
+        resource_class, relationship_name).related_resource_class
+    return await query_resource(session, related_resource_class,
+                                related_model_fk, fields)
+
+
+def record_checkouts(session):
+    """
+    The counterpart of sqlalchemy_dal.checkout: records in
+    dal.POOL_CHECKOUTS how long *session* waits for a connection from the
+    pool, whenever it checks one out to begin a transaction.  Unlike
+    checkout it does not check out a connection right away, so a session
+    created lazily (see Request.session) which is never used takes none.
+
+    :param AsyncSession session: Other objects are returned as they are
+
+    :returns AsyncSession: *session*
+    """
+    sync_session = getattr(session, "sync_session", session)
+    if not isinstance(sync_session, Session):
+        return session
+    started = []
+
+    @event.listens_for(sync_session, "after_transaction_create")
+    def transaction_created(sync_session, transaction):
+        # Only the outermost transaction checks out a connection
+        if transaction.parent is None:
+            started[:] = [time.perf_counter()]
+
+    @event.listens_for(sync_session, "after_begin")
+    def transaction_begun(sync_session, transaction, connection):
+        if started:
+            dal.POOL_CHECKOUTS.record(time.perf_counter() - started.pop())
+
+    return session
+
+
+async def commit(session, *args, **kwargs):
+    if session.info.get(dal._ATOMIC) is True:
+        # Committed as a whole when the atomic request is done
+        await session.flush()
+        return
+    await session.commit(*args, **kwargs)
+
+
+async def rollback(session, *args, **kwargs):
+    await session.rollback(*args, **kwargs)
+
+
+async def add(session, *args, **kwargs):
+    session.add(*args, **kwargs)
+
+
+async def flush(session, *args, **kwargs):
+    await session.flush(*args, **kwargs)
+
+
+async def add_all(session, models, chunk_size=1000):
+    """
+    Adds and flushes *models*, *chunk_size* at a time, see
+    sqlalchemy_dal.add_all.
+    """
+    for start in range(0, len(models), chunk_size):
+        chunk = models[start:start + chunk_size]
+        session.add_all(chunk)
+        await session.flush()
+        query = dal._unloaded_columns_query(_sync(session), chunk)
+        if query is not None:
+            (await session.execute(query.statement)).all()
+
+
+async def delete(session, *args, **kwargs):
+    await session.delete(*args, **kwargs)
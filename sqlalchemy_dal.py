@@ -42,50 +42,809 @@ jsonapi_framework.sqlalchemy_dal
 This module is the data access layer. The interface between database and the
 api.
 """
-from sqlalchemy.orm import load_only
-from sqlalchemy_filters import apply_filters
+import collections
+import contextlib
+import json
+import threading
+import time
+from enum import Enum, auto
+
+from sqlalchemy import (and_, bindparam, delete as delete_statement, func,
+                        inspect, or_, select, tuple_, update, Integer)
+from sqlalchemy.exc import UnboundExecutionError
+from sqlalchemy.orm import Load, aliased, load_only
+from sqlalchemy.orm.attributes import QueryableAttribute
 
 from jsonapi_framework import errors
+from jsonapi_framework.filters import compile_filter
+
+
+class CountMode(Enum):
+    """
+    How query_total_number_resources counts.
+
+    * EXACT - run a ``COUNT(*)`` every time
+    * ESTIMATED - use the row estimate of the query planner, which costs no
+      table scan.  Only PostgreSQL is supported, other databases fall back
+      to CACHED.
+    * CACHED - run a ``COUNT(*)`` and reuse its result for the same
+      resource class and filters until it is *ttl* seconds old
+    * WINDOW - count exactly, but select the total together with the page
+      using ``COUNT(*) OVER ()``, see :func:`query_collection_with_total`.
+      query_total_number_resources treats it like EXACT.
+    """
+    EXACT = auto()
+    ESTIMATED = auto()
+    CACHED = auto()
+    WINDOW = auto()
+
+
+# Dialect name -> first server version supporting window functions
+_WINDOW_FUNCTION_VERSIONS = {
+    "postgresql": (8, 4),
+    "sqlite": (3, 25),
+    "mysql": (8, 0),
+    "mariadb": (10, 2),
+    "mssql": (),
+    "oracle": (),
+}
+
+
+CacheInfo = collections.namedtuple(
+    "CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+class StatementCache(object):
+    """
+    A least recently used cache of built SELECT statements.
+
+    The DAL builds a statement once for every distinct query shape (resource
+    class, sparse fieldset, sort, filter structure, ...) with bind
+    parameters in place of the values, and afterwards only binds the values
+    of a request.  This saves building the Query on every request, and as
+    the cached statement is the same object SQLAlchemy's own cache of
+    compiled SQL is hit right away.
+    """
+
+    def __init__(self, maxsize=1024):
+        """
+        :param int maxsize: The number of statements to keep
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._statements = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        """
+        :param key: The hashable shape of the statement
+        :param callable build: Builds the statement if it is not cached
+
+        :returns: The statement
+        """
+        with self._lock:
+            statement = self._statements.get(key)
+            if statement is not None:
+                self._statements.move_to_end(key)
+                self.hits += 1
+                return statement
+            self.misses += 1
+        statement = build()
+        with self._lock:
+            self._statements[key] = statement
+            if len(self._statements) > self.maxsize:
+                self._statements.popitem(last=False)
+        return statement
+
+    def info(self):
+        """
+        :returns CacheInfo: The hit and miss counters and the size of the
+                            cache, like functools.lru_cache reports them
+        """
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize,
+                             len(self._statements))
+
+    def clear(self):
+        """
+        Empties the cache and resets the counters.
+        """
+        with self._lock:
+            self._statements.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+STATEMENT_CACHE = StatementCache()
+
+
+class CountCache(object):
+    """
+    A least recently used cache of the counts of CountMode.CACHED, by
+    resource class and filter signature.  The filters come from the
+    requests, so the cache is bounded: expired counts are dropped when they
+    are looked up, and beyond *maxsize* counts the least recently used one
+    is dropped.
+    """
+
+    def __init__(self, maxsize=1024):
+        """
+        :param int maxsize: The number of counts to keep
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._counts = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, now):
+        """
+        :param key: The resource class and the filter signature
+        :param float now: The time.monotonic() of the lookup
+
+        :returns int: The count, or None if there is none that is still
+                      valid at *now*
+        """
+        with self._lock:
+            entry = self._counts.get(key)
+            if entry is not None:
+                expires, count = entry
+                if now < expires:
+                    self._counts.move_to_end(key)
+                    self.hits += 1
+                    return count
+                del self._counts[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, count, expires):
+        """
+        :param key: The resource class and the filter signature
+        :param int count:
+        :param float expires: The time.monotonic() the count expires at
+        """
+        with self._lock:
+            self._counts[key] = (expires, count)
+            self._counts.move_to_end(key)
+            if len(self._counts) > self.maxsize:
+                self._counts.popitem(last=False)
+
+    def info(self):
+        """
+        :returns CacheInfo: The hit and miss counters and the size of the
+                            cache
+        """
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize,
+                             len(self._counts))
+
+    def clear(self):
+        """
+        Empties the cache and resets the counters.
+        """
+        with self._lock:
+            self._counts.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# Shared with sqlalchemy_async_dal
+_COUNT_CACHE = CountCache()
+
+
+CheckoutInfo = collections.namedtuple(
+    "CheckoutInfo", ["checkouts", "total_wait", "max_wait"])
+
+
+class CheckoutStats(object):
+    """
+    Collects how long sessions waited for a connection from the pool (see
+    :func:`checkout`).  A growing wait means that the pool is too small for
+    the number of concurrent requests.
+    """
+
+    def __init__(self):
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, wait):
+        """
+        :param float wait: The seconds a checkout took
+        """
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def info(self):
+        """
+        :returns CheckoutInfo: The number of checkouts and their total and
+                               longest wait, in seconds
+        """
+        with self._lock:
+            return CheckoutInfo(self.checkouts, self.total_wait,
+                                self.max_wait)
+
+    def clear(self):
+        """
+        Resets the counters.
+        """
+        with self._lock:
+            self.checkouts = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+
+
+POOL_CHECKOUTS = CheckoutStats()
+
+
+def _fields_key(fields):
+    return frozenset(fields) if fields else None
+
+
+def _dialect_name(session):
+    return session.get_bind().dialect.name
+
+
+def _resource_statement(session, resource_class, fields=None):
+    def build():
+        pk_column = getattr(resource_class.model_class,
+                            resource_class.id.mapped_pk_name)
+        query = session.query(resource_class.model_class)
+        if fields:
+            query = query.options(load_only(*fields))
+        return query.filter(pk_column == bindparam("id")).statement
+
+    return STATEMENT_CACHE.get(
+        ("resource", resource_class, _fields_key(fields)), build)
 
 
 # NOTE: Simplifying assumption... id is a single primary key
 def query_resource(session, resource_class, id, fields=None):
+    statement = _resource_statement(session, resource_class, fields)
+    model = session.execute(statement, {"id": id}).scalars().one_or_none()
+    return resource_class(model) if model else None
+
+
+def query_resources_by_ids(session, resource_class, ids, fields=None):
+    """
+    Loads the resources with the given *ids* in a single ``IN`` query.
+
+    :returns list: The resources found, in no particular order.  Ids
+                   without a resource are left out.
+    """
+    ids = list(ids)
+    if not ids:
+        return []
+    return [resource_class(model) for model in _resources_by_ids_query(
+        session, resource_class, ids, fields)]
+
+
+def _resources_by_ids_query(session, resource_class, ids, fields=None):
     pk_column = getattr(resource_class.model_class,
                         resource_class.id.mapped_pk_name)
+    models = session.query(resource_class.model_class)
     if fields:
-        model = session.query(resource_class.model_class).options(
-            load_only(*fields)).filter(pk_column == id).one_or_none()
-    else:
-        model = session.query(resource_class.model_class).filter(
-            pk_column == id).one_or_none()
-    return resource_class(model) if model else None
+        models = models.options(load_only(*fields))
+    return models.filter(pk_column.in_(ids))
 
 
-def query_collection(session, resource_class, fields=None,
-                     order_by=None, filters=None, limit=None, offset=None):
-    if fields:
+def _sort_column(resource_class, name):
+    column = getattr(resource_class.model_class, name, None)
+    if not isinstance(column, QueryableAttribute):
+        raise errors.UnsortableField(resource_class.japi_resource_type, name)
+    return column
+
+
+def _order_by_clauses(resource_class, order_by, reverse=False):
+    """
+    Turns the field names returned by get_order_by_fields (prefixed with '-'
+    for descending order) into ORDER BY clauses.
+    """
+    clauses = []
+    for order_field in order_by:
+        descending = order_field.startswith("-")
+        column = _sort_column(resource_class, order_field.lstrip("-"))
+        clauses.append(column.desc() if descending != reverse
+                       else column.asc())
+    return clauses
+
+
+def check_keyset_order(resource_class, order_by):
+    """
+    Checks that the sort order *order_by* can be paginated by keyset.  The
+    cursor predicate compares the sort columns with values, which a NULL
+    never satisfies, so rows with a NULL in a sort column would silently be
+    left out of the pages.
+
+    :raises BadRequest: If a sort column may be NULL
+    """
+    for order_field in order_by:
+        name = order_field.lstrip("-")
+        column = _sort_column(resource_class, name).expression
+        if getattr(column, "nullable", True):
+            raise errors.BadRequest(
+                detail="The nullable field '{}.{}' can not be sorted by "
+                       "with cursor pagination.".format(
+                           resource_class.japi_resource_type, name),
+                source_parameter="sort")
+
+
+def _keyset_predicate(resource_class, order_by, values, reverse=False):
+    """
+    Creates the predicate selecting the rows that come after the row with
+    the column *values* in the sort order *order_by* (or before it, if
+    *reverse* is True).
+
+    If every column is sorted in the same direction this is a single row
+    value comparison ``(a, b) > (1, 2)``, which databases answer with an
+    index range scan.  Mixed directions are expanded into
+    ``a > 1 OR (a = 1 AND b < 2)``.
+    """
+    columns = []
+    greater = []
+    for order_field in order_by:
+        columns.append(_sort_column(resource_class, order_field.lstrip("-")))
+        greater.append(order_field.startswith("-") == reverse)
+    if all(greater) or not any(greater):
+        if greater[0]:
+            return tuple_(*columns) > tuple_(*values)
+        return tuple_(*columns) < tuple_(*values)
+    alternatives = []
+    for i, (column, value) in enumerate(zip(columns, values)):
+        equal = [c == v for c, v in zip(columns[:i], values[:i])]
+        alternatives.append(and_(
+            *equal, column > value if greater[i] else column < value))
+    return or_(*alternatives)
+
+
+def _collection_query(session, resource_class, fields=None, order_by=None,
+                      filter_clause=None, limit=None, offset=None, after=None,
+                      before=None, columns=None):
+    if columns is not None:
+        model_class = resource_class.model_class
+        models = session.query(*[getattr(model_class, name).label(name)
+                                 for name in columns])
+    elif fields:
         models = session.query(
             resource_class.model_class).options(load_only(*fields))
     else:
         models = session.query(resource_class.model_class)
     if order_by:
-        order_by = [order_field if order_field[0] != '-' else
-                    order_field[1:] + ' desc' for order_field in order_by]
-        models = models.order_by(*order_by)
+        models = models.order_by(*_order_by_clauses(
+            resource_class, order_by, reverse=before is not None))
+    if filter_clause is not None:
+        models = models.filter(filter_clause)
+    if after is not None:
+        models = models.filter(
+            _keyset_predicate(resource_class, order_by, after))
+    if before is not None:
+        models = models.filter(
+            _keyset_predicate(resource_class, order_by, before, reverse=True))
+    if offset is not None:
+        models = models.offset(offset)
+    if limit is not None:
+        models = models.limit(limit)
+    return models
+
+
+def _collection_statement(session, resource_class, fields=None,
+                          order_by=None, filters=None, limit=None,
+                          offset=None, after=None, before=None, columns=None,
+                          with_total=False):
+    """
+    Gets the statement for _collection_query from the STATEMENT_CACHE.
+
+    :returns tuple: The statement and the values of its bind parameters
+    """
+    params = {}
+    filter_clause = filter_shape = None
     if filters:
-        models = apply_filters(models, filters)
-    if offset is not None and limit is not None:
-        models = models.offset(offset).limit(limit)
+        filter_clause, params, filter_shape = compile_filter(
+            resource_class, filters, _dialect_name(session))
+    bound_limit = bound_offset = bound_after = bound_before = None
+    if limit is not None:
+        bound_limit = bindparam("limit", type_=Integer)
+        params["limit"] = limit
+    if offset is not None:
+        bound_offset = bindparam("offset", type_=Integer)
+        params["offset"] = offset
+    for name, values in (("after", after), ("before", before)):
+        if values is None:
+            continue
+        bound = []
+        for i, (order_field, value) in enumerate(zip(order_by, values)):
+            column = _sort_column(resource_class, order_field.lstrip("-"))
+            key = "{}_{}".format(name, i)
+            bound.append(bindparam(key, type_=column.type))
+            params[key] = value
+        if name == "after":
+            bound_after = bound
+        else:
+            bound_before = bound
+
+    def build():
+        query = _collection_query(
+            session, resource_class, fields, order_by, filter_clause,
+            bound_limit, bound_offset, bound_after, bound_before, columns)
+        if with_total:
+            query = query.add_columns(func.count().over().label("_total"))
+        return query.statement
+
+    key = ("collection", resource_class, _fields_key(fields),
+           None if columns is None else tuple(columns),
+           tuple(order_by or ()), filter_shape, limit is not None,
+           offset is not None, after is not None, before is not None,
+           with_total)
+    return STATEMENT_CACHE.get(key, build), params
+
+
+def query_collection(session, resource_class, fields=None,
+                     order_by=None, filters=None, limit=None, offset=None,
+                     after=None, before=None, columns=None, chunk_size=None):
+    """
+    :param int chunk_size:
+        Stream the result from a server-side cursor, *chunk_size* rows at a
+        time, instead of letting the driver buffer all of it first.  The
+        models are only referenced weakly by the session, so each chunk can
+        be freed once its resources were serialized.  The connection stays
+        busy until the generator is exhausted or closed.
+    :param list columns:
+        Only select these mapped columns (see ResourceMeta.row_columns) and
+        back the resources with the result rows instead of models.  This
+        skips instantiating the models and the identity map bookkeeping,
+        *fields* is ignored.
+    :param list after:
+        Keyset pagination: only return the resources after the row with these
+        values of the *order_by* columns.
+    :param list before:
+        Keyset pagination: only return the resources before the row with
+        these values of the *order_by* columns.  The resources closest to
+        that row are returned, still in *order_by* order.
+    """
+    statement, params = _collection_statement(
+        session, resource_class, fields, order_by, filters, limit, offset,
+        after, before, columns)
+    execution_options = {}
+    if chunk_size and before is None:
+        execution_options = {"stream_results": True, "yield_per": chunk_size}
+    result = session.execute(statement, params,
+                             execution_options=execution_options)
+    models = result.scalars() if columns is None else result
+    if before is not None:
+        # Fetched in reverse order to take the rows closest to the cursor
+        models = reversed(models.all())
     return (resource_class(model) for model in models)
 
 
-def query_total_number_resources(session, resource_class):
-    return session.query(resource_class.model_class).count()
+def supports_window_functions(dialect):
+    """
+    :param sqlalchemy.engine.Dialect dialect: The dialect of a connection
+
+    :returns bool: Whether the database understands ``COUNT(*) OVER ()``
+    """
+    name = dialect.name
+    if name == "mysql" and getattr(dialect, "is_mariadb", False):
+        name = "mariadb"
+    minimum_version = _WINDOW_FUNCTION_VERSIONS.get(name)
+    if minimum_version is None:
+        return False
+    return tuple(dialect.server_version_info or ()) >= minimum_version
+
+
+def query_collection_with_total(session, resource_class, fields=None,
+                                order_by=None, filters=None, limit=None,
+                                offset=None, columns=None):
+    """
+    Like query_collection, but also counts all the resources matching
+    *filters* like query_total_number_resources does.
+
+    If the database supports window functions, the total is selected with
+    every row of the page by ``COUNT(*) OVER ()``, so the page and the total
+    take a single round trip.  Otherwise the two queries are run.
+
+    :returns tuple: The list of resources and the total
+    """
+    if not supports_window_functions(session.connection().dialect):
+        total = query_total_number_resources(session, resource_class, filters)
+        return list(query_collection(
+            session, resource_class, fields, order_by, filters, limit,
+            offset, columns=columns)), total
+    statement, params = _collection_statement(
+        session, resource_class, fields, order_by, filters, limit, offset,
+        columns=columns, with_total=True)
+    rows = session.execute(statement, params).all()
+    if rows:
+        if columns is None:
+            resources = [resource_class(row[0]) for row in rows]
+        else:
+            # The serializer ignores the extra _total column
+            resources = [resource_class(row) for row in rows]
+        return resources, rows[0][-1]
+    if not offset:
+        return [], 0
+    # The page is past the end, so there is no row carrying the total
+    return [], query_total_number_resources(session, resource_class, filters)
+
+
+def _count_query(session, resource_class, filters=None):
+    pk_column = getattr(resource_class.model_class,
+                        resource_class.id.mapped_pk_name)
+    query = session.query(pk_column)
+    if filters:
+        filter_clause, params, _ = compile_filter(
+            resource_class, filters, _dialect_name(session))
+        query = query.filter(filter_clause).params(params)
+    return query
+
+
+def _count_statement(session, resource_class, filters=None):
+    return select(func.count()).select_from(
+        _count_query(session, resource_class, filters).statement.subquery())
+
+
+def _filter_signature(filters):
+    return filters.clauses if filters else None
+
+
+def query_total_number_resources(session, resource_class, filters=None,
+                                 mode=CountMode.EXACT, ttl=60):
+    """
+    Counts the resources matching *filters*.
+
+    :param CountMode mode: How to count, see :class:`CountMode`
+    :param int ttl: How long CountMode.CACHED reuses a count, in seconds
+    """
+    if mode == CountMode.ESTIMATED:
+        estimate = query_estimated_number_resources(
+            session, resource_class, filters)
+        if estimate is not None:
+            return estimate
+        mode = CountMode.CACHED
+    if mode == CountMode.CACHED:
+        key = (resource_class, _filter_signature(filters))
+        now = time.monotonic()
+        count = _COUNT_CACHE.get(key, now)
+        if count is None:
+            count = _count_query(session, resource_class, filters).count()
+            _COUNT_CACHE.set(key, count, now + ttl)
+        return count
+    return _count_query(session, resource_class, filters).count()
+
+
+def _version_columns(resource_class):
+    return [getattr(resource_class.model_class, name)
+            for name in (resource_class.version_column,
+                         resource_class.updated_at_column)
+            if name is not None]
+
+
+def _version_row(resource_class, row):
+    values = iter(row)
+    return tuple(None if name is None else next(values)
+                 for name in (resource_class.version_column,
+                              resource_class.updated_at_column))
+
+
+def query_resource_version(session, resource_class, id):
+    """
+    Selects only the version and updated_at columns of the resource *id*
+    (see Resource.version_column and Resource.updated_at_column).
+
+    :returns tuple: (version, updated_at), None for an undeclared column,
+                    or None if there is no resource *id*
+    """
+    row = _resource_version_query(session, resource_class, id).one_or_none()
+    return None if row is None else _version_row(resource_class, row)
+
+
+def _resource_version_query(session, resource_class, id):
+    pk_column = getattr(resource_class.model_class,
+                        resource_class.id.mapped_pk_name)
+    return session.query(*_version_columns(resource_class)).filter(
+        pk_column == id)
+
+
+def query_collection_version(session, resource_class, filters=None):
+    """
+    Aggregates the version and updated_at columns (see
+    Resource.version_column and Resource.updated_at_column) over the
+    resources matching *filters*.
+
+    The versions are summed rather than maximized, as the version of any
+    resource is bumped by its updates, not only that of the latest one.
+    The maximum id and the count catch a resource being deleted and
+    another added.  Only where new ids are not larger than the old ones
+    (e.g. UUIDs) can that go unnoticed.
+
+    :returns tuple: (sum of the versions, maximum updated_at, maximum id,
+                    count), None for an undeclared column
+    """
+    row = _collection_version_query(session, resource_class, filters).one()
+    return _version_row(resource_class, row[:-2]) + tuple(row[-2:])
+
+
+def _collection_version_query(session, resource_class, filters=None):
+    model_class = resource_class.model_class
+    aggregates = []
+    if resource_class.version_column is not None:
+        aggregates.append(func.sum(getattr(model_class,
+                                           resource_class.version_column)))
+    if resource_class.updated_at_column is not None:
+        aggregates.append(func.max(getattr(
+            model_class, resource_class.updated_at_column)))
+    pk_column = getattr(model_class, resource_class.id.mapped_pk_name)
+    return _count_query(session, resource_class, filters).with_entities(
+        *aggregates, func.max(pk_column), func.count())
+
+
+def query_estimated_number_resources(session, resource_class, filters=None):
+    """
+    Asks the query planner how many resources match *filters*.
+
+    :returns int: The estimate, or None if the database is not supported
+    """
+    connection = session.connection()
+    if connection.dialect.name != "postgresql":
+        return None
+    compiled = _explain_statement(session, resource_class, filters,
+                                  connection.dialect)
+    return _plan_rows(connection.exec_driver_sql(
+        "EXPLAIN (FORMAT JSON) " + compiled.string,
+        compiled.params).scalar())
+
+
+def _explain_statement(session, resource_class, filters, dialect):
+    return _count_query(session, resource_class, filters).statement.compile(
+        dialect=dialect, compile_kwargs={"render_postcompile": True})
+
+
+def _plan_rows(plan):
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return max(int(plan[0]["Plan"]["Plan Rows"]), 0)
+
+
+def supports_returning(dialect):
+    """
+    :returns bool: Whether UPDATE and DELETE statements can have a RETURNING
+                   clause on *dialect*
+    """
+    return bool(getattr(dialect, "update_returning",
+                        getattr(dialect, "full_returning", False)))
+
+
+def _write_target(resource_class):
+    model_class = resource_class.model_class
+    return (inspect(model_class).local_table,
+            getattr(model_class, resource_class.id.mapped_pk_name))
+
+
+def update_resource(session, resource_class, id, values, columns):
+    """
+    Updates the resource *id* with a single UPDATE ... RETURNING statement,
+    without loading it into the session.  Where RETURNING is not supported
+    the columns are selected after the UPDATE.  ORM events and attribute
+    validators of the model are bypassed; Column onupdate defaults apply,
+    and the Resource.version_column is incremented.
+
+    :param dict values: Maps mapped column names to their new values, see
+                        ResourceMeta.update_values
+    :param list columns: The mapped columns to return, see
+                         ResourceMeta.row_columns
+
+    :returns Resource: The updated resource, backed by a row of *columns*,
+                       or None if there is no resource *id*
+    """
+    select_row, statement = _update_statements(resource_class, id, values,
+                                               columns)
+    if statement is None:
+        row = session.execute(select_row).one_or_none()
+    elif supports_returning(session.get_bind().dialect):
+        row = session.execute(statement.returning(
+            *select_row.selected_columns)).one_or_none()
+    elif session.execute(statement).rowcount:
+        row = session.execute(select_row).one()
+    else:
+        row = None
+    return None if row is None else resource_class(row)
+
+
+def _update_statements(resource_class, id, values, columns):
+    """
+    :returns tuple: The SELECT of the *columns* of the resource *id*, and
+                    the UPDATE setting *values* or None if there are none
+    """
+    model_class = resource_class.model_class
+    table, pk_column = _write_target(resource_class)
+    select_row = select(*[getattr(model_class, name).label(name)
+                          for name in columns]).where(pk_column == id)
+    if not values:
+        return select_row, None
+    values = {getattr(model_class, name): value
+              for name, value in values.items()}
+    if resource_class.version_column is not None:
+        # Nothing else bumps the version without a flush of the model
+        version = getattr(model_class, resource_class.version_column)
+        values.setdefault(version, version + 1)
+    return select_row, update(table).where(pk_column == id).values(values)
+
+
+def delete_resource(session, resource_class, id):
+    """
+    Deletes the resource *id* with a single DELETE statement, without loading
+    it into the session.  ORM cascades and events are bypassed, so related
+    rows are only handled by the foreign key actions of the database.
+
+    :returns bool: Whether there was a resource *id*
+    """
+    return session.execute(
+        _delete_statement(resource_class, id)).rowcount > 0
+
+
+def _delete_statement(resource_class, id):
+    table, pk_column = _write_target(resource_class)
+    return delete_statement(table).where(pk_column == id)
 
 
 def query_related(session, resource_class, id, relationship_name, fields=None):
-    # TODO: This is currently emitting two queries.  It would be more
-    # performant to use a database join (with SQLAlchemy).
+    """
+    Loads the resource the to-one relationship *relationship_name* of the
+    resource *id* points to, with a single ``LEFT OUTER JOIN`` query.
+
+    :raises NotFound: If there is no resource *id*
+
+    :returns Resource: The related resource, or None if the relationship is
+                       empty
+    """
+    relationship = getattr(resource_class, relationship_name)
+    if relationship.mapped_fk_name is None:
+        # A custom fget can compute the related id from anything, so it
+        # has to be called on the loaded resource
+        return _query_related_by_fget(session, resource_class, id,
+                                      relationship_name, fields)
+    row = _related_query(session, resource_class, id, relationship_name,
+                         fields).one_or_none()
+    return _related_resource(resource_class, relationship_name, row)
+
+
+def _related_query(session, resource_class, id, relationship_name,
+                   fields=None):
+    """
+    :returns Query: The rows (id, related model) of the resource *id*
+    """
+    relationship = getattr(resource_class, relationship_name)
+    related_resource_class = relationship.related_resource_class
+    model_class = resource_class.model_class
+    pk_column = getattr(model_class, resource_class.id.mapped_pk_name)
+    fk_column = getattr(model_class, relationship.mapped_fk_name)
+    # Aliased, so relationships pointing at the same model can be joined
+    related_model = aliased(related_resource_class.model_class)
+    related_pk_column = getattr(
+        related_model, related_resource_class.id.mapped_pk_name)
+    query = session.query(pk_column, related_model).outerjoin(
+        related_model, related_pk_column == fk_column).filter(
+        pk_column == id)
+    if fields:
+        query = query.options(Load(related_model).load_only(*fields))
+    return query
+
+
+def _related_resource(resource_class, relationship_name, row):
+    if row is None:
+        raise errors.NotFound()
+    related = row[1]
+    if related is None:
+        return None
+    return getattr(resource_class,
+                   relationship_name).related_resource_class(related)
+
+
+def _query_related_by_fget(session, resource_class, id, relationship_name,
+                           fields=None):
     this_resource = query_resource(session, resource_class, id)
     if this_resource is None:
         raise errors.NotFound()
@@ -99,10 +858,63 @@ def query_related(session, resource_class, id, relationship_name, fields=None):
                               related_model_fk, fields)
 
 
+# Set in Session.info while atomic() is active
+_ATOMIC = "jsonapi_framework.atomic"
+
+
 def commit(session, *args, **kwargs):
+    if session.info.get(_ATOMIC) is True:
+        # Committed as a whole when the atomic request is done
+        session.flush()
+        return
     session.commit(*args, **kwargs)
 
 
+@contextlib.contextmanager
+def atomic(session):
+    """
+    Runs the writes of several requests in the current transaction of
+    *session*: while the context is active, :func:`commit` only flushes.
+    The caller commits or rolls back afterwards.
+    """
+    session.info[_ATOMIC] = True
+    try:
+        yield session
+    finally:
+        session.info.pop(_ATOMIC, None)
+
+
+def checkout(session, isolation_level=None):
+    """
+    Checks the connection of *session* out of the pool right away, and
+    records how long that took in POOL_CHECKOUTS.
+
+    With the *isolation_level* "AUTOCOMMIT" the statements of *session* run
+    without a transaction: no BEGIN, COMMIT or ROLLBACK is sent, which saves
+    those round trips for requests that only read.  Every statement then
+    sees its own snapshot of the database.
+
+    Sessions without a single bind are left alone, they check out their
+    connections when they execute their first statement.
+
+    :param Session session:
+    :param str isolation_level: The isolation level of the connection, or
+                                None for the default of the engine
+
+    :returns Session: *session*
+    """
+    execution_options = None
+    if isolation_level is not None:
+        execution_options = {"isolation_level": isolation_level}
+    start = time.perf_counter()
+    try:
+        session.connection(execution_options=execution_options)
+    except UnboundExecutionError:
+        return session
+    POOL_CHECKOUTS.record(time.perf_counter() - start)
+    return session
+
+
 def rollback(session, *args, **kwargs):
     session.rollback(*args, **kwargs)
 
@@ -115,5 +927,57 @@ def flush(session, *args, **kwargs):
     session.flush(*args, **kwargs)
 
 
+def add_all(session, models, chunk_size=1000):
+    """
+    Adds and flushes *models*, *chunk_size* at a time.  The ORM inserts the
+    new rows of a chunk with executemany, and reads generated primary keys
+    back with batched INSERT ... RETURNING statements where the driver
+    supports it (e.g. psycopg2), instead of one round trip per row.
+
+    :param Session session:
+    :param list models: New model instances
+    :param int chunk_size:
+    """
+    for start in range(0, len(models), chunk_size):
+        chunk = models[start:start + chunk_size]
+        session.add_all(chunk)
+        session.flush()
+        _load_unloaded_columns(session, chunk)
+
+
+def _load_unloaded_columns(session, models):
+    """
+    Loads the columns of the just inserted *models* which were neither set
+    nor returned by the INSERT (e.g. server defaults) with one query,
+    instead of one query per model when they are first read.
+    """
+    query = _unloaded_columns_query(session, models)
+    if query is not None:
+        # Loading rows into instances already in the session fills in just
+        # their unloaded attributes
+        query.all()
+
+
+def _unloaded_columns_query(session, models):
+    """
+    :returns Query: Selects the just inserted *models*, or None if no
+                    column of them needs loading
+    """
+    states = [inspect(model) for model in models]
+    if not states:
+        return None
+    mapper = states[0].mapper
+    keys = {prop.key for prop in mapper.column_attrs}
+    if not any(keys & state.unloaded for state in states):
+        return None
+    if len(mapper.primary_key) == 1:
+        primary_key = mapper.primary_key[0]
+        identities = [state.identity[0] for state in states]
+    else:
+        primary_key = tuple_(*mapper.primary_key)
+        identities = [state.identity for state in states]
+    return session.query(mapper).filter(primary_key.in_(identities))
+
+
 def delete(session, *args, **kwargs):
     session.delete(*args, **kwargs)
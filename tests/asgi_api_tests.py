@@ -0,0 +1,374 @@
+#!usr/bin/env python3
+#
+# Copyright 2017 Petuum, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from unittest.mock import MagicMock
+import jsonapi_framework.errors as errors
+from jsonapi_framework.api import JSONAPI_MIMETYPE, accepted_mimetype
+from jsonapi_framework.asgi_api import ASGIAPI
+from jsonapi_framework.handler import CollectionHandler, ResourceHandler
+from jsonapi_framework.request import RequestType
+from jsonapi_framework.response import Response
+from jsonapi_framework.tests.sqlalchemy_dal_tests import (Base,
+                                                          Company,
+                                                          CompanyModel)
+
+
+class AsyncSession(object):
+    def __init__(self):
+        self.rolled_back = False
+        self.closed = False
+
+    async def rollback(self):
+        self.rolled_back = True
+
+    async def close(self):
+        self.closed = True
+
+
+def call(app, method, path, query_string=b"", body=b"", headers=()):
+    scope = {"type": "http", "method": method, "path": path,
+             "query_string": query_string, "headers": list(headers)}
+    messages = [{"type": "http.request", "body": body}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    async def run():
+        await app(scope, receive, send)
+        return sent
+
+    return run()
+
+
+def parse(sent):
+    start = sent[0]
+    body = b"".join(message.get("body", b"") for message in sent[1:])
+    return start["status"], dict(start["headers"]), \
+        json.loads(body.decode("utf-8")) if body else None
+
+
+class ASGIAPITestCase(unittest.TestCase):
+    def setUp(self):
+        self.events = []
+        events = self.events
+        self.sessions = []
+
+        class People(object):
+            @classmethod
+            def get(cls, request):
+                events.append(("get", threading.current_thread().name,
+                               request.query_args.getlist("page[size]")))
+                request.session.execute()
+                if request.query_args.get("fail"):
+                    raise errors.Conflict()
+                return Response({"data": []})
+
+            @classmethod
+            def post(cls, request):
+                request.session.execute()
+                raise errors.Conflict()
+
+        class Person(object):
+            started = None
+            release = None
+
+            @classmethod
+            async def get(cls, request):
+                events.append(("start", request.id))
+                if request.id == "1":
+                    cls.started.set()
+                    await cls.release.wait()
+                else:
+                    await cls.started.wait()
+                    cls.release.set()
+                events.append(("end", request.id))
+                return Response({"data": {"type": "person",
+                                          "id": request.id}})
+
+            @classmethod
+            async def patch(cls, request):
+                events.append(("patch", request.session))
+                raise errors.BadRequest(detail="bad")
+
+        class Feed(object):
+            @classmethod
+            async def get(cls, request):
+                async def data():
+                    for i in range(3):
+                        await asyncio.sleep(0)
+                        yield {"type": "item", "id": str(i)}
+                return Response({"data": data()})
+
+        class Stream(object):
+            @classmethod
+            def read_in_transaction(cls):
+                return True
+
+            @classmethod
+            def get(cls, request):
+                request.session.execute()
+                raise errors.Conflict()
+
+        class Pages(object):
+            @classmethod
+            def get(cls, request):
+                request.session.execute()
+                return Response({"data": iter([{"type": "page",
+                                                "id": "1"}])})
+
+        self.person = Person
+
+        def session_callable():
+            session = MagicMock()
+            self.sessions.append(session)
+            return session
+
+        def async_session_callable():
+            session = AsyncSession()
+            self.sessions.append(session)
+            return session
+
+        self.app = ASGIAPI(
+            {"people": {RequestType.COLLECTION: People,
+                        RequestType.RESOURCE: Person,
+                        RequestType.RELATED: {},
+                        RequestType.RELATIONSHIP: {}},
+             "feed": {RequestType.COLLECTION: Feed},
+             "stream": {RequestType.COLLECTION: Stream},
+             "pages": {RequestType.COLLECTION: Pages}},
+            session_callable, api_prefix="/api", max_workers=2,
+            async_session_callable=async_session_callable)
+
+    def tearDown(self):
+        self.app.executor.shutdown()
+
+    def test_route(self):
+        self.assertTupleEqual(self.app.route("/people"),
+                              ("people", RequestType.COLLECTION, None, None))
+        self.assertTupleEqual(self.app.route("/people/1/company"),
+                              ("people", RequestType.RELATED, "1", "company"))
+        self.assertTupleEqual(
+            self.app.route("/people/1/relationships/company"),
+            ("people", RequestType.RELATIONSHIP, "1", "company"))
+        self.assertEqual(self.app.route("/operations")[1],
+                         RequestType.OPERATIONS)
+        for path in ("people", "/people/", "//1", "/people/1/links/company"):
+            with self.assertRaises(errors.NotFound):
+                self.app.route(path)
+
+    def test_dispatch(self):
+        people = self.app.handler_map["people"]
+        self.assertEqual(
+            self.app.dispatch("people", RequestType.COLLECTION, None, "GET",
+                              ""),
+            people[RequestType.COLLECTION].get)
+        self.assertEqual(
+            self.app.dispatch(None, RequestType.OPERATIONS, None, "POST",
+                              "*/*"),
+            self.app.operations_handler.post)
+        for method, accept, error in (
+                ("DELETE", "", errors.MethodNotAllowed),
+                ("GET", "text/plain", errors.NotAcceptable),
+                ("GET", "image/png", errors.NotAcceptable)):
+            with self.assertRaises(error):
+                self.app.dispatch("people", RequestType.COLLECTION, None,
+                                  method, accept)
+        with self.assertRaises(errors.NotFound):
+            self.app.dispatch("people", RequestType.RELATED, "company",
+                              "GET", "")
+
+    def test_accepted_mimetype(self):
+        for accept, mimetype in (("", JSONAPI_MIMETYPE),
+                                 ("*/*", JSONAPI_MIMETYPE),
+                                 ("text/plain, */*;q=0.1", JSONAPI_MIMETYPE),
+                                 ("text/*", "text/plain"),
+                                 ("image/png", None),
+                                 ('application/vnd.api+json; '
+                                  'ext="https://jsonapi.org/ext/atomic"',
+                                  JSONAPI_MIMETYPE),
+                                 ("application/vnd.api+json;profile=x, "
+                                  "text/plain;q=0.5", JSONAPI_MIMETYPE),
+                                 ("application/vnd.api+json;charset=utf-8",
+                                  None)):
+            self.assertEqual(accepted_mimetype(accept), mimetype)
+        hits = accepted_mimetype.cache_info().hits
+        accepted_mimetype("text/*")
+        self.assertEqual(accepted_mimetype.cache_info().hits, hits + 1)
+
+    def test_sync_handler(self):
+        sent = asyncio.run(call(self.app, "GET", "/api/people",
+                                b"page%5Bsize%5D=2"))
+        status, headers, body = parse(sent)
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b"content-type"],
+                         b"application/vnd.api+json")
+        self.assertDictEqual(body, {"data": []})
+        self.assertListEqual(self.events, [("get", self.events[0][1],
+                                            ["2"])])
+        self.assertTrue(self.events[0][1].startswith("jsonapi"))
+        # GETs check out a connection without a transaction
+        self.sessions[0].connection.assert_called_once_with(
+            execution_options={"isolation_level": "AUTOCOMMIT"})
+        self.sessions[0].close.assert_called_once_with()
+
+    def test_async_handlers_overlap(self):
+        async def run():
+            self.person.started = asyncio.Event()
+            self.person.release = asyncio.Event()
+            return await asyncio.gather(
+                call(self.app, "GET", "/api/people/1"),
+                call(self.app, "GET", "/api/people/2"))
+
+        first, second = asyncio.run(run())
+        self.assertEqual(parse(first)[2]["data"]["id"], "1")
+        self.assertEqual(parse(second)[2]["data"]["id"], "2")
+        self.assertListEqual(self.events[:2], [("start", "1"),
+                                               ("start", "2")])
+        self.assertTrue(all(session.closed for session in self.sessions))
+
+    def test_async_streamed_body(self):
+        sent = asyncio.run(call(self.app, "GET", "/api/feed"))
+        self.assertTrue(sent[1]["more_body"])
+        self.assertNotIn(b"content-length", dict(sent[0]["headers"]))
+        self.assertListEqual([item["id"] for item in parse(sent)[2]["data"]],
+                             ["0", "1", "2"])
+        # The handler never used a session
+        self.assertListEqual(self.sessions, [])
+
+    def test_sync_streamed_body_send_fails(self):
+        async def send(message):
+            if message["type"] == "http.response.body":
+                raise OSError("connection reset")
+
+        scope = {"type": "http", "method": "GET", "path": "/api/pages",
+                 "query_string": b"", "headers": []}
+        messages = [{"type": "http.request", "body": b""}]
+
+        async def receive():
+            return messages.pop(0)
+
+        with self.assertRaises(OSError):
+            asyncio.run(self.app(scope, receive, send))
+        # The thread of the handler rolled back and closed its session
+        self.sessions[0].rollback.assert_called_once_with()
+        self.sessions[0].close.assert_called_once_with()
+
+    def test_errors(self):
+        for method, path, headers, status in (
+                ("GET", "/api/ships", (), 404),
+                ("PUT", "/api/people", (), 405),
+                ("DELETE", "/api/people/1", (), 405),
+                ("GET", "/api/people", ((b"accept", b"image/png"),), 406),
+                ("POST", "/api/people",
+                 ((b"content-type", b"application/vnd.api+json"),), 400)):
+            sent = asyncio.run(call(self.app, method, path, body=b"{",
+                                    headers=headers))
+            self.assertEqual(parse(sent)[0], status)
+            self.assertIn("errors", parse(sent)[2])
+        self.assertListEqual(self.sessions, [])
+
+    def test_handler_errors(self):
+        status, _, body = parse(asyncio.run(
+            call(self.app, "POST", "/api/people")))
+        self.assertEqual(status, 409)
+        self.assertIn("errors", body)
+        self.sessions[0].connection.assert_called_once_with(
+            execution_options=None)
+        self.sessions[0].rollback.assert_called_once_with()
+        self.sessions[0].close.assert_called_once_with()
+
+        # Read only requests have no transaction to roll back
+        status, _, _ = parse(asyncio.run(
+            call(self.app, "GET", "/api/people", b"fail=1")))
+        self.assertEqual(status, 409)
+        self.sessions[1].rollback.assert_not_called()
+        self.sessions[1].close.assert_called_once_with()
+
+        status, _, _ = parse(asyncio.run(
+            call(self.app, "PATCH", "/api/people/1")))
+        self.assertEqual(status, 400)
+        self.assertTrue(self.sessions[2].rolled_back)
+        self.assertTrue(self.sessions[2].closed)
+
+        # GETs of handlers that read in a transaction are rolled back
+        status, _, _ = parse(asyncio.run(call(self.app, "GET",
+                                              "/api/stream")))
+        self.assertEqual(status, 409)
+        self.sessions[3].connection.assert_called_once_with(
+            execution_options=None)
+        self.sessions[3].rollback.assert_called_once_with()
+
+
+class ASGIAPIDatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        # SQLite connections refuse to be used by more than one thread
+        fd, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.engine = create_engine("sqlite:///" + self.path)
+        Base.metadata.create_all(self.engine)
+        session = sessionmaker(bind=self.engine)()
+        session.add_all([CompanyModel(id=i, name="company %d" % i)
+                         for i in range(1, 301)])
+        session.commit()
+        session.close()
+        self.app = ASGIAPI(
+            {"companies": {
+                RequestType.RESOURCE: type(
+                    "CompanyHandler", (ResourceHandler,),
+                    {"resource_class": Company}),
+                RequestType.COLLECTION: type(
+                    "CompaniesHandler", (CollectionHandler,),
+                    {"resource_class": Company, "streaming": True,
+                     "stream_chunk_size": 10}),
+                RequestType.RELATED: {},
+                RequestType.RELATIONSHIP: {}}},
+            sessionmaker(bind=self.engine), api_prefix="/api",
+            max_workers=4)
+
+    def tearDown(self):
+        self.app.executor.shutdown()
+        self.engine.dispose()
+        os.remove(self.path)
+
+    def test_sessions_stay_in_their_thread(self):
+        async def run():
+            return await asyncio.gather(
+                *[call(self.app, "GET", "/api/companies",
+                       b"page%5Bsize%5D=300") for _ in range(5)],
+                call(self.app, "GET", "/api/companies/1"),
+                call(self.app, "GET", "/api/companies/999"))
+
+        responses = asyncio.run(run())
+        for sent in responses[:5]:
+            # The body is sent in more than one chunk
+            self.assertGreater(len(sent), 3)
+            status, _, body = parse(sent)
+            self.assertEqual(status, 200)
+            self.assertEqual(len(body["data"]), 300)
+        self.assertEqual(parse(responses[5])[2]["data"]["id"], "1")
+        self.assertEqual(parse(responses[6])[0], 404)
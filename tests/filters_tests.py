@@ -0,0 +1,189 @@
+#!usr/bin/env python3
+#
+# Copyright 2017 Petuum, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import datetime
+import unittest
+
+from unittest.mock import patch
+
+from sqlalchemy import (create_engine, select, Column, Date, Integer,
+                        String)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from jsonapi_framework.errors import BadRequest, UnsupportedFilter
+from jsonapi_framework.filters import (Filter,
+                                       compile_filter,
+                                       prefix_of,
+                                       upper_bound)
+from jsonapi_framework.query_spec import parse_query_string
+from jsonapi_framework.resource import Resource, Attribute, Id
+
+Base = declarative_base()
+
+
+class PersonModel(Base):
+    __tablename__ = "person"
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    age = Column(Integer)
+    born = Column(Date)
+
+
+class Person(Resource):
+    model_class = PersonModel
+    japi_resource_type = "person"
+    japi_resource_url_component = "people"
+    id = Id()
+    name = Attribute()
+    age = Attribute()
+    born = Attribute()
+
+
+def parse(query_string):
+    return Filter.parse(parse_query_string(query_string).filters, Person)
+
+
+def compile_sql(expression, dialect):
+    return str(select(PersonModel.id).where(expression).compile(
+        dialect=dialect, compile_kwargs={"render_postcompile": True}))
+
+
+class FilterTestCase(unittest.TestCase):
+    def test_equal(self):
+        expression, params, _ = compile_filter(
+            Person, Filter([("name", None, ("ann",)),
+                            ("age", None, ("1", "2"))]))
+        self.assertDictEqual(params, {"filter_0_eq": "ann",
+                                      "filter_1_in": ["1", "2"]})
+        sql = str(expression.compile(dialect=sqlite.dialect()))
+        self.assertIn("person.name = ?", sql)
+        self.assertIn("person.age IN (__[POSTCOMPILE_filter_1_in])", sql)
+
+    def test_like(self):
+        expression, params, _ = compile_filter(
+            Person, Filter([("name", None, ("ann", "b%", "%c"))]), "sqlite")
+        self.assertDictEqual(params, {"filter_0_eq": "ann",
+                                      "filter_0_like_0": "b%",
+                                      "filter_0_like_1": "%c"})
+        self.assertNotIn(">=", compile_sql(expression, sqlite.dialect()))
+
+    def test_prefix_range(self):
+        filter = Filter([("name", None, ("ab%", "a_%")),
+                         ("age", None, ("1%",))])
+        # Only bytewise collations order the strings of a prefix together
+        expression, params, _ = compile_filter(Person, filter, "postgresql")
+        self.assertNotIn("filter_0_like_0_lower", params)
+        self.assertNotIn(">=", compile_sql(expression, postgresql.dialect()))
+
+        with patch.object(PersonModel.name.type, "collation", "C"):
+            expression, params, _ = compile_filter(Person, filter,
+                                                   "postgresql")
+        self.assertDictEqual(params, {
+            "filter_0_like_0": "ab%",
+            "filter_0_like_0_lower": "ab",
+            "filter_0_like_0_upper": "ac",
+            "filter_0_like_1": "a_%",
+            "filter_1_like_0": "1%"})
+        sql = compile_sql(expression, postgresql.dialect())
+        self.assertIn(
+            "person.name >= %(filter_0_like_0_lower)s AND "
+            "person.name < %(filter_0_like_0_upper)s AND "
+            "person.name LIKE %(filter_0_like_0)s", sql)
+        self.assertNotIn("filter_1_like_0_lower", sql)
+
+    def test_cached_by_shape(self):
+        first, _, shape = compile_filter(
+            Person, Filter([("age", None, ("1", "2"))]))
+        second, params, _ = compile_filter(
+            Person, Filter([("age", None, ("3", "4", "5"))]))
+        self.assertIs(first, second)
+        self.assertEqual(params["filter_0_in"], ["3", "4", "5"])
+        self.assertIsNot(compile_filter(
+            Person, Filter([("age", None, ("1",))]))[0], first)
+        self.assertEqual(shape, (("age", None, (2, ())),))
+
+    def test_execute(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+        session.add_all([
+            PersonModel(id=i, name="person{}".format(i), age=i,
+                        born=datetime.date(2000, 1, i) if i % 4 else None)
+            for i in range(1, 13)])
+
+        def ids(filter):
+            expression, params, _ = compile_filter(Person, filter, "sqlite")
+            return session.scalars(select(PersonModel.id).where(expression)
+                                   .order_by(PersonModel.id), params).all()
+
+        self.assertListEqual(
+            ids(Filter([("name", None, ("person1%", "person5")),
+                        ("age", None, ("1", "5", "10", "11"))])),
+            [1, 5, 10, 11])
+        self.assertListEqual(
+            ids(parse("filter[age][gte]=3&filter[age][lt]=7"
+                      "&filter[name][ne]=person4")),
+            [3, 5, 6])
+        self.assertListEqual(
+            ids(parse("filter[born][null]=true&filter[age][ne]=4,12")), [8])
+        self.assertListEqual(
+            ids(parse("filter[born][gt]=2000-01-09&filter[id][in]=2,10,11"
+                      "&filter[born][null]=false")),
+            [10, 11])
+        self.assertListEqual(
+            ids(parse("filter[name][like]=person1_,%2")), [2, 10, 11, 12])
+        session.close()
+        engine.dispose()
+
+    def test_operators(self):
+        filter = parse("filter[age][lte]=5&filter[born][eq]=2000-01-02"
+                       "&filter[name]=a,b&filter[id][eq]=1,2")
+        self.assertTupleEqual(filter.clauses, (
+            ("age", "lte", (5,)),
+            ("born", "eq", (datetime.date(2000, 1, 2),)),
+            ("name", None, ("a", "b")),
+            ("id", "eq", (1, 2))))
+        sql = str(compile_filter(Person, filter)[0].compile(
+            dialect=sqlite.dialect()))
+        self.assertIn("person.age <= ?", sql)
+        self.assertIn("person.born = ?", sql)
+        self.assertIn("person.id IN (__[POSTCOMPILE_filter_3])", sql)
+
+    def test_unsupported_operator(self):
+        with self.assertRaises(UnsupportedFilter) as cm:
+            parse("filter[age][between]=1")
+        self.assertEqual(cm.exception.source_parameter,
+                         "filter[age][between]")
+
+    def test_invalid_operator_value(self):
+        for query_string in ("filter[age][lt]=ten", "filter[age][lt]=1,2",
+                             "filter[born][gte]=yesterday",
+                             "filter[born][null]=maybe"):
+            with self.assertRaises(BadRequest) as cm:
+                parse(query_string)
+            self.assertEqual(cm.exception.source_parameter,
+                             query_string.split("=")[0])
+
+    def test_prefix_of(self):
+        self.assertEqual(prefix_of("abc%"), "abc")
+        for pattern in ("%", "%abc", "a%c%", "a_c%", "a\\%"):
+            self.assertIsNone(prefix_of(pattern))
+
+    def test_upper_bound(self):
+        self.assertEqual(upper_bound("abc"), "abd")
+        self.assertEqual(upper_bound("a\U0010ffff"), "b")
+        self.assertEqual(upper_bound("a\ud7ff"), "a\ue000")
+        self.assertIsNone(upper_bound("\U0010ffff"))
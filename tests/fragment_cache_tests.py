@@ -0,0 +1,102 @@
+#!usr/bin/env python3
+#
+# Copyright 2017 Petuum, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+from unittest.mock import patch
+from jsonapi_framework.fragment_cache import FragmentCache
+from jsonapi_framework.resource import Resource, Attribute, Id
+
+
+class Model(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class Person(Resource):
+    model_class = Model
+    japi_resource_type = "person"
+    japi_resource_url_component = "people"
+    id = Id()
+    name = Attribute()
+
+
+class FragmentCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache = FragmentCache(maxsize=3, ttl=10)
+
+    def test_get_put(self):
+        key = FragmentCache.key("person", "1", ["name"], "/api")
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, {"id": "1"})
+        self.assertEqual(self.cache.get(
+            FragmentCache.key("person", "1", ("name",), "/api")), {"id": "1"})
+        self.assertIsNone(self.cache.get(
+            FragmentCache.key("person", "1", None, "/api")))
+        info = self.cache.info()
+        self.assertEqual((info.hits, info.misses, info.currsize), (1, 2, 1))
+
+    def test_ttl(self):
+        key = FragmentCache.key("person", "1", None, "")
+        with patch('jsonapi_framework.fragment_cache.time.monotonic') as \
+                monotonic:
+            monotonic.return_value = 100
+            self.cache.put(key, {"id": "1"})
+            monotonic.return_value = 109
+            self.assertIsNotNone(self.cache.get(key))
+            monotonic.return_value = 110
+            self.assertIsNone(self.cache.get(key))
+        self.assertEqual(self.cache.info().currsize, 0)
+
+    def test_eviction(self):
+        keys = [FragmentCache.key("person", str(i), None, "")
+                for i in range(4)]
+        for key in keys[:3]:
+            self.cache.put(key, {})
+        # Makes keys[1] the least recently used
+        self.cache.get(keys[0])
+        self.cache.put(keys[3], {})
+        self.assertIsNone(self.cache.get(keys[1]))
+        self.assertIsNotNone(self.cache.get(keys[0]))
+        self.assertEqual(self.cache.info().evictions, 1)
+
+    def test_invalidate(self):
+        for fields in (None, ["name"], ["age"]):
+            self.cache.put(FragmentCache.key("person", "1", fields, ""), {})
+        other = FragmentCache.key("person", "2", None, "")
+        self.cache.put(other, {})
+        self.cache.invalidate("person", "1")
+        self.cache.invalidate("company", "1")
+        self.assertEqual(self.cache.info().currsize, 1)
+        self.assertIsNotNone(self.cache.get(other))
+
+    def test_serialize(self):
+        person = Person(Model(id=1, name="ann"))
+        with patch.object(Person, "serialize", autospec=True,
+                          return_value={"id": "1"}) as serialize:
+            for _ in range(2):
+                self.assertEqual(
+                    self.cache.serialize(person, "/api", ["name"]),
+                    {"id": "1"})
+        serialize.assert_called_once_with(person, link_prefix="/api",
+                                          fields=["name"])
+        self.assertIsNotNone(self.cache.get(
+            FragmentCache.key("person", "1", ["name"], "/api")))
+
+    def test_clear(self):
+        self.cache.put(FragmentCache.key("person", "1", None, ""), {})
+        self.cache.get(FragmentCache.key("person", "1", None, ""))
+        self.cache.clear()
+        self.assertEqual(self.cache.info(), (0, 0, 0, 3, 0))
@@ -13,6 +13,7 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import datetime
 import unittest
 import werkzeug
 
@@ -21,14 +22,26 @@ from unittest.mock import MagicMock
 from jsonapi_framework.handler import (ResourceHandler,
                                        CollectionHandler,
                                        RelatedHandler,
-                                       ToOneRelationshipHandler)
+                                       ToOneRelationshipHandler,
+                                       batch_ids,
+                                       get_included,
+                                       include_fields)
+from jsonapi_framework.filters import Filter
+from jsonapi_framework.pagination import MAX_LIMIT, Keyset
+from jsonapi_framework.query_spec import QuerySpec, parse_query_string
+from jsonapi_framework.resource import (Resource,
+                                        Attribute,
+                                        ToOneRelationship,
+                                        Id)
 from jsonapi_framework.response import Response
+import jsonapi_framework.errors as errors
+import jsonapi_framework.sqlalchemy_dal as dal
 
 
 class ResourceHandlerTestCase(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
-        resource = MagicMock()
+        resource = MagicMock(version_column=None, updated_at_column=None)
         cls.resource_helper = ResourceHandler
         cls.resource_helper.resource_class = resource
 
@@ -43,6 +56,9 @@ class ResourceHandlerTestCase(unittest.TestCase):
 
     def test_get(self):
         mock_requests = MagicMock()
+        mock_requests.query_args = werkzeug.MultiDict()
+        mock_requests.query_spec = QuerySpec.from_args(
+            mock_requests.query_args)
         with patch('jsonapi_framework.handler.get_sparse_fields') as \
                 get_sparse_fields, \
                 patch('jsonapi_framework.handler.dal.query_resource') as \
@@ -160,11 +176,28 @@ class ResourceHandlerTestCase(unittest.TestCase):
             self.assertEqual(
                 self.resource_helper.delete(mock_requests).status, resp.status)
 
+    def test_delete_invalidates_fragments(self):
+        mock_requests = MagicMock()
+        resource_class = self.resource_helper.resource_class
+        with patch('jsonapi_framework.handler.'
+                   'dal.query_resource') as query_resource, \
+                patch('jsonapi_framework.handler.dal.commit'), \
+                patch('jsonapi_framework.handler.dal.delete'), \
+                patch('jsonapi_framework.handler.'
+                      'fragment_cache.FRAGMENT_CACHE') as cache:
+            query_resource.return_value = MagicMock()
+            self.resource_helper.delete(mock_requests)
+            cache.invalidate.assert_called_once_with(
+                resource_class.japi_resource_type,
+                resource_class.id.serialize.return_value)
+
 
 class CollectionHandlerTestCase(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
-        resource = MagicMock()
+        resource = MagicMock(version_column=None, updated_at_column=None,
+                             default_page_size=None, max_page_size=None,
+                             small_collection=False)
         cls.collection_helper = CollectionHandler
         cls.collection_helper.resource_class = resource
 
@@ -176,6 +209,22 @@ class CollectionHandlerTestCase(unittest.TestCase):
             self.assertEqual("/nar1/nar2/nar3",
                              self.collection_helper.link(link_prefix))
 
+    def test_read_in_transaction(self):
+        resource = MagicMock(version_column=None, updated_at_column=None,
+                             max_page_size=None, small_collection=False)
+        handler = type("Handler", (CollectionHandler,),
+                       {"resource_class": resource})
+        self.assertFalse(handler.read_in_transaction())
+        for attributes in ({"small_collection": True},
+                           {"max_page_size": 5000},
+                           {"updated_at_column": "updated_at"}):
+            with patch.multiple(resource, **attributes):
+                self.assertTrue(handler.read_in_transaction())
+        with patch.object(handler, "streaming", True):
+            self.assertTrue(handler.read_in_transaction())
+            with patch.object(handler, "stream_chunk_size", None):
+                self.assertFalse(handler.read_in_transaction())
+
     def test_get(self):
         mock_requests = MagicMock()
         mock_requests.query_args = \
@@ -184,6 +233,8 @@ class CollectionHandlerTestCase(unittest.TestCase):
                                 ('filter[col1]', '%search_value1%'),
                                 ('page[number]', '1'),
                                 ('page[size]', '2')])
+        mock_requests.query_spec = QuerySpec.from_args(
+            mock_requests.query_args)
         with patch('jsonapi_framework.handler.'
                    'get_sparse_fields') as get_sparse_fields, \
                 patch('jsonapi_framework.handler.'
@@ -202,7 +253,7 @@ class CollectionHandlerTestCase(unittest.TestCase):
             get_sparse_fields.return_value = ["col1"], \
                                              ["col1"]
             get_filter.return_value = \
-                [{"field": "col1", "op": "like", "value": "%search_value1%"}]
+                Filter([("col1", None, ("%search_value1%",))])
             get_order_by_fields.return_value = ["-rel1_id"]
             resource1 = MagicMock()
             resource2 = MagicMock()
@@ -306,6 +357,186 @@ class CollectionHandlerTestCase(unittest.TestCase):
             })
             self.assertDictEqual(
                 self.collection_helper.get(mock_requests).body, response.body)
+            # The count respects the filters
+            self.assertEqual(query_total_number_resources.call_args[0][2],
+                             get_filter.return_value)
+
+    def test_get_streaming(self):
+        mock_requests = MagicMock()
+        mock_requests.query_args = werkzeug.MultiDict([("page[size]", "all")])
+        mock_requests.query_spec = QuerySpec.from_args(
+            mock_requests.query_args)
+        with patch('jsonapi_framework.handler.'
+                   'get_sparse_fields') as get_sparse_fields, \
+                patch('jsonapi_framework.handler.'
+                      'get_filter') as get_filter, \
+                patch('jsonapi_framework.handler.'
+                      'get_order_by_fields') as get_order_by_fields, \
+                patch('jsonapi_framework.handler.'
+                      'dal.query_collection') as query_collection, \
+                patch('jsonapi_framework.handler.'
+                      'dal.query_total_number_resources') as \
+                query_total_number_resources, \
+                patch('jsonapi_framework.handler.'
+                      'CollectionHandler.link') as self_link, \
+                patch('jsonapi_framework.handler.'
+                      'CollectionHandler.streaming', True), \
+                patch.object(self.collection_helper.resource_class,
+                             "small_collection", True):
+            get_sparse_fields.return_value = None, None
+            get_filter.return_value = None
+            get_order_by_fields.return_value = []
+            resource = MagicMock()
+            resource.serialize.return_value = {"type": "foo", "id": "1"}
+            query_collection.return_value = iter([resource])
+            self_link.return_value = "/nar1/nar2/nar3"
+            response = self.collection_helper.get(mock_requests)
+            self.assertTrue(response.is_streamed)
+            resource.serialize.assert_not_called()
+            self.assertListEqual(list(response.body["data"]),
+                                 [{"type": "foo", "id": "1"}])
+            # Without pagination there is nothing to count for
+            query_total_number_resources.assert_not_called()
+            # Streamed responses read from a server-side cursor
+            self.assertEqual(query_collection.call_args[1]["chunk_size"],
+                             self.collection_helper.stream_chunk_size)
+
+    def test_get_default_page(self):
+        mock_requests = MagicMock()
+        mock_requests.query_args = werkzeug.MultiDict([("page[size]", "all")])
+        mock_requests.query_spec = QuerySpec.from_args(
+            mock_requests.query_args)
+        mock_requests.link_prefix = ""
+        with patch('jsonapi_framework.handler.'
+                   'get_sparse_fields') as get_sparse_fields, \
+                patch('jsonapi_framework.handler.'
+                      'get_filter') as get_filter, \
+                patch('jsonapi_framework.handler.'
+                      'get_order_by_fields') as get_order_by_fields, \
+                patch('jsonapi_framework.handler.'
+                      'dal.query_collection') as query_collection, \
+                patch('jsonapi_framework.handler.'
+                      'dal.query_total_number_resources') as \
+                query_total_number_resources, \
+                patch.object(self.collection_helper.resource_class,
+                             "max_page_size", 10):
+            get_sparse_fields.return_value = None, None
+            get_filter.return_value = None
+            get_order_by_fields.return_value = []
+            query_collection.return_value = []
+            query_total_number_resources.return_value = 15
+            self.collection_helper.resource_class.\
+                japi_resource_url_component = "foo"
+            # "all" is only honored for small collections
+            response = self.collection_helper.get(mock_requests)
+            self.assertEqual(query_collection.call_args[1],
+                             {"limit": 10, "offset": 0, "columns": None,
+                              "chunk_size": None})
+            self.assertEqual(response.body["links"]["next"],
+                             "/foo?page%5Bsize%5D=10&page%5Bnumber%5D=2")
+            self.assertDictEqual(response.body["meta"], {"total-pages": 2})
+
+            mock_requests.query_args = werkzeug.MultiDict()
+            mock_requests.query_spec = QuerySpec.from_args(
+                mock_requests.query_args)
+            with patch.object(self.collection_helper.resource_class,
+                              "default_page_size", 5):
+                response = self.collection_helper.get(mock_requests)
+            self.assertEqual(query_collection.call_args[1],
+                             {"limit": 5, "offset": 0, "columns": None,
+                              "chunk_size": None})
+            self.assertDictEqual(response.body["meta"], {"total-pages": 3})
+
+    def test_get_window_count(self):
+        mock_requests = MagicMock()
+        mock_requests.query_args = werkzeug.MultiDict(
+            [("page[size]", "2"), ("page[number]", "2")])
+        mock_requests.query_spec = QuerySpec.from_args(
+            mock_requests.query_args)
+        mock_requests.link_prefix = ""
+        with patch('jsonapi_framework.handler.'
+                   'get_sparse_fields') as get_sparse_fields, \
+                patch('jsonapi_framework.handler.'
+                      'get_filter') as get_filter, \
+                patch('jsonapi_framework.handler.'
+                      'get_order_by_fields') as get_order_by_fields, \
+                patch('jsonapi_framework.handler.'
+                      'dal.query_collection_with_total') as \
+                query_collection_with_total, \
+                patch('jsonapi_framework.handler.'
+                      'dal.query_total_number_resources') as \
+                query_total_number_resources, \
+                patch('jsonapi_framework.handler.'
+                      'CollectionHandler.count_mode',
+                      dal.CountMode.WINDOW):
+            get_sparse_fields.return_value = None, None
+            get_filter.return_value = None
+            get_order_by_fields.return_value = []
+            resource = MagicMock()
+            resource.serialize.return_value = {"type": "foo", "id": "3"}
+            query_collection_with_total.return_value = [resource], 3
+            self.collection_helper.resource_class.\
+                japi_resource_url_component = "foo"
+            response = self.collection_helper.get(mock_requests)
+            self.assertEqual(
+                query_collection_with_total.call_args[1],
+                {"limit": 2, "offset": 2, "columns": None})
+            query_total_number_resources.assert_not_called()
+            self.assertDictEqual(response.body["meta"], {"total-pages": 2})
+            self.assertNotIn("next", response.body["links"])
+
+    def test_get_conditional(self):
+        mock_requests = MagicMock()
+        mock_requests.query_args = werkzeug.MultiDict()
+        mock_requests.query_spec = QuerySpec.from_args(
+            mock_requests.query_args)
+        mock_requests.headers = {}
+        mock_requests.link_prefix = ""
+        with patch('jsonapi_framework.handler.'
+                   'dal.query_collection') as query_collection, \
+                patch('jsonapi_framework.handler.'
+                      'dal.query_collection_version') as \
+                query_collection_version, \
+                patch.object(self.collection_helper.resource_class,
+                             "updated_at_column", "updated_at"):
+            query_collection.return_value = []
+            query_collection_version.return_value = (
+                None, datetime.datetime(2020, 1, 2, 3, 4, 5), None, 0)
+            response = self.collection_helper.get(mock_requests)
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.headers["Last-Modified"],
+                             "Thu, 02 Jan 2020 03:04:05 GMT")
+            query_collection.reset_mock()
+
+            for headers in ({"If-None-Match": response.headers["ETag"]},
+                            {"If-Modified-Since":
+                             "Thu, 02 Jan 2020 03:04:05 GMT"}):
+                mock_requests.headers = headers
+                response = self.collection_helper.get(mock_requests)
+                self.assertEqual(response.status, 304)
+                self.assertIsNone(response.body)
+                query_collection.assert_not_called()
+
+            mock_requests.headers = {
+                "If-Modified-Since": "Thu, 02 Jan 2020 03:04:04 GMT"}
+            self.assertEqual(self.collection_helper.get(mock_requests).status,
+                             200)
+
+            # Without an exact count the aggregate is only run when asked
+            query_collection_version.reset_mock()
+            handler = type("Handler", (self.collection_helper,),
+                           {"count_mode": dal.CountMode.CACHED})
+            with patch('jsonapi_framework.handler.'
+                       'dal.query_total_number_resources') as count:
+                count.return_value = 0
+                mock_requests.headers = {}
+                self.assertNotIn("ETag", handler.get(mock_requests).headers)
+                query_collection_version.assert_not_called()
+                with patch.object(handler, "send_validators", True):
+                    self.assertIn("ETag", handler.get(mock_requests).headers)
+                mock_requests.headers = {"If-None-Match": '"x"'}
+                self.assertIn("ETag", handler.get(mock_requests).headers)
+            self.assertEqual(query_collection_version.call_count, 2)
 
     def test_post(self):
         mock_requests = MagicMock()
@@ -516,3 +747,376 @@ class ToOneRelationshipHandlerTestCase(unittest.TestCase):
                 self.toOneRelation_helper.patch(mock_requests).status,
                 resp.status
             )
+
+
+class Model(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class Company(Resource):
+    model_class = Model
+    japi_resource_type = "company"
+    japi_resource_url_component = "companies"
+    id = Id()
+    name = Attribute()
+
+
+class Person(Resource):
+    model_class = Model
+    japi_resource_type = "person"
+    japi_resource_url_component = "people"
+    id = Id()
+    name = Attribute()
+    company = ToOneRelationship("company_id", Company, nullable=True)
+
+
+class Article(Resource):
+    model_class = Model
+    japi_resource_type = "article"
+    japi_resource_url_component = "articles"
+    id = Id()
+    title = Attribute()
+    author = ToOneRelationship("author_id", Person)
+    editor = ToOneRelationship("editor_id", Person, nullable=True)
+
+
+class IncludeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.models = {
+            Company: {1: Model(id=1, name="acme")},
+            Person: {1: Model(id=1, name="ann", company_id=1),
+                     2: Model(id=2, name="bob", company_id=None)},
+        }
+
+    def query_resources_by_ids(self, session, resource_class, ids,
+                               fields=None):
+        return [resource_class(self.models[resource_class][id])
+                for id in sorted(ids)]
+
+    def test_include_fields(self):
+        self.assertIsNone(include_fields(None, Article, {"author": {}}))
+        self.assertListEqual(
+            include_fields(["title", "author_id"], Article,
+                           {"author": {}, "editor": {}}),
+            ["title", "author_id", "editor_id"])
+
+    def test_get_included(self):
+        mock_requests = MagicMock()
+        mock_requests.link_prefix = ""
+        mock_requests.query_args = werkzeug.MultiDict(
+            [("fields[person]", "company")])
+        mock_requests.query_spec = QuerySpec.from_args(
+            mock_requests.query_args)
+        articles = [Article(Model(id=1, title="a", author_id=1,
+                                  editor_id=2)),
+                    Article(Model(id=2, title="b", author_id=1,
+                                  editor_id=None))]
+        with patch('jsonapi_framework.handler.'
+                   'dal.query_resources_by_ids') as query_resources_by_ids:
+            query_resources_by_ids.side_effect = self.query_resources_by_ids
+            included = get_included(
+                mock_requests, Article, articles,
+                {"author": {"company": {}}, "editor": {}})
+        # One query per relationship and level, each for the whole page
+        self.assertListEqual(
+            [(c[0][1], set(c[0][2]), c[0][3])
+             for c in query_resources_by_ids.call_args_list],
+            [(Person, {1}, ["company_id"]),
+             (Company, {1}, None),
+             (Person, {2}, ["company_id"])])
+        self.assertListEqual(
+            [(doc["type"], doc["id"]) for doc in included],
+            [("person", "1"), ("company", "1"), ("person", "2")])
+        self.assertNotIn("attributes", included[0])
+
+
+class BulkPostTestCase(unittest.TestCase):
+    def setUp(self):
+        self.handler = type("PeopleHandler", (CollectionHandler,),
+                            {"resource_class": Person, "bulk_post": True})
+        self.request = MagicMock()
+        self.request.link_prefix = ""
+        self.request.query_spec = QuerySpec()
+
+    def test_post_bulk(self):
+        company = {"data": {"type": "company", "id": "1"}}
+        self.request.body = {"data": [
+            {"type": "person", "attributes": {"name": "ann"},
+             "relationships": {"company": company}},
+            {"type": "person", "attributes": {"name": "bob"},
+             "relationships": {"company": company}}]}
+
+        def add_all(session, models, chunk_size):
+            for id, model in enumerate(models, 1):
+                model.id = id
+
+        with patch('jsonapi_framework.handler.dal.add_all') as dal_add_all, \
+                patch('jsonapi_framework.handler.dal.commit') as dal_commit:
+            dal_add_all.side_effect = add_all
+            response = self.handler.post(self.request)
+        self.assertEqual(response.status, 201)
+        self.assertEqual(dal_add_all.call_count, 1)
+        dal_commit.assert_called_once_with(self.request.session)
+        self.assertListEqual(
+            [(doc["id"], doc["attributes"]["name"])
+             for doc in response.body["data"]],
+            [("1", "ann"), ("2", "bob")])
+        self.assertDictEqual(response.body["links"], {"self": "/people"})
+
+    def test_post_bulk_errors(self):
+        self.request.body = {"data": [
+            {"type": "person", "attributes": {"name": "ann"}},
+            {"type": "person", "attributes": {"bogus": 1}},
+            "not an object"]}
+        with patch('jsonapi_framework.handler.dal.add_all') as dal_add_all:
+            with self.assertRaises(errors.ErrorList) as context:
+                self.handler.post(self.request)
+        dal_add_all.assert_not_called()
+        self.assertListEqual(
+            [error.source_pointer for error in context.exception.errors],
+            ["/data/1", "/data/2/"])
+
+    def test_post_array_without_bulk(self):
+        self.request.body = {"data": []}
+        with self.assertRaises(errors.BadRequest):
+            CollectionHandler.post(self.request)
+
+
+class BatchGetTestCase(unittest.TestCase):
+    def setUp(self):
+        self.handler = type("PeopleHandler", (CollectionHandler,),
+                            {"resource_class": Person})
+        self.request = MagicMock()
+        self.request.link_prefix = ""
+        self.models = {1: Model(id=1, name="ann", company_id=None),
+                       2: Model(id=2, name="bob", company_id=None),
+                       3: Model(id=3, name="cat", company_id=None)}
+
+    def query_resources_by_ids(self, session, resource_class, ids,
+                               fields=None):
+        return [resource_class(self.models[id])
+                for id in sorted(ids) if id in self.models]
+
+    def test_batch_ids(self):
+        self.assertTupleEqual(
+            batch_ids(parse_query_string("filter[id]=3,1&include=company")),
+            ("3", "1"))
+        self.assertTupleEqual(
+            batch_ids(parse_query_string("filter[id][in]=2")), ("2",))
+        for query_string in ("filter[id]=1&filter[name]=ann",
+                             "filter[id]=1&sort=name",
+                             "filter[id]=1&page[size]=1",
+                             "filter[id]=1%", "filter[id][lt]=3",
+                             "filter[name]=ann"):
+            self.assertIsNone(batch_ids(parse_query_string(query_string)))
+
+    def test_get_batch(self):
+        self.request.query_spec = parse_query_string(
+            "filter[id]=3,7,1,03&fields[person]=name")
+        with patch('jsonapi_framework.handler.'
+                   'dal.query_resources_by_ids') as query_resources_by_ids, \
+                patch('jsonapi_framework.handler.'
+                      'dal.query_collection') as query_collection:
+            query_resources_by_ids.side_effect = self.query_resources_by_ids
+            response = self.handler.get(self.request)
+        query_collection.assert_not_called()
+        self.assertEqual(query_resources_by_ids.call_args[0][2], [3, 7, 1])
+        self.assertListEqual(
+            [(doc["id"], doc["attributes"]["name"])
+             for doc in response.body["data"]],
+            [("3", "cat"), ("1", "ann")])
+        self.assertDictEqual(response.body["meta"], {"missing": ["7"]})
+
+    def test_get_batch_conditional(self):
+        self.request.query_args = werkzeug.MultiDict([("filter[id]", "1,2")])
+        self.request.query_spec = parse_query_string(
+            "filter[id]=1,2&fields[person]=name")
+        self.request.headers = {}
+        for id, day in ((1, 3), (2, 2)):
+            self.models[id].updated_at = datetime.datetime(2020, 1, day)
+        with patch('jsonapi_framework.handler.'
+                   'dal.query_resources_by_ids') as query_resources_by_ids, \
+                patch.object(Person, "updated_at_column", "updated_at"), \
+                patch.object(self.handler, "streaming", True):
+            query_resources_by_ids.side_effect = self.query_resources_by_ids
+            response = self.handler.get(self.request)
+            self.assertEqual(query_resources_by_ids.call_args[0][3],
+                             ["name", "updated_at"])
+            self.assertEqual(response.headers["Last-Modified"],
+                             "Fri, 03 Jan 2020 00:00:00 GMT")
+            self.assertTrue(response.is_streamed)
+
+            self.request.headers = {"If-None-Match": response.headers["ETag"]}
+            self.assertEqual(self.handler.get(self.request).status, 304)
+            del self.models[2]
+            self.assertEqual(self.handler.get(self.request).status, 200)
+
+    def test_get_batch_version(self):
+        self.request.query_args = werkzeug.MultiDict([("filter[id]", "1,2")])
+        self.request.query_spec = parse_query_string("filter[id]=1,2")
+        self.request.headers = {}
+        self.models[1].version = 1
+        self.models[2].version = 5
+        with patch('jsonapi_framework.handler.'
+                   'dal.query_resources_by_ids') as query_resources_by_ids, \
+                patch.object(Person, "version_column", "version"):
+            query_resources_by_ids.side_effect = self.query_resources_by_ids
+            etag = self.handler.get(self.request).headers["ETag"]
+            self.request.headers = {"If-None-Match": etag}
+            self.assertEqual(self.handler.get(self.request).status, 304)
+            # Resource 1 does not have the largest version
+            self.models[1].version = 2
+            self.assertEqual(self.handler.get(self.request).status, 200)
+
+    def test_get_batch_invalid(self):
+        for query_string in ("filter[id]=1,x", "filter[id]=1,2,3,4"):
+            self.request.query_spec = parse_query_string(query_string)
+            with patch.object(self.handler, "max_batch_ids", 3), \
+                    self.assertRaises(errors.BadRequest) as context:
+                self.handler.get(self.request)
+            self.assertEqual(context.exception.source_parameter,
+                             "filter[id]")
+
+        # An Id with a custom fget has no column to query
+        self.request.query_spec = parse_query_string("filter[id]=1")
+        with patch.object(Person.id, "mapped_pk_name", None), \
+                self.assertRaises(errors.BadRequest) as context:
+            self.handler.get(self.request)
+        self.assertEqual(context.exception.source_parameter, "filter[id]")
+
+
+class KeysetGetTestCase(unittest.TestCase):
+    def setUp(self):
+        self.handler = type("PeopleHandler", (CollectionHandler,),
+                            {"resource_class": Person,
+                             "pagination_class": Keyset})
+        self.request = MagicMock()
+        self.request.link_prefix = ""
+        self.request.headers = {}
+
+    def get(self, query_string):
+        self.request.query_args = werkzeug.MultiDict(
+            werkzeug.urls.url_decode(query_string))
+        self.request.query_spec = parse_query_string(query_string)
+        with patch('jsonapi_framework.handler.'
+                   'dal.query_collection') as query_collection, \
+                patch('jsonapi_framework.handler.'
+                      'dal.check_keyset_order') as check_keyset_order:
+            query_collection.side_effect = lambda *args, **kwargs: [
+                Person(Model(id=i, name="p", company_id=None))
+                for i in range(1, kwargs["limit"] + 1)]
+            response = self.handler.get(self.request)
+        check_keyset_order.assert_called_once_with(
+            Person, query_collection.call_args[0][3])
+        return response, query_collection.call_args[1]
+
+    def test_get_chunk_size(self):
+        response, kwargs = self.get("page[size]=2")
+        self.assertEqual(len(response.body["data"]), 2)
+        self.assertIsNone(kwargs["chunk_size"])
+        with patch.object(self.handler, "stream_chunk_size", 2):
+            # Reads the extra row telling whether there is a next page
+            _, kwargs = self.get("page[size]=2")
+            self.assertEqual(kwargs["chunk_size"], 2)
+            with patch.object(self.handler, "streaming", True):
+                response, kwargs = self.get("page[size]=1")
+        self.assertEqual(kwargs["chunk_size"], 2)
+        self.assertListEqual([r["id"] for r in response.body["data"]],
+                             ["1"])
+
+    def test_read_in_transaction(self):
+        # The largest page reads one row more than stream_chunk_size
+        self.assertEqual(self.handler.stream_chunk_size, MAX_LIMIT)
+        _, kwargs = self.get("page[size]={}".format(MAX_LIMIT))
+        self.assertEqual(kwargs["limit"], MAX_LIMIT + 1)
+        self.assertIsNotNone(kwargs["chunk_size"])
+        self.assertTrue(self.handler.read_in_transaction())
+        with patch.object(Person, "max_page_size", MAX_LIMIT - 1):
+            _, kwargs = self.get("page[size]={}".format(MAX_LIMIT - 1))
+            self.assertIsNone(kwargs["chunk_size"])
+            self.assertFalse(self.handler.read_in_transaction())
+
+
+class CoreWritesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.handler = type("PersonHandler", (ResourceHandler,),
+                            {"resource_class": Person, "core_writes": True})
+        self.request = MagicMock()
+        self.request.id = "1"
+        self.request.link_prefix = ""
+        self.request.query_spec = QuerySpec()
+        self.request.body = {"data": {
+            "type": "person", "id": "1", "attributes": {"name": "ann"}}}
+
+    def test_patch(self):
+        row = Model(id=1, name="ann", company_id=None)
+        with patch('jsonapi_framework.handler.'
+                   'dal.update_resource') as update_resource, \
+                patch('jsonapi_framework.handler.'
+                      'dal.query_resource') as query_resource, \
+                patch('jsonapi_framework.handler.dal.commit'):
+            update_resource.return_value = Person(row)
+            response = self.handler.patch(self.request)
+        query_resource.assert_not_called()
+        self.assertEqual(update_resource.call_args[0][1:],
+                         (Person, 1, {"name": "ann"},
+                          ["id", "name", "company_id"]))
+        self.assertEqual(response.body["data"]["attributes"],
+                         {"name": "ann"})
+
+    def test_patch_not_found(self):
+        with patch('jsonapi_framework.handler.'
+                   'dal.update_resource') as update_resource:
+            update_resource.return_value = None
+            with self.assertRaises(errors.NotFound):
+                self.handler.patch(self.request)
+
+    def test_patch_before_patch_overridden(self):
+        handler = type("HookedPersonHandler", (self.handler,), {
+            "before_patch": classmethod(lambda cls, resource, patch: None)})
+        with patch('jsonapi_framework.handler.'
+                   'dal.update_resource') as update_resource, \
+                patch('jsonapi_framework.handler.'
+                      'dal.query_resource') as query_resource, \
+                patch('jsonapi_framework.handler.dal.commit'):
+            query_resource.return_value = Person(
+                Model(id=1, name="bob", company_id=None))
+            handler.patch(self.request)
+        update_resource.assert_not_called()
+        query_resource.assert_called_once()
+
+    def test_patch_resource_overridden(self):
+        for name in ("validate", "apply_patch_dict"):
+            resource_class = type("CustomPerson", (Person,), {
+                name: lambda self, *args: None})
+            handler = type("CustomPersonHandler", (self.handler,),
+                           {"resource_class": resource_class})
+            self.assertFalse(handler.can_patch_core())
+        self.assertTrue(self.handler.can_patch_core())
+
+    def test_custom_id(self):
+        class CustomId(Id):
+            def serialize(self, model):
+                return "p" + super().serialize(model)
+
+        resource_class = type("CustomPerson", (Person,), {"id": CustomId()})
+        handler = type("CustomPersonHandler", (self.handler,),
+                       {"resource_class": resource_class})
+        self.assertFalse(handler.can_delete_core())
+        self.assertTrue(self.handler.can_delete_core())
+        # Its fragments are cached by the serialized id
+        self.assertFalse(handler.can_patch_core())
+
+    def test_delete(self):
+        with patch('jsonapi_framework.handler.'
+                   'dal.delete_resource') as delete_resource, \
+                patch('jsonapi_framework.handler.'
+                      'dal.query_resource') as query_resource, \
+                patch('jsonapi_framework.handler.dal.commit'):
+            delete_resource.return_value = True
+            self.assertEqual(self.handler.delete(self.request).status, 204)
+            delete_resource.return_value = False
+            with self.assertRaises(errors.NotFound):
+                self.handler.delete(self.request)
+        query_resource.assert_not_called()
@@ -0,0 +1,88 @@
+#!usr/bin/env python3
+#
+# Copyright 2017 Petuum, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import datetime
+import json
+import unittest
+
+from unittest.mock import patch
+from jsonapi_framework.json_codec import (JSONCodec,
+                                          JSON_CODEC_FACTORIES,
+                                          apply_object_hook,
+                                          available_json_codecs,
+                                          get_json_codec,
+                                          register_json_codec)
+
+
+class JSONCodecTestCase(unittest.TestCase):
+    document = {
+        "data": [{"type": "foo", "id": "1",
+                  "attributes": {"name": "été", "size": 1024,
+                                 "ratio": 0.5, "ok": True, "none": None}}],
+        "links": {"self": "/foo"}
+    }
+
+    def test_roundtrip(self):
+        for codec in available_json_codecs():
+            for pretty in (True, False):
+                data = codec.dumps(self.document, None, pretty)
+                self.assertIsInstance(data, bytes)
+                self.assertDictEqual(json.loads(data), self.document)
+                self.assertDictEqual(codec.loads(data), self.document)
+                self.assertDictEqual(codec.loads(data.decode("utf-8")),
+                                     self.document)
+
+    def test_default(self):
+        def default(obj):
+            return {"$date": obj.isoformat()}
+        value = {"at": datetime.datetime(2017, 1, 2)}
+        for codec in available_json_codecs():
+            self.assertDictEqual(
+                json.loads(codec.dumps(value, default, False)),
+                {"at": {"$date": "2017-01-02T00:00:00"}})
+
+    def test_object_hook(self):
+        def hook(obj):
+            return obj.get("$x", obj)
+        data = b'{"a": [{"$x": 1}, {"b": {"$x": 2}}]}'
+        for codec in available_json_codecs():
+            self.assertDictEqual(codec.loads(data, hook),
+                                 {"a": [1, {"b": 2}]})
+
+    def test_apply_object_hook_bottom_up(self):
+        seen = []
+
+        def hook(obj):
+            seen.append(dict(obj))
+            return obj
+        apply_object_hook({"a": {"b": {}}}, hook)
+        self.assertListEqual(seen, [{}, {"b": {}}, {"a": {"b": {}}}])
+
+    def test_stdlib_always_available(self):
+        self.assertEqual(get_json_codec("json").name, "json")
+        self.assertEqual(available_json_codecs()[-1].name, "json")
+
+    def test_register_preferred(self):
+        codec = JSONCodec("fake", None, None)
+        with patch.dict(JSON_CODEC_FACTORIES):
+            register_json_codec("fake", lambda: codec, preferred=True)
+            self.assertIs(get_json_codec(), codec)
+
+    def test_unavailable_codec_skipped(self):
+        def missing():
+            raise ImportError()
+        with patch.dict(JSON_CODEC_FACTORIES):
+            register_json_codec("missing", missing, preferred=True)
+            self.assertNotEqual(get_json_codec().name, "missing")
@@ -0,0 +1,210 @@
+#!usr/bin/env python3
+#
+# Copyright 2017 Petuum, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from unittest.mock import MagicMock, patch
+import jsonapi_framework.errors as errors
+from jsonapi_framework.handler import CollectionHandler, ResourceHandler
+from jsonapi_framework.operations import (ATOMIC_MIMETYPE,
+                                          OperationsHandler,
+                                          resolve_lid)
+from jsonapi_framework.request import RequestType
+from jsonapi_framework.response import Response
+from jsonapi_framework.tests.sqlalchemy_dal_tests import (Base,
+                                                          Company,
+                                                          CompanyModel)
+
+
+def make_handler(resource_type, calls):
+    def record(method):
+        def handle(cls, request):
+            calls.append((resource_type, method, request.id,
+                          request.relationship, request.body))
+            if method == "post":
+                data = dict(request.body["data"], id=str(len(calls)))
+                return Response({"data": data, "links": {}}, 201)
+            if method == "patch":
+                return Response({"data": request.body["data"]})
+            return Response(None, 204)
+        return classmethod(handle)
+
+    return type("Handler", (object,), {
+        "resource_class": MagicMock(japi_resource_type=resource_type),
+        "post": record("post"),
+        "patch": record("patch"),
+        "delete": record("delete")})
+
+
+class OperationsHandlerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        handler_map = {}
+        for url_component, resource_type in (("people", "person"),
+                                             ("companies", "company")):
+            handler = make_handler(resource_type, self.calls)
+            handler_map[url_component] = {
+                RequestType.RESOURCE: handler,
+                RequestType.COLLECTION: handler,
+                RequestType.RELATED: {},
+                RequestType.RELATIONSHIP: {"company": handler}}
+        self.handler = type("Operations", (OperationsHandler,),
+                            {"handler_map": handler_map})
+        self.request = MagicMock()
+        self.request.link_prefix = ""
+
+    def post(self, *operations):
+        self.request.body = {"atomic:operations": list(operations)}
+        with patch('jsonapi_framework.operations.dal.commit') as commit:
+            response = self.handler.post(self.request)
+        commit.assert_called_once_with(self.request.session)
+        return response
+
+    def test_post(self):
+        company = {"type": "company", "lid": "c"}
+        response = self.post(
+            {"op": "add", "data": dict(company, attributes={"name": "a"})},
+            {"op": "add", "data": {
+                "type": "person", "attributes": {"name": "ann"},
+                "relationships": {"company": {"data": company}}}},
+            {"op": "update", "ref": {"type": "person", "id": "7",
+                                     "relationship": "company"},
+             "data": company},
+            {"op": "remove", "ref": {"type": "company", "lid": "c"}})
+        self.assertListEqual(self.calls, [
+            ("company", "post", None, None,
+             {"data": {"type": "company", "attributes": {"name": "a"}}}),
+            ("person", "post", None, None, {"data": {
+                "type": "person", "attributes": {"name": "ann"},
+                "relationships": {"company": {"data": {
+                    "type": "company", "id": "1"}}}}}),
+            ("person", "patch", "7", "company",
+             {"data": {"type": "company", "id": "1"}}),
+            ("company", "delete", "1", None, None)])
+        self.assertListEqual(
+            [result.get("data", {}).get("id")
+             for result in response.body["atomic:results"]],
+            ["1", "2", "1", None])
+        self.assertEqual(response.headers["Content-Type"], ATOMIC_MIMETYPE)
+
+    def test_post_no_results(self):
+        response = self.post(
+            {"op": "remove", "ref": {"type": "person", "id": "1"}})
+        self.assertEqual(response.status, 204)
+
+    def test_post_errors(self):
+        for operation, pointer in (
+                ({"op": "move", "ref": {"type": "person", "id": "1"}},
+                 "/atomic:operations/1/op"),
+                ({"op": "remove", "ref": {"type": "person", "lid": "x"}},
+                 "/atomic:operations/1/ref/lid"),
+                ({"op": "remove", "ref": {"type": "ship", "id": "1"}},
+                 "/atomic:operations/1/ref/type")):
+            self.request.body = {"atomic:operations": [
+                {"op": "remove", "ref": {"type": "person", "id": "2"}},
+                operation]}
+            with patch('jsonapi_framework.operations.dal.commit') as commit, \
+                    self.assertRaises(errors.BadRequest) as context:
+                self.handler.post(self.request)
+            commit.assert_not_called()
+            self.assertEqual(context.exception.source_pointer, pointer)
+        self.request.body = {"atomic:operations": []}
+        with self.assertRaises(errors.BadRequest):
+            self.handler.post(self.request)
+
+    def test_resolve_lid(self):
+        lids = {("person", "a"): "3"}
+        self.assertDictEqual(
+            resolve_lid({"type": "person", "lid": "a"}, lids, "/ref"),
+            {"type": "person", "id": "3"})
+        identifier = {"type": "person", "id": "4", "lid": "b"}
+        self.assertIs(resolve_lid(identifier, lids, "/ref"), identifier)
+
+
+class OperationsDatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.session.add(CompanyModel(id=1, name="acme"))
+        self.session.commit()
+        resource_handler = type("CompanyHandler", (ResourceHandler,),
+                                {"resource_class": Company})
+        self.handler_map = {"companies": {
+            RequestType.RESOURCE: resource_handler,
+            RequestType.COLLECTION: type("CompaniesHandler",
+                                         (CollectionHandler,),
+                                         {"resource_class": Company}),
+            RequestType.RELATED: {},
+            RequestType.RELATIONSHIP: {}}}
+        self.request = MagicMock()
+        self.request.link_prefix = ""
+        self.request.session = self.session
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def post(self, handler_map, *operations):
+        handler = type("Operations", (OperationsHandler,),
+                       {"handler_map": handler_map})
+        self.request.body = {"atomic:operations": list(operations)}
+        try:
+            return handler.post(self.request)
+        except Exception:
+            self.session.rollback()
+            raise
+
+    def names(self):
+        return sorted(name for name, in self.session.query(CompanyModel.name))
+
+    def test_post(self):
+        response = self.post(
+            self.handler_map,
+            {"op": "add", "data": {"type": "company", "lid": "u",
+                                   "attributes": {"name": "umbrella"}}},
+            {"op": "remove", "ref": {"type": "company", "id": "1"}})
+        self.assertEqual(response.body["atomic:results"][0]["data"]["id"],
+                         "2")
+        self.assertListEqual(self.names(), ["umbrella"])
+
+    def test_post_not_found(self):
+        add = {"op": "add", "data": {"type": "company",
+                                     "attributes": {"name": "umbrella"}}}
+        with self.assertRaises(errors.NotFound) as context:
+            self.post(self.handler_map, add,
+                      {"op": "remove", "ref": {"type": "company",
+                                               "id": "999"}})
+        self.assertEqual(context.exception.source_pointer,
+                         "/atomic:operations/1")
+        self.assertListEqual(self.names(), ["acme"])
+
+        # Handlers may return their errors instead of raising them
+        resource_handler = type("CompanyHandler", (ResourceHandler,), {
+            "resource_class": Company,
+            "delete": classmethod(lambda cls, request: errors.
+                                  error_to_response(errors.Conflict()))})
+        handler_map = {"companies": dict(self.handler_map["companies"])}
+        handler_map["companies"][RequestType.RESOURCE] = resource_handler
+        with self.assertRaises(errors.ErrorList) as context:
+            self.post(handler_map, add,
+                      {"op": "remove", "ref": {"type": "company",
+                                               "id": "1"}})
+        self.assertEqual(context.exception.http_status, 409)
+        self.assertEqual(context.exception.errors[0].source_pointer,
+                         "/atomic:operations/1")
+        self.assertListEqual(self.names(), ["acme"])
@@ -13,11 +13,21 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import datetime
+import decimal
 import unittest
 import werkzeug
 
-from unittest.mock import patch
-from jsonapi_framework.pagination import BasePagination
+from unittest.mock import patch, MagicMock
+from jsonapi_framework.errors import BadRequest
+from jsonapi_framework.pagination import (BasePagination,
+                                          Keyset,
+                                          NumberSize,
+                                          DEFAULT_LIMIT,
+                                          MAX_LIMIT,
+                                          decode_cursor,
+                                          encode_cursor,
+                                          page_size)
 
 
 class BasePaginationTestCase(unittest.TestCase):
@@ -37,3 +47,145 @@ class BasePaginationTestCase(unittest.TestCase):
                 self.base_pagination.page_link(pagination),
                 "/nar1/nar2/foo?page%5Bnumber%5D=1&page%5Bsize%5D=2"
             )
+
+
+class NumberSizeTestCase(unittest.TestCase):
+    def test_json_meta(self):
+        args = werkzeug.MultiDict([('page[size]', '2')])
+        self.assertDictEqual(
+            NumberSize("/nar1/nar2", "foo", args, 1, 2, 5).json_meta(),
+            {"total-pages": 3})
+        self.assertDictEqual(
+            NumberSize("/nar1/nar2", "foo", args, 1, 2, 5,
+                       estimated=True).json_meta(),
+            {"total-pages": 3, "total-pages-estimated": True})
+
+    def test_from_request_defaults(self):
+        request = MagicMock()
+        request.link_prefix = "/nar1/nar2"
+        request.query_args = werkzeug.MultiDict()
+        pagination = NumberSize.from_request(request, "foo", 60)
+        self.assertEqual((pagination.number, pagination.size),
+                         (1, DEFAULT_LIMIT))
+        request.query_args = werkzeug.MultiDict([('page[size]', '50')])
+        pagination = NumberSize.from_request(request, "foo", 60,
+                                             default_size=10, max_size=20)
+        self.assertEqual((pagination.number, pagination.size), (1, 20))
+        self.assertIn("page%5Bsize%5D=20", pagination.json_links()["next"])
+
+
+class PageSizeTestCase(unittest.TestCase):
+    def test_page_size(self):
+        self.assertEqual(page_size(None), DEFAULT_LIMIT)
+        self.assertEqual(page_size(""), DEFAULT_LIMIT)
+        self.assertEqual(page_size(None, default_size=5), 5)
+        self.assertEqual(page_size("7", max_size=10), 7)
+        self.assertEqual(page_size(str(MAX_LIMIT + 1)), MAX_LIMIT)
+        self.assertEqual(page_size(None, default_size=50, max_size=10), 10)
+
+    def test_page_size_all(self):
+        self.assertIsNone(page_size("all", allow_all=True))
+        self.assertEqual(page_size("all", max_size=10), 10)
+
+    def test_page_size_invalid(self):
+        for value in ("0", "-1", "many"):
+            with self.assertRaises(BadRequest):
+                page_size(value)
+
+
+class KeysetTestCase(unittest.TestCase):
+    def make_request(self, args):
+        request = MagicMock()
+        request.link_prefix = "/nar1/nar2"
+        request.query_args = werkzeug.MultiDict(args)
+        return request
+
+    def make_resources(self, ids):
+        resources = []
+        for id in ids:
+            resource = MagicMock()
+            resource.model.id = id
+            resource.model.name = "name{}".format(id)
+            resources.append(resource)
+        return resources
+
+    def test_cursor_roundtrip(self):
+        values = [1, "a", None, datetime.datetime(2017, 6, 1, 12, 30),
+                  datetime.date(2017, 6, 1), decimal.Decimal("1.50")]
+        cursor = encode_cursor(values)
+        self.assertRegex(cursor, r"^[A-Za-z0-9_-]+$")
+        self.assertListEqual(decode_cursor(cursor, 6, "page[after]"), values)
+
+    def test_decode_cursor_invalid(self):
+        for cursor in ("!!", encode_cursor([1]), encode_cursor([{"x": 1}])):
+            with self.assertRaises(BadRequest):
+                decode_cursor(cursor, 2, "page[after]")
+
+    def test_from_request_adds_primary_key(self):
+        pagination = Keyset.from_request(
+            self.make_request([("sort", "-name"), ("page[size]", "2")]),
+            "foo", ["-name"], "id")
+        self.assertListEqual(pagination.order_by, ["-name", "id"])
+        self.assertListEqual(pagination.key_names, ["name", "id"])
+        self.assertEqual(pagination.limit, 3)
+        self.assertIsNone(pagination.after)
+
+    def test_from_request_without_primary_key(self):
+        with self.assertRaises(TypeError):
+            Keyset.from_request(self.make_request([]), "foo", [], None)
+
+    def test_from_request_both_cursors(self):
+        cursor = encode_cursor([1])
+        with self.assertRaises(BadRequest):
+            Keyset.from_request(
+                self.make_request([("page[after]", cursor),
+                                   ("page[before]", cursor)]),
+                "foo", [], "id")
+
+    def test_from_request_default_size(self):
+        pagination = Keyset.from_request(self.make_request([]), "foo", [],
+                                         "id", default_size=3, max_size=5)
+        self.assertEqual(pagination.size, 3)
+        pagination = Keyset.from_request(
+            self.make_request([("page[size]", "9")]), "foo", [], "id",
+            max_size=5)
+        self.assertEqual(pagination.size, 5)
+
+    def test_first_page(self):
+        pagination = Keyset.from_request(
+            self.make_request([("page[size]", "2")]), "foo", [], "id")
+        page = pagination.paginate(self.make_resources([1, 2, 3]))
+        self.assertEqual([r.model.id for r in page], [1, 2])
+        links = pagination.json_links()
+        self.assertNotIn("prev", links)
+        self.assertEqual(
+            links["next"],
+            "/nar1/nar2/foo?page%5Bsize%5D=2&page%5Bafter%5D=" +
+            encode_cursor([2]))
+
+    def test_last_page(self):
+        pagination = Keyset.from_request(
+            self.make_request([("page[size]", "2"),
+                               ("page[after]", encode_cursor([2]))]),
+            "foo", [], "id")
+        self.assertListEqual(pagination.after, [2])
+        page = pagination.paginate(self.make_resources([3]))
+        self.assertEqual([r.model.id for r in page], [3])
+        links = pagination.json_links()
+        self.assertNotIn("next", links)
+        self.assertIn("page%5Bbefore%5D=" + encode_cursor([3]),
+                      links["prev"])
+        self.assertNotIn("after", links["prev"])
+
+    def test_backwards_page(self):
+        pagination = Keyset.from_request(
+            self.make_request([("page[size]", "2"),
+                               ("page[before]", encode_cursor([4]))]),
+            "foo", [], "id")
+        page = pagination.paginate(self.make_resources([1, 2, 3]))
+        self.assertEqual([r.model.id for r in page], [2, 3])
+        links = pagination.json_links()
+        self.assertIn("page%5Bbefore%5D=" + encode_cursor([2]),
+                      links["prev"])
+        self.assertIn("page%5Bafter%5D=" + encode_cursor([3]),
+                      links["next"])
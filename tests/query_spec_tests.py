@@ -0,0 +1,77 @@
+#!usr/bin/env python3
+#
+# Copyright 2017 Petuum, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+from werkzeug.datastructures import MultiDict
+from jsonapi_framework.errors import BadRequest
+from jsonapi_framework.query_spec import (QuerySpec,
+                                          parse_query_string,
+                                          split_str_on_comma,
+                                          MAX_PARAMETERS,
+                                          MAX_QUERY_STRING_LENGTH)
+
+
+class QuerySpecTestCase(unittest.TestCase):
+    def test_parse_query_string(self):
+        spec = parse_query_string(
+            "fields%5Bperson%5D=name,%20age&fields[person]=company"
+            "&include=company.owner,&sort=-name,id&filter[name]=a,b"
+            "&filter[age]=&filter[age][gte]=3&page[size]=5&page[size]=6"
+            "&page[size][x]=7&foo=bar")
+        self.assertDictEqual(dict(spec.fields),
+                             {"person": ("name", "age", "company")})
+        self.assertTupleEqual(spec.include, ("company.owner",))
+        self.assertTupleEqual(spec.sort, ("-name", "id"))
+        self.assertTupleEqual(spec.filters, (("name", None, ("a", "b")),
+                                             ("age", "gte", ("3",))))
+        self.assertDictEqual(dict(spec.page), {"size": "5"})
+
+    def test_from_args(self):
+        args = MultiDict([("fields[person]", "name"), ("sort", "id")])
+        self.assertEqual(
+            repr(QuerySpec.from_args(args)),
+            repr(parse_query_string("fields[person]=name&sort=id")))
+        self.assertTupleEqual(QuerySpec.from_args({"sort": "id"}).sort,
+                              ("id",))
+
+    def test_immutable(self):
+        spec = parse_query_string("page[size]=1")
+        with self.assertRaises(AttributeError):
+            spec.sort = ("id",)
+        with self.assertRaises(AttributeError):
+            del spec.page
+        with self.assertRaises(TypeError):
+            spec.page["size"] = "2"
+
+    def test_cached(self):
+        query_string = "sort=name&page[number]=3"
+        spec = parse_query_string(query_string)
+        hits = parse_query_string.cache_info().hits
+        self.assertIs(parse_query_string(query_string), spec)
+        self.assertEqual(parse_query_string.cache_info().hits, hits + 1)
+
+    def test_limits(self):
+        with self.assertRaises(BadRequest):
+            parse_query_string("a" * (MAX_QUERY_STRING_LENGTH + 1))
+        with self.assertRaises(BadRequest):
+            QuerySpec.from_pairs([("foo", "bar")] * (MAX_PARAMETERS + 1))
+
+    def test_split_str_on_comma(self):
+        self.assertListEqual(
+            split_str_on_comma("hello,world\\,hello\\\\,again\\\\\\,world"),
+            ["hello", "world,hello\\", "again\\,world"])
+        self.assertListEqual(split_str_on_comma(",a,,b,"), ["a", "b"])
+        self.assertListEqual(split_str_on_comma("a\\"), ["a\\"])
@@ -15,6 +15,7 @@
 # limitations under the License.
 import unittest
 
+from unittest.mock import MagicMock
 from jsonapi_framework.request import Request
 
 
@@ -51,3 +52,23 @@ class RequestTestCase(unittest.TestCase):
         self.assertEqual(Request('RequestType.FOO', {}, 'GET',
                                  '/nar1/nar2', None, {}, {}).body,
                          request.body)
+
+    def test_query_spec(self):
+        request = Request('RequestType.FOO', {'sort': 'name'}, 'GET',
+                          '', None, {}, {})
+        self.assertTupleEqual(request.query_spec.sort, ('name',))
+        self.assertIs(request.query_spec, request.query_spec)
+        request = Request('RequestType.FOO', {}, 'GET', '', None, {}, {},
+                          query_string='sort=-id')
+        self.assertTupleEqual(request.query_spec.sort, ('-id',))
+
+    def test_lazy_session(self):
+        session_callable = MagicMock()
+        request = Request('RequestType.FOO', {}, 'GET', '', None, {}, {},
+                          session_callable=session_callable)
+        self.assertFalse(request.has_session)
+        session_callable.assert_not_called()
+        self.assertIs(request.session, session_callable.return_value)
+        self.assertIs(request.session, session_callable.return_value)
+        self.assertTrue(request.has_session)
+        session_callable.assert_called_once_with()
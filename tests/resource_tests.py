@@ -0,0 +1,124 @@
+#!usr/bin/env python3
+#
+# Copyright 2017 Petuum, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+from unittest.mock import MagicMock
+from jsonapi_framework.context import Context, UPDATE_SET
+from jsonapi_framework.resource import (Resource,
+                                        Attribute,
+                                        ToOneRelationship,
+                                        Id)
+
+
+class Model(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class Company(Resource):
+    model_class = Model
+    japi_resource_type = "company"
+    japi_resource_url_component = "companies"
+    id = Id()
+    name = Attribute()
+
+
+class Person(Resource):
+    model_class = Model
+    japi_resource_type = "person"
+    japi_resource_url_component = "people"
+    id = Id()
+    name = Attribute()
+    age = Attribute(mapped_attribute_name="age_years")
+    shout = Attribute(fget=lambda model: model.name.upper(),
+                      writable_during=frozenset())
+    company = ToOneRelationship("company_id", Company, nullable=True)
+
+
+class ResourceSerializeTestCase(unittest.TestCase):
+    def test_serialize(self):
+        person = Person(Model(id=1, name="ann", age_years=30, company_id=7))
+        self.assertDictEqual(person.serialize("/api"), {
+            "id": "1",
+            "type": "person",
+            "links": {"self": "/api/people/1"},
+            "attributes": {"name": "ann", "age": 30, "shout": "ANN"},
+            "relationships": {
+                "company": {
+                    "links": {
+                        "self": "/api/people/1/relationships/company",
+                        "related": "/api/people/1/company"
+                    },
+                    "data": {"type": "company", "id": "7"}
+                }
+            }
+        })
+
+    def test_serialize_null_relationship(self):
+        person = Person(Model(id=1, name="ann", age_years=30,
+                              company_id=None))
+        serialized = person.serialize("/api", fields=["company"])
+        self.assertNotIn("attributes", serialized)
+        self.assertIsNone(serialized["relationships"]["company"]["data"])
+
+    def test_serialize_sparse_fields(self):
+        person = Person(Model(id=1, name="ann", age_years=30, company_id=7))
+        self.assertDictEqual(person.serialize("", fields=["age", "bogus"]), {
+            "id": "1",
+            "type": "person",
+            "links": {"self": "/people/1"},
+            "attributes": {"age": 30}
+        })
+
+    def test_serialize_empty_fields(self):
+        company = Company(Model(id=3, name="acme"))
+        self.assertDictEqual(company.serialize("", fields=[]), {
+            "id": "3",
+            "type": "company",
+            "links": {"self": "/companies/3"}
+        })
+
+    def test_compiled_serializer_cached_per_fieldset(self):
+        self.assertIs(Person.compiled_serializer(["name", "age"]),
+                      Person.compiled_serializer(["age", "name", "bogus"]))
+        self.assertIsNot(Person.compiled_serializer(["name"]),
+                         Person.compiled_serializer(None))
+
+    def test_row_columns(self):
+        self.assertListEqual(Company.row_columns(), ["id", "name"])
+        self.assertListEqual(Person.row_columns(["age", "company"]),
+                             ["id", "age_years", "company_id"])
+        # shout needs the model
+        self.assertIsNone(Person.row_columns())
+        self.assertIsNone(Person.row_columns(["name", "shout"]))
+
+    def test_update_values(self):
+        patch_dict = Person.create_patch_dict({
+            "type": "person", "id": "1", "attributes": {"age": 31},
+            "relationships": {
+                "company": {"data": {"type": "company", "id": "8"}}}})
+        self.assertDictEqual(Person.update_values(patch_dict),
+                             {"age_years": 31, "company_id": 8})
+        self.assertIsNone(Person.update_values(
+            {"attributes": {"shout": "ANN"}, "relationships": {}}))
+
+    def test_has_validators(self):
+        self.assertFalse(Person.has_validators(Context.UPDATE))
+        validator = MagicMock(contexts=UPDATE_SET)
+        person_class = type("ValidatedPerson", (Person,), {
+            "name": Attribute(fvalidators=[validator])})
+        self.assertTrue(person_class.has_validators(Context.UPDATE))
+        self.assertFalse(person_class.has_validators(Context.CREATE))
@@ -27,3 +27,8 @@ class ResponseTestCase(unittest.TestCase):
             Response(body={}, status=400, headers=None).status, resp.status)
         self.assertEqual(
             Response(body={}, status=400, headers=None).headers, resp.headers)
+
+    def test_is_streamed(self):
+        self.assertFalse(Response(body=None).is_streamed)
+        self.assertFalse(Response(body={"data": []}).is_streamed)
+        self.assertTrue(Response(body={"data": iter([])}).is_streamed)
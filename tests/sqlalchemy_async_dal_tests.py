@@ -0,0 +1,197 @@
+#!usr/bin/env python3
+#
+# Copyright 2017 Petuum, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import datetime
+import importlib.util
+import unittest
+
+from sqlalchemy import Column, ForeignKey, Integer, String
+
+import jsonapi_framework.sqlalchemy_async_dal as async_dal
+import jsonapi_framework.sqlalchemy_dal as dal
+from jsonapi_framework.errors import NotFound
+from jsonapi_framework.filters import Filter
+from jsonapi_framework.tests.sqlalchemy_dal_tests import (Base,
+                                                          Company,
+                                                          CompanyModel,
+                                                          Person,
+                                                          PersonModel)
+
+HAS_AIOSQLITE = importlib.util.find_spec("aiosqlite") is not None
+
+
+class DefaultModel(Base):
+    __tablename__ = "default"
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    company_id = Column(Integer, ForeignKey("company.id"),
+                        server_default="1")
+
+
+@unittest.skipUnless(HAS_AIOSQLITE, "aiosqlite is not installed")
+class AsyncDALTestCase(unittest.TestCase):
+    def setUp(self):
+        from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+        async def set_up():
+            self.engine = create_async_engine("sqlite+aiosqlite://")
+            async with self.engine.begin() as connection:
+                await connection.run_sync(Base.metadata.create_all)
+            self.session = AsyncSession(self.engine)
+            self.session.add_all([CompanyModel(id=1, name="acme"),
+                                  CompanyModel(id=2, name="initech")])
+            self.session.add_all([
+                PersonModel(id=i, name="person{}".format(i), age=i % 3,
+                            company_id=(i % 3) or None,
+                            updated_at=datetime.datetime(2020, 1, i))
+                for i in range(1, 10)])
+            await self.session.commit()
+
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(set_up())
+
+    def tearDown(self):
+        async def tear_down():
+            await self.session.close()
+            await self.engine.dispose()
+
+        self.loop.run_until_complete(tear_down())
+        self.loop.close()
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def collect(self, **kwargs):
+        async def collect():
+            resources = await async_dal.query_collection(
+                self.session, Person, **kwargs)
+            return [resource.id async for resource in resources]
+
+        return self.run_async(collect())
+
+    def test_query_resource(self):
+        person = self.run_async(async_dal.query_resource(
+            self.session, Person, 2, ["name"]))
+        self.assertEqual(person.name, "person2")
+        self.assertIsNone(self.run_async(async_dal.query_resource(
+            self.session, Person, 20)))
+        people = self.run_async(async_dal.query_resources_by_ids(
+            self.session, Person, [3, 1, 20]))
+        self.assertSetEqual({person.id for person in people}, {1, 3})
+
+    def test_query_collection(self):
+        filters = Filter([("age", None, ("1",))])
+        self.assertListEqual(
+            self.collect(order_by=["-id"], filters=filters), [7, 4, 1])
+        self.assertListEqual(
+            self.collect(order_by=["id"], limit=3, offset=2), [3, 4, 5])
+        self.assertListEqual(
+            self.collect(order_by=["id"], before=[5], limit=2), [3, 4])
+        self.assertListEqual(
+            self.collect(order_by=["id"], columns=["id", "name"],
+                         after=[7]), [8, 9])
+
+    def test_query_collection_chunk_size(self):
+        self.assertListEqual(self.collect(order_by=["id"], chunk_size=2),
+                             list(range(1, 10)))
+
+    def test_query_collection_with_total(self):
+        resources, total = self.run_async(
+            async_dal.query_collection_with_total(
+                self.session, Person, order_by=["id"], limit=2))
+        self.assertListEqual([resource.id for resource in resources], [1, 2])
+        self.assertEqual(total, 9)
+        self.assertEqual(self.run_async(
+            async_dal.query_collection_with_total(
+                self.session, Person, limit=2, offset=20)), ([], 9))
+
+    def test_query_total_number_resources(self):
+        filters = Filter([("age", None, ("0", "2"))])
+        for mode in async_dal.CountMode:
+            self.assertEqual(self.run_async(
+                async_dal.query_total_number_resources(
+                    self.session, Person, filters, mode)), 6)
+
+    def test_query_versions(self):
+        self.assertTupleEqual(
+            self.run_async(async_dal.query_resource_version(
+                self.session, Person, 2)),
+            (None, datetime.datetime(2020, 1, 2)))
+        self.assertTupleEqual(
+            self.run_async(async_dal.query_collection_version(
+                self.session, Person, Filter([("age", None, ("1",))]))),
+            (None, datetime.datetime(2020, 1, 7), 7, 3))
+
+    def test_query_related(self):
+        company = self.run_async(async_dal.query_related(
+            self.session, Person, 4, "company"))
+        self.assertEqual(company.id, 1)
+        self.assertIsInstance(company, Company)
+        self.assertIsNone(self.run_async(async_dal.query_related(
+            self.session, Person, 3, "company")))
+        with self.assertRaises(NotFound):
+            self.run_async(async_dal.query_related(
+                self.session, Person, 20, "company"))
+
+    def test_writes(self):
+        person = self.run_async(async_dal.update_resource(
+            self.session, Person, 1, {"name": "ann"}, ["id", "name"]))
+        self.assertEqual(person.name, "ann")
+        self.assertIsNone(self.run_async(async_dal.update_resource(
+            self.session, Person, 20, {"name": "bob"}, ["id"])))
+        self.assertTrue(self.run_async(async_dal.delete_resource(
+            self.session, Person, 2)))
+        self.assertFalse(self.run_async(async_dal.delete_resource(
+            self.session, Person, 2)))
+        self.run_async(async_dal.rollback(self.session))
+        self.assertEqual(self.run_async(async_dal.query_resource(
+            self.session, Person, 1)).name, "person1")
+
+    def test_atomic(self):
+        async def run():
+            with async_dal.atomic(self.session):
+                await async_dal.add(self.session,
+                                    CompanyModel(id=3, name="umbrella"))
+                await async_dal.commit(self.session)
+                self.assertTrue(self.session.in_transaction())
+            await async_dal.rollback(self.session)
+            return await async_dal.query_resource(self.session, Company, 3)
+
+        self.assertIsNone(self.run_async(run()))
+
+    def test_record_checkouts(self):
+        from sqlalchemy.ext.asyncio import AsyncSession
+
+        async def run():
+            session = async_dal.record_checkouts(AsyncSession(self.engine))
+            await async_dal.query_resource(session, Person, 1)
+            await async_dal.query_resource(session, Person, 2)
+            await async_dal.rollback(session)
+            await async_dal.query_resource(session, Person, 3)
+            await session.close()
+
+        dal.POOL_CHECKOUTS.clear()
+        self.run_async(run())
+        # One checkout per transaction
+        self.assertEqual(dal.POOL_CHECKOUTS.info().checkouts, 2)
+        stub = object()
+        self.assertIs(async_dal.record_checkouts(stub), stub)
+
+    def test_add_all(self):
+        models = [DefaultModel(name=str(i)) for i in range(5)]
+        self.run_async(async_dal.add_all(self.session, models, chunk_size=2))
+        # The server default was loaded without lazy loading
+        self.assertListEqual([model.company_id for model in models], [1] * 5)
@@ -0,0 +1,426 @@
+#!usr/bin/env python3
+#
+# Copyright 2017 Petuum, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import datetime
+import unittest
+
+from sqlalchemy import (create_engine, event, Column, DateTime, ForeignKey,
+                        Integer, String)
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import declarative_base, sessionmaker
+from unittest.mock import MagicMock, patch
+
+import jsonapi_framework.sqlalchemy_dal as dal
+from jsonapi_framework.filters import Filter
+from jsonapi_framework.errors import BadRequest, NotFound, UnsortableField
+from jsonapi_framework.resource import (Resource,
+                                        Attribute,
+                                        ToOneRelationship,
+                                        Id)
+
+Base = declarative_base()
+
+
+class CompanyModel(Base):
+    __tablename__ = "company"
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+
+
+class PersonModel(Base):
+    __tablename__ = "person"
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    age = Column(Integer)
+    company_id = Column(Integer, ForeignKey("company.id"))
+    updated_at = Column(DateTime)
+
+
+class Company(Resource):
+    model_class = CompanyModel
+    japi_resource_type = "company"
+    japi_resource_url_component = "companies"
+    id = Id()
+    name = Attribute()
+
+
+class Person(Resource):
+    model_class = PersonModel
+    japi_resource_type = "person"
+    japi_resource_url_component = "people"
+    id = Id()
+    name = Attribute()
+    age = Attribute(nullable=True)
+    company = ToOneRelationship("company_id", Company, nullable=True)
+    updated_at_column = "updated_at"
+
+
+class DALTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.session.add_all([CompanyModel(id=1, name="acme"),
+                              CompanyModel(id=2, name="initech")])
+        self.session.add_all([
+            PersonModel(id=i, name="person{}".format(i), age=i % 3,
+                        company_id=(i % 3) or None,
+                        updated_at=datetime.datetime(2020, 1, i))
+            for i in range(1, 11)])
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def ids(self, resources):
+        return [r.model.id for r in resources]
+
+    def test_query_collection_order_by(self):
+        self.assertListEqual(
+            self.ids(dal.query_collection(self.session, Person,
+                                          order_by=["-age", "id"])),
+            [2, 5, 8, 1, 4, 7, 10, 3, 6, 9])
+
+    def test_query_collection_unsortable(self):
+        with self.assertRaises(UnsortableField):
+            dal.query_collection(self.session, Person, order_by=["bogus"])
+
+    def test_query_collection_keyset(self):
+        order_by = ["-age", "id"]
+        self.assertListEqual(
+            self.ids(dal.query_collection(self.session, Person,
+                                          order_by=order_by, limit=3,
+                                          after=[1, 4])),
+            [7, 10, 3])
+        self.assertListEqual(
+            self.ids(dal.query_collection(self.session, Person,
+                                          order_by=order_by, limit=3,
+                                          before=[1, 4])),
+            [5, 8, 1])
+
+    def test_query_collection_keyset_same_direction(self):
+        self.assertListEqual(
+            self.ids(dal.query_collection(self.session, Person,
+                                          order_by=["age", "id"], limit=2,
+                                          after=[0, 6])),
+            [9, 1])
+
+    def test_check_keyset_order(self):
+        dal.check_keyset_order(Person, ["-name", "id"])
+        # Rows with a NULL age would fall out of the pages
+        with self.assertRaises(BadRequest) as context:
+            dal.check_keyset_order(Person, ["-age", "id"])
+        self.assertEqual(context.exception.source_parameter, "sort")
+
+    def test_query_total_number_resources_filters(self):
+        filters = Filter([("age", None, ("1",))])
+        self.assertEqual(
+            dal.query_total_number_resources(self.session, Person), 10)
+        self.assertEqual(
+            dal.query_total_number_resources(self.session, Person, filters),
+            4)
+
+    def test_query_total_number_resources_cached(self):
+        with patch.object(dal, "_COUNT_CACHE", dal.CountCache()), \
+                patch('jsonapi_framework.sqlalchemy_dal.time.monotonic') as \
+                monotonic:
+            monotonic.return_value = 100
+            self.assertEqual(dal.query_total_number_resources(
+                self.session, Person, mode=dal.CountMode.CACHED), 10)
+            self.session.add(PersonModel(id=11, name="new"))
+            self.session.commit()
+            monotonic.return_value = 159
+            self.assertEqual(dal.query_total_number_resources(
+                self.session, Person, mode=dal.CountMode.CACHED), 10)
+            monotonic.return_value = 160
+            self.assertEqual(dal.query_total_number_resources(
+                self.session, Person, mode=dal.CountMode.CACHED), 11)
+
+    def test_count_cache(self):
+        cache = dal.CountCache(maxsize=2)
+        cache.set("a", 1, 10)
+        cache.set("b", 2, 20)
+        self.assertEqual(cache.get("a", 5), 1)
+        cache.set("c", 3, 30)
+        # "b" was the least recently used
+        self.assertIsNone(cache.get("b", 5))
+        self.assertIsNone(cache.get("a", 10))
+        self.assertEqual(cache.info(), dal.CacheInfo(1, 2, 2, 1))
+
+    def test_query_total_number_resources_estimated_fallback(self):
+        # SQLite has no planner estimates
+        with patch.object(dal, "_COUNT_CACHE", dal.CountCache()):
+            self.assertEqual(dal.query_total_number_resources(
+                self.session, Person, mode=dal.CountMode.ESTIMATED), 10)
+
+    def count_statements(self):
+        statements = []
+        event.listen(self.engine, "before_cursor_execute",
+                     lambda *args: statements.append(args[2]))
+        return statements
+
+    def test_query_collection_with_total(self):
+        filters = Filter([("age", None, ("1",))])
+        statements = self.count_statements()
+        resources, total = dal.query_collection_with_total(
+            self.session, Person, order_by=["id"], filters=filters,
+            limit=2, offset=2)
+        self.assertListEqual(self.ids(resources), [7, 10])
+        self.assertEqual(total, 4)
+        self.assertEqual(len(statements), 1)
+        self.assertIn("OVER ()", statements[0])
+
+    def test_query_collection_with_total_past_last_page(self):
+        self.assertEqual(dal.query_collection_with_total(
+            self.session, Person, order_by=["id"], limit=5, offset=20),
+            ([], 10))
+
+    def test_query_collection_with_total_fallback(self):
+        statements = self.count_statements()
+        with patch('jsonapi_framework.sqlalchemy_dal.'
+                   'supports_window_functions') as supports_window_functions:
+            supports_window_functions.return_value = False
+            resources, total = dal.query_collection_with_total(
+                self.session, Person, order_by=["id"], limit=3)
+        self.assertListEqual(self.ids(resources), [1, 2, 3])
+        self.assertEqual(total, 10)
+        self.assertEqual(len(statements), 2)
+        self.assertNotIn("OVER", " ".join(statements))
+
+    def test_supports_window_functions(self):
+        dialect = MagicMock(is_mariadb=False)
+        for name, version, supported in [("sqlite", (3, 24, 0), False),
+                                         ("sqlite", (3, 31, 1), True),
+                                         ("postgresql", (12, 3), True),
+                                         ("mysql", (5, 7, 30), False),
+                                         ("mysql", (8, 0, 21), True),
+                                         ("firebird", (3, 0), False)]:
+            dialect.name = name
+            dialect.server_version_info = version
+            self.assertEqual(dal.supports_window_functions(dialect),
+                             supported)
+        dialect.name = "mysql"
+        dialect.is_mariadb = True
+        dialect.server_version_info = (10, 3, 22)
+        self.assertTrue(dal.supports_window_functions(dialect))
+
+    def test_query_related(self):
+        statements = self.count_statements()
+        company = dal.query_related(self.session, Person, 4, "company",
+                                    ["name"])
+        self.assertEqual(company.model.name, "acme")
+        self.assertEqual(len(statements), 1)
+        self.assertIn("LEFT OUTER JOIN", statements[0])
+
+    def test_query_related_empty(self):
+        self.assertIsNone(dal.query_related(self.session, Person, 3,
+                                            "company"))
+
+    def test_query_related_not_found(self):
+        with self.assertRaises(NotFound):
+            dal.query_related(self.session, Person, 42, "company")
+
+    def test_query_collection_columns(self):
+        columns = Person.row_columns(["name", "company"])
+        rows = list(dal.query_collection(self.session, Person,
+                                         order_by=["id"], limit=3,
+                                         columns=columns))
+        models = list(dal.query_collection(self.session, Person,
+                                           order_by=["id"], limit=3))
+        self.assertNotIsInstance(rows[0].model, PersonModel)
+        self.assertListEqual(
+            [r.serialize("", ["name", "company"]) for r in rows],
+            [r.serialize("", ["name", "company"]) for r in models])
+
+    def test_query_collection_with_total_columns(self):
+        resources, total = dal.query_collection_with_total(
+            self.session, Person, order_by=["-id"], limit=2,
+            columns=Person.row_columns())
+        self.assertEqual(total, 10)
+        self.assertListEqual([r.serialize("")["id"] for r in resources],
+                             ["10", "9"])
+
+    def test_statement_cache(self):
+        def age_filter(age):
+            return Filter([("age", None, (str(age),))])
+
+        with patch.object(dal, "STATEMENT_CACHE", dal.StatementCache()):
+            self.assertListEqual(
+                self.ids(dal.query_collection(
+                    self.session, Person, order_by=["id"],
+                    filters=age_filter(1), limit=2, offset=1)),
+                [4, 7])
+            self.assertListEqual(
+                self.ids(dal.query_collection(
+                    self.session, Person, order_by=["id"],
+                    filters=age_filter(2), limit=3, offset=0)),
+                [2, 5, 8])
+            self.assertEqual(dal.query_resource(self.session, Person, 3,
+                                                ["name"]).model.name,
+                             "person3")
+            self.assertIsNone(dal.query_resource(self.session, Person, 42,
+                                                 ["name"]))
+            info = dal.STATEMENT_CACHE.info()
+            self.assertEqual((info.hits, info.misses, info.currsize),
+                             (2, 2, 2))
+
+    def test_statement_cache_filter_shapes(self):
+        with patch.object(dal, "STATEMENT_CACHE", dal.StatementCache()):
+            self.assertListEqual(
+                self.ids(dal.query_collection(
+                    self.session, Person, order_by=["id"],
+                    filters=Filter([("id", None, ("2", "3", "5"))]))),
+                [2, 3, 5])
+            self.assertListEqual(
+                self.ids(dal.query_collection(
+                    self.session, Person, order_by=["id"],
+                    filters=Filter([("id", None, ("9", "4"))]))),
+                [4, 9])
+            self.assertListEqual(
+                self.ids(dal.query_collection(
+                    self.session, Person, order_by=["id"],
+                    filters=Filter([("id", None, ("9",))]))),
+                [9])
+            info = dal.STATEMENT_CACHE.info()
+            self.assertEqual((info.hits, info.misses), (1, 2))
+
+    def test_statement_cache_eviction(self):
+        cache = dal.StatementCache(maxsize=2)
+        for key in ("a", "b", "a", "c", "b"):
+            cache.get(key, lambda: key.upper())
+        self.assertEqual(cache.info(), dal.CacheInfo(1, 4, 2, 2))
+        cache.clear()
+        self.assertEqual(cache.info(), dal.CacheInfo(0, 0, 2, 0))
+
+    def test_query_resource_version(self):
+        self.assertEqual(
+            dal.query_resource_version(self.session, Person, 4),
+            (None, datetime.datetime(2020, 1, 4)))
+        self.assertIsNone(dal.query_resource_version(self.session, Person,
+                                                     42))
+
+    def test_query_collection_version(self):
+        filters = Filter([("age", None, ("1",))])
+        self.assertEqual(
+            dal.query_collection_version(self.session, Person, filters),
+            (None, datetime.datetime(2020, 1, 10), 10, 4))
+        self.assertEqual(
+            dal.query_collection_version(self.session, Person,
+                                         Filter([("age", None, ("7",))])),
+            (None, None, None, 0))
+
+    def test_query_collection_version_update(self):
+        with patch.object(Person, "version_column", "age"), \
+                patch.object(Person, "updated_at_column", None):
+            self.assertEqual(
+                dal.query_collection_version(self.session, Person),
+                (10, None, 10, 10))
+            # Person 3 does not have the largest version
+            dal.update_resource(self.session, Person, 3, {"name": "x"},
+                                ["id"])
+            self.assertEqual(
+                dal.query_collection_version(self.session, Person),
+                (11, None, 10, 10))
+
+    def test_atomic(self):
+        with dal.atomic(self.session):
+            self.session.add(CompanyModel(id=3, name="globex"))
+            dal.commit(self.session)
+            self.assertEqual(self.session.query(CompanyModel).count(), 3)
+        dal.rollback(self.session)
+        self.assertEqual(self.session.query(CompanyModel).count(), 2)
+
+    def test_checkout(self):
+        dal.POOL_CHECKOUTS.clear()
+        self.session.close()
+        self.assertIs(dal.checkout(self.session, "AUTOCOMMIT"), self.session)
+        self.assertEqual(self.session.connection().get_execution_options()[
+            "isolation_level"], "AUTOCOMMIT")
+        self.assertEqual(dal.query_total_number_resources(
+            self.session, Person), 10)
+        # Sessions without a bind check out on their first statement
+        dal.checkout(sessionmaker()())
+        info = dal.POOL_CHECKOUTS.info()
+        self.assertEqual(info.checkouts, 1)
+        self.assertGreaterEqual(info.total_wait, info.max_wait)
+        self.assertGreater(info.max_wait, 0)
+
+    def test_add_all(self):
+        models = [PersonModel(name="new{}".format(i)) for i in range(5)]
+        dal.add_all(self.session, models, chunk_size=2)
+        self.assertListEqual([model.id for model in models],
+                             [11, 12, 13, 14, 15])
+        # The columns that were not set are loaded once per chunk
+        statements = self.count_statements()
+        self.assertListEqual([model.company_id for model in models],
+                             [None] * 5)
+        self.assertListEqual(statements, [])
+        self.session.commit()
+        self.assertEqual(
+            dal.query_total_number_resources(self.session, Person), 15)
+
+    def test_update_resource(self):
+        statements = self.count_statements()
+        person = dal.update_resource(self.session, Person, 4,
+                                     {"name": "renamed", "company_id": 2},
+                                     ["id", "name", "company_id"])
+        self.assertEqual((person.model.name, person.model.company_id),
+                         ("renamed", 2))
+        # UPDATE and SELECT, SQLite has no RETURNING here
+        self.assertEqual(len(statements), 2)
+        self.assertIsNone(dal.update_resource(self.session, Person, 42,
+                                              {"name": "x"}, ["id"]))
+        self.session.commit()
+        self.assertEqual(self.session.get(PersonModel, 4).name, "renamed")
+
+    def test_update_resource_version(self):
+        with patch.object(Person, "version_column", "age"):
+            person = dal.update_resource(self.session, Person, 4,
+                                         {"name": "renamed"}, ["id", "age"])
+            self.assertEqual(person.model.age, 2)
+            # Setting the version explicitly wins
+            person = dal.update_resource(self.session, Person, 4,
+                                         {"age": 7}, ["id", "age"])
+            self.assertEqual(person.model.age, 7)
+
+    def test_update_resource_returning(self):
+        session = MagicMock()
+        session.get_bind.return_value.dialect = postgresql.dialect()
+        session.execute.return_value.one_or_none.return_value = None
+        dal.update_resource(session, Person, 4, {"name": "renamed"},
+                            ["id", "name"])
+        self.assertEqual(session.execute.call_count, 1)
+        statement = str(session.execute.call_args[0][0].compile(
+            dialect=postgresql.dialect()))
+        self.assertIn("RETURNING person.id AS id, person.name AS name",
+                      statement)
+
+    def test_delete_resource(self):
+        self.assertTrue(dal.delete_resource(self.session, Person, 4))
+        self.assertFalse(dal.delete_resource(self.session, Person, 4))
+        self.session.commit()
+        self.assertEqual(
+            dal.query_total_number_resources(self.session, Person), 9)
+
+    def test_query_collection_chunk_size(self):
+        options = []
+        event.listen(self.engine, "before_cursor_execute",
+                     lambda *args: options.append(
+                         args[4].execution_options.get("stream_results")))
+        resources = dal.query_collection(self.session, Person,
+                                         order_by=["id"], chunk_size=3)
+        self.assertListEqual(self.ids(resources), list(range(1, 11)))
+        self.assertListEqual(options, [True])
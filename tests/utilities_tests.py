@@ -13,23 +13,74 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import asyncio
+import datetime
 import json
 import unittest
 import unittest.mock
 import werkzeug
 
 from ddt import ddt, data
+from sqlalchemy import Column, ForeignKey, Integer, String
+from sqlalchemy.orm import declarative_base
 from unittest.mock import patch
+from jsonapi_framework.errors import UnresolvableIncludePath, UnsupportedFilter
+from jsonapi_framework.filters import Filter
+from jsonapi_framework.resource import (Resource,
+                                        Attribute,
+                                        ToOneRelationship,
+                                        Id)
 from jsonapi_framework.utilities import (dump_json,
+                                         iter_json,
+                                         aiter_json,
                                          load_json,
+                                         make_etag,
+                                         etag_matches,
+                                         http_date,
+                                         parse_http_date,
                                          link_for_collection,
                                          link_for_resource,
                                          link_for_related,
                                          link_for_relationship,
                                          get_sparse_fields,
+                                         get_include_paths,
                                          get_filter,
                                          get_order_by_fields)
 
+Base = declarative_base()
+
+
+class CompanyModel(Base):
+    __tablename__ = "company"
+    id = Column(Integer, primary_key=True)
+
+
+class PersonModel(Base):
+    __tablename__ = "person"
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    age_years = Column(Integer)
+    company_id = Column(Integer, ForeignKey("company.id"))
+
+
+class Company(Resource):
+    model_class = CompanyModel
+    japi_resource_type = "company"
+    japi_resource_url_component = "companies"
+    id = Id()
+
+
+class Person(Resource):
+    model_class = PersonModel
+    japi_resource_type = "person"
+    japi_resource_url_component = "people"
+    id = Id()
+    name = Attribute()
+    age = Attribute(mapped_attribute_name="age_years")
+    shout = Attribute(fget=lambda model: model.name.upper(),
+                      writable_during=frozenset())
+    company = ToOneRelationship("company_id", Company, nullable=True)
+
 
 @ddt
 class UtilitiesTestCase(unittest.TestCase):
@@ -46,6 +97,38 @@ class UtilitiesTestCase(unittest.TestCase):
             dict2 = json.loads(result)
             self.assertDictEqual(dict1, dict2)
 
+    @data(True, False)
+    def test_iter_json(self, debug):
+        items = [{"id": str(i), "type": "foo"} for i in range(100)]
+        doc = {"data": iter(items), "links": {"self": "/foo"}}
+        with patch('jsonapi_framework.utilities.DEBUG', debug):
+            chunks = list(iter_json(doc, buffer_size=100))
+        self.assertGreater(len(chunks), 1)
+        self.assertDictEqual(json.loads(b"".join(chunks)),
+                             {"data": items, "links": {"self": "/foo"}})
+
+    def test_iter_json_empty_iterator(self):
+        self.assertDictEqual(json.loads(b"".join(iter_json(
+            {"data": iter([]), "meta": {}}))), {"data": [], "meta": {}})
+
+    def test_aiter_json(self):
+        items = [{"id": str(i), "type": "foo"} for i in range(100)]
+
+        async def resources():
+            for item in items:
+                yield item
+
+        async def collect():
+            doc = {"data": resources(), "included": iter(items[:2]),
+                   "links": {"self": "/foo"}}
+            return [chunk async for chunk in aiter_json(doc, buffer_size=100)]
+
+        chunks = asyncio.run(collect())
+        self.assertGreater(len(chunks), 1)
+        self.assertDictEqual(json.loads(b"".join(chunks)),
+                             {"data": items, "included": items[:2],
+                              "links": {"self": "/foo"}})
+
     @data(True, False)
     def test_load_json(self, debug):
         json_str = '{"name": "file", "size": 1024}'
@@ -54,6 +137,28 @@ class UtilitiesTestCase(unittest.TestCase):
             result = load_json(json_str)
             self.assertDictEqual(dict1, result)
 
+    def test_etag(self):
+        etag = make_etag("person", 3, None)
+        self.assertRegex(etag, r'^W/"[0-9a-f]{40}"$')
+        self.assertEqual(etag, make_etag("person", 3, None))
+        self.assertNotEqual(etag, make_etag("person", 4, None))
+        self.assertTrue(etag_matches(etag, etag))
+        self.assertTrue(etag_matches('"x", ' + etag[2:], etag))
+        self.assertTrue(etag_matches("*", etag))
+        self.assertFalse(etag_matches('W/"x"', etag))
+
+    def test_http_date(self):
+        value = datetime.datetime(2020, 1, 2, 3, 4, 5, 678)
+        self.assertEqual(http_date(value), "Thu, 02 Jan 2020 03:04:05 GMT")
+        self.assertEqual(
+            http_date(value.replace(tzinfo=datetime.timezone(
+                datetime.timedelta(hours=1)))),
+            "Thu, 02 Jan 2020 02:04:05 GMT")
+        self.assertEqual(parse_http_date("Thu, 02 Jan 2020 03:04:05 GMT"),
+                         value.replace(microsecond=0,
+                                       tzinfo=datetime.timezone.utc))
+        self.assertIsNone(parse_http_date("yesterday"))
+
     def test_link_for_collection(self):
         self.assertEqual(link_for_collection("/nar1/nar2", "nar3"),
                          "/nar1/nar2/nar3")
@@ -114,6 +219,36 @@ class UtilitiesTestCase(unittest.TestCase):
                               (sparse_fields_to_return,
                                sparse_fields_for_query))
 
+    def test_get_sparse_fields_by_type(self):
+        args = werkzeug.MultiDict([('fields[foo]', 'col1'),
+                                   ('fields[bar]', 'col2')])
+        args = args.items(multi=True)
+        resource = unittest.mock.MagicMock(_rels_by_japi_name={})
+        self.assertEqual(get_sparse_fields(args, resource, "foo"),
+                         (["col1"], ["col1"]))
+
+    def test_get_include_paths(self):
+        company = unittest.mock.MagicMock(_rels_by_japi_name={})
+        person = unittest.mock.MagicMock()
+        person._rels_by_japi_name = {
+            "company": unittest.mock.MagicMock(
+                related_resource_class=company)}
+        article = unittest.mock.MagicMock()
+        article._rels_by_japi_name = {
+            "author": unittest.mock.MagicMock(related_resource_class=person),
+            "editor": unittest.mock.MagicMock(related_resource_class=person)}
+        args = werkzeug.MultiDict(
+            [('include', 'author,author.company,editor.company')])
+        self.assertDictEqual(get_include_paths(args, article), {
+            "author": {"company": {}},
+            "editor": {"company": {}}
+        })
+        self.assertDictEqual(get_include_paths(werkzeug.MultiDict(), article),
+                             {})
+        with self.assertRaises(UnresolvableIncludePath):
+            get_include_paths(
+                werkzeug.MultiDict([('include', 'author.bogus')]), article)
+
     @data
     def test_get_order_by_fields_empty(self):
         args = werkzeug.MultiDict([('sort', '')])
@@ -157,32 +292,22 @@ class UtilitiesTestCase(unittest.TestCase):
         self.assertDictEqual(get_order_by_fields(args, self.resource),
                              order_by)
 
-    @data
     def test_get_filter_empty(self):
-        args = werkzeug.MultiDict([('filter[col]', '')])
-        args = args.items(multi=True)
-        filter = [{"field": "col", "op": "==", "value": ""}]
-        self.assertDictEqual(get_filter(args, self.resource), filter)
-
-    @data
-    def test_get_filter_equal(self):
-        args = werkzeug.MultiDict([('filter[col]', 'search_value')])
-        args = args.items(multi=True)
-        filter = [{"field": "col", "op": "==", "value": "search_value"}]
-        self.assertDictEqual(get_filter(args, self.resource), filter)
+        args = werkzeug.MultiDict([('filter[name]', '')])
+        self.assertIsNone(get_filter(args, Person))
 
-    @data
-    def test_get_filter_like(self):
-        args = werkzeug.MultiDict([('filter[col]', '%search_value%')])
-        args = args.items(multi=True)
-        filter = [{"field": "col", "op": "like", "value": "%search_value%"}]
-        self.assertDictEqual(get_filter(args, self.resource), filter)
+    def test_get_filter(self):
+        args = werkzeug.MultiDict([('filter[name]', 'foo,%abc%'),
+                                   ('filter[company]', '1'),
+                                   ('filter[age]', '30')])
+        self.assertEqual(get_filter(args, Person), Filter([
+            ("name", None, ("foo", "%abc%")), ("company_id", None, ("1",)),
+            ("age_years", None, ("30",))]))
 
-    @data
-    def test_get_filter_multi(self):
-        args = werkzeug.MultiDict([('filter[col1]', '%search_value1%'),
-                                   ('filter[col2]', 'search_value2')])
-        args = args.items(multi=True)
-        filter = [{"field": "col1", "op": "like", "value": "%search_value1%"},
-                  {"field": "col2", "op": "==", "value": "search_value2"}]
-        self.assertDictEqual(get_filter(args, self.resource), filter)
+    def test_get_filter_unsupported(self):
+        for name in ("bogus", "shout"):
+            args = werkzeug.MultiDict([('filter[{}]'.format(name), 'a')])
+            with self.assertRaises(UnsupportedFilter) as cm:
+                get_filter(args, Person)
+            self.assertEqual(cm.exception.source_parameter,
+                             "filter[{}]".format(name))
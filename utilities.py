@@ -43,8 +43,10 @@ This module contains some helpers, which are frequently needed in different
 modules and situations.
 """
 
-import json
-import re
+import collections.abc
+import datetime
+import email.utils
+import hashlib
 
 try:
     import bson
@@ -52,7 +54,12 @@ try:
 except ImportError:
     bson = None
 
-from jsonapi_framework.errors import BadRequest
+import jsonapi_framework.json_codec as json_codec
+from jsonapi_framework.errors import BadRequest, UnresolvableIncludePath
+from jsonapi_framework.filters import Filter
+# split_str_on_comma is imported for backwards compatibility
+from jsonapi_framework.query_spec import (QuerySpec,  # noqa: F401
+                                          split_str_on_comma)
 from jsonapi_framework.debug import DEBUG
 
 
@@ -60,28 +67,167 @@ def dump_json(obj):
     """
     Serializes the Python object *obj* to a JSON string.
 
-    The default implementation uses Python's :mod:`json` module with some
-    features from :mod:`bson` (if it is available).
+    See :func:`dump_json_bytes`; this is the same document decoded to a
+    ``str``.
+    """
+    return dump_json_bytes(obj).decode("utf-8")
+
+
+def dump_json_bytes(obj):
+    """
+    Serializes the Python object *obj* to UTF-8 encoded JSON bytes.
+
+    The default implementation uses the fastest JSON backend that is
+    installed (see :mod:`jsonapi_framework.json_codec`) with some features
+    from :mod:`bson` (if it is available).
 
     You *can* override this method.
     """
-    indent = 4 if DEBUG else None
     default = bson.json_util.default if bson else None
-    sort_keys = DEBUG
-    return json.dumps(obj, indent=indent, default=default, sort_keys=sort_keys)
+    return json_codec.JSON_CODEC.dumps(obj, default, DEBUG)
+
+
+def iter_json(obj, buffer_size=8192):
+    """
+    Serializes the dict *obj* like :func:`dump_json_bytes`, but yields the
+    JSON document in chunks of roughly *buffer_size* bytes.
+
+    Top-level values that are iterators (e.g. generators) are written as JSON
+    arrays one element at a time while they are consumed, so such an array
+    never has to be held in memory as a whole.
+    """
+    pieces = [b"{"]
+    size = 0
+    for i, (key, value) in enumerate(obj.items()):
+        separator = b", " if i else b""
+        if isinstance(value, collections.abc.Iterator):
+            pieces.append(separator + dump_json_bytes(key) + b": [")
+            for j, item in enumerate(value):
+                piece = (b", " if j else b"") + dump_json_bytes(item)
+                pieces.append(piece)
+                size += len(piece)
+                if size >= buffer_size:
+                    yield b"".join(pieces)
+                    pieces = []
+                    size = 0
+            pieces.append(b"]")
+        else:
+            pieces.append(separator + dump_json_bytes(key) + b": " +
+                          dump_json_bytes(value))
+    pieces.append(b"}")
+    yield b"".join(pieces)
+
+
+async def _aiter(iterator):
+    if isinstance(iterator, collections.abc.AsyncIterator):
+        async for item in iterator:
+            yield item
+    else:
+        for item in iterator:
+            yield item
+
+
+async def aiter_json(obj, buffer_size=8192):
+    """
+    Like :func:`iter_json`, but top-level values may also be asynchronous
+    iterators (e.g. the resources of a
+    :func:`jsonapi_framework.sqlalchemy_async_dal.query_collection`), which
+    are consumed without blocking the event loop.
+    """
+    pieces = [b"{"]
+    size = 0
+    for i, (key, value) in enumerate(obj.items()):
+        separator = b", " if i else b""
+        if isinstance(value, (collections.abc.Iterator,
+                              collections.abc.AsyncIterator)):
+            pieces.append(separator + dump_json_bytes(key) + b": [")
+            j = 0
+            async for item in _aiter(value):
+                piece = (b", " if j else b"") + dump_json_bytes(item)
+                j += 1
+                pieces.append(piece)
+                size += len(piece)
+                if size >= buffer_size:
+                    yield b"".join(pieces)
+                    pieces = []
+                    size = 0
+            pieces.append(b"]")
+        else:
+            pieces.append(separator + dump_json_bytes(key) + b": " +
+                          dump_json_bytes(value))
+    pieces.append(b"}")
+    yield b"".join(pieces)
 
 
 def load_json(obj):
     """
-    Decodes the JSON string *obj* and returns a corresponding Python object.
+    Decodes the JSON string or bytes *obj* and returns a corresponding
+    Python object.
 
-    The default implementation uses Python's :mod:`json` module with some
-    features from :mod:`bson` (if available).
+    The default implementation uses the fastest JSON backend that is
+    installed (see :mod:`jsonapi_framework.json_codec`) with some features
+    from :mod:`bson` (if available).
 
     You *can* override this method.
     """
-    default = bson.json_util.object_hook if bson else None
-    return json.loads(obj, object_hook=default)
+    object_hook = bson.json_util.object_hook if bson else None
+    return json_codec.JSON_CODEC.loads(obj, object_hook)
+
+
+def make_etag(*parts):
+    """
+    Makes a weak entity tag from the repr of *parts*.  It is weak because
+    equal documents may still be serialized byte for byte differently.
+
+    :returns str: The quoted ETag
+    """
+    digest = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+    return 'W/"{}"'.format(digest)
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Compares the value of an If-None-Match header with *etag*, using the
+    weak comparison RFC 7232 prescribes for If-None-Match.
+
+    :returns bool:
+    """
+    def opaque(tag):
+        tag = tag.strip()
+        return tag[2:] if tag.startswith("W/") else tag
+
+    tags = [opaque(tag) for tag in if_none_match.split(",")]
+    return "*" in tags or opaque(etag) in tags
+
+
+def http_date(value):
+    """
+    Formats the datetime *value* for headers like Last-Modified.  Naive
+    datetimes are taken to be in UTC.
+
+    :returns str:
+    """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return email.utils.format_datetime(
+        value.astimezone(datetime.timezone.utc), usegmt=True)
+
+
+def parse_http_date(value):
+    """
+    Parses a date header like If-Modified-Since.
+
+    :returns datetime: An aware datetime, or None if *value* is invalid
+    """
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if parsed is None:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed
 
 
 def link_for_collection(link_prefix, japi_resource_url_component):
@@ -108,117 +254,109 @@ def link_for_pagination(link_prefix, japi_resource_url_component, query):
     return "{}/{}?{}".format(link_prefix, japi_resource_url_component, query)
 
 
-def get_sparse_fields(args, resource_class):
+def query_spec_of(args):
+    """
+    :param args: A QuerySpec, or the request parameters to parse into one
+                 (a werkzeug MultiDict, a dict or (key, value) pairs)
+
+    :returns QuerySpec:
+    """
+    if isinstance(args, QuerySpec):
+        return args
+    if hasattr(args, "items"):
+        return QuerySpec.from_args(args)
+    return QuerySpec.from_pairs(args)
+
+
+def get_sparse_fields(args, resource_class, japi_resource_type=None):
     """
     This method will get the sparse fields set from args.
-    :param args: from request parameters
+    :param args: the QuerySpec or the request parameters
     :param resource_class: resource class
+    :param japi_resource_type: if given, only the "fields[...]" parameters
+    of this type are used, otherwise all of them
     :return: sparse_fields_to_return is normal sparse fields set,
     sparse_fields_for_query is for database query
     """
-    sparse_fields_to_return = None
-    sparse_fields_for_query = None
-    fields_re = re.compile(r"fields\[([A-z0-9_]+)\]")
-    for key, value in args:
-        match = re.fullmatch(fields_re, key)
-        if match:
-            sparse_fields_to_return = ([] if sparse_fields_to_return is None
-                                       else sparse_fields_to_return)
-            sparse_fields_for_query = ([] if sparse_fields_for_query is None
-                                       else sparse_fields_for_query)
-            columns = split_str_on_comma(value)
-            for val in columns:
-                val = val.strip()
-                if val:
-                    if val in resource_class._rels_by_japi_name:
-                        sparse_fields_for_query.append(
-                            getattr(resource_class, val).mapped_fk_name)
-                    else:
-                        sparse_fields_for_query.append(val)
-                    sparse_fields_to_return.append(val)
+    fields = query_spec_of(args).fields
+    if japi_resource_type is None:
+        if not fields:
+            return None, None
+        names = [name for type_names in fields.values()
+                 for name in type_names]
+    elif japi_resource_type in fields:
+        names = fields[japi_resource_type]
+    else:
+        return None, None
+    sparse_fields_to_return = []
+    sparse_fields_for_query = []
+    for name in names:
+        if name in resource_class._rels_by_japi_name:
+            sparse_fields_for_query.append(
+                getattr(resource_class, name).mapped_fk_name)
+        else:
+            sparse_fields_for_query.append(name)
+        sparse_fields_to_return.append(name)
     return sparse_fields_to_return, sparse_fields_for_query
 
 
+def get_include_paths(args, resource_class):
+    """
+    This method will get the relationship paths to include from args.
+    :param args: the QuerySpec or the request parameters
+    :param resource_class: resource class
+    :return: a tree of the relationships to include, as nested dictionaries
+    example:
+    "include=author,author.company,comments" will be
+    {"author": {"company": {}}, "comments": {}}
+    :raises UnresolvableIncludePath: if a relationship does not exist
+    """
+    include_tree = {}
+    for path in query_spec_of(args).include:
+        subtree = include_tree
+        current_class = resource_class
+        for name in path.split("."):
+            if name not in current_class._rels_by_japi_name:
+                raise UnresolvableIncludePath(path)
+            current_class = current_class._rels_by_japi_name[
+                name].related_resource_class
+            subtree = subtree.setdefault(name, {})
+    return include_tree
+
+
 def get_order_by_fields(args, resource_class):
     """
     This method will get the fields that ordered by through args.
-    :param args: from request parameters
+    :param args: the QuerySpec or the request parameters
     :param resource_class: resource class
     :return: a list of fields
     """
-    sort_value = args.get('sort')
-    order_by = split_str_on_comma(sort_value) if sort_value else []
-    for index, value in enumerate(order_by):
-        if value not in resource_class._rels_by_japi_name:
-            if value[0] == '-':
-                field_name = value[1:]
-                if field_name in resource_class._rels_by_japi_name:
-                    value = value.replace(field_name, getattr(
-                        resource_class, field_name).mapped_fk_name)
-                    order_by[index] = value
-        else:
+    order_by = []
+    relationships = resource_class._rels_by_japi_name
+    for value in query_spec_of(args).sort:
+        if value in relationships:
             value = getattr(resource_class, value).mapped_fk_name
-            order_by[index] = value
+        elif value.startswith("-") and value[1:] in relationships:
+            value = "-" + getattr(resource_class, value[1:]).mapped_fk_name
+        order_by.append(value)
     return order_by
 
 
 def get_filter(args, resource_class):
     """
-    This method will return the fields filtered by.
-    :param args: from request parameters
+    This method will return the fields filtered by, resolved to the model
+    attributes, see :class:`jsonapi_framework.filters.Filter`.
+    :param args: the QuerySpec or the request parameters
     :param resource_class: resource class
-    :return: a dictionary that contains filter
+    :return: the Filter, or None if there are no filter parameters
+    :raises UnsupportedFilter: if a field is not a column of the model
     example:
-    filters = [
-        {
-            'and': [
-                {
-                    'or': [
-                        {'field': 'name', 'op': '==', 'value': 'foo'},
-                        {'field': 'name', 'op': 'like', 'value': '%abc'},
-                    ]
-                },
-                {
-                    'or': [
-                        {'field': 'id', 'op': '==', 'value': 1}
-                    ]
-                }
-            ]
-        }
-    ]
+    "filter[name]=foo,%abc&filter[company]=1&filter[age][gte]=18" will be
+    Filter([("name", None, ("foo", "%abc")),
+            ("company_id", None, ("1",)),
+            ("age", "gte", (18,))])
     """
-    filters = None
-    filter_re = re.compile(r"filter\[([A-z0-9_]+)\]")
-    for key, value in args:
-        match = re.fullmatch(filter_re, key)
-        if match:
-            key = key[key.find('[') + 1: key.find(']')]
-            if key in resource_class._rels_by_japi_name:
-                key = getattr(resource_class, key).mapped_fk_name
-            columns = split_str_on_comma(value)
-            if not columns:
-                continue
-            or_filter = []
-            or_dic = {}
-            or_dic['or'] = or_filter
-            if filters is None:
-                and_filter = []
-                and_filter.append(or_dic)
-                filters = []
-                filters.append({'and': and_filter})
-            else:
-                filters[0]['and'].append(or_dic)
-            for item in columns:
-                dic = {}
-                match_like = re.search('%', item)
-                if match_like:
-                    dic['op'] = 'like'
-                else:
-                    dic['op'] = '=='
-                dic['field'] = key
-                dic['value'] = item
-                or_filter.append(dic)
-    return filters
+    return Filter.parse(query_spec_of(args).filters, resource_class)
 
 
 def check_number(number, name):
@@ -243,54 +381,3 @@ def check_number(number, name):
                 source_parameter="%s" % name
             )
     return number
-
-
-def split_str_on_comma(str):
-    """
-    This function will split str using comma except
-    there is a '\' before it. Meanwhile, '\' if used as
-    escaped symbol will be removed.
-    example:
-    Raw string "hello,world\,hello\\,again\\\,world" will be
-    ["hello", "world,hello\", "again\,world"].
-    In python format, the str will actually be
-    'hello,world\\,hello\\\\,again\\\\\\,world',
-    and the list will actually be
-    ['hello', 'world,hello\\', 'again\\,world'].
-    :param str: input str to parse
-    :return: the result list
-    """
-    length_str = len(str)
-    # To check if the current character is escaped.
-    is_escaped = False
-    result = []
-    sub_str = ""
-    for i in range(length_str):
-        # If this comma is not escaped,
-        # separate with this comma.
-        if str[i] == "," and not is_escaped:
-            # Check if it is an empty string.
-            if sub_str:
-                result.append(sub_str)
-            sub_str = ""
-        # If this current character is escaped,
-        # it will have no use, and since it is added
-        # to sub_str when it is considered as escaped,
-        # just continue.
-        elif is_escaped:
-            is_escaped = False
-            continue
-        else:
-            # If current is escape symbol, and itself is
-            # not escaped, put the is_escaped flag to True,
-            # and remove this symbol by jumping to next
-            # character.
-            if str[i] == "\\":
-                is_escaped = True
-                # Check the string boundary.
-                if i < length_str - 1:
-                    i = i + 1
-            sub_str = sub_str + str[i]
-    if sub_str:
-        result.append(sub_str)
-    return result